@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import SignupCode
+from .models import SignupCode, ProfileIdentifier
 
 @admin.register(SignupCode)
 class SignupCodeAdmin(admin.ModelAdmin):
@@ -7,3 +7,10 @@ class SignupCodeAdmin(admin.ModelAdmin):
     search_fields = ('role', 'code')
 
 
+
+
+@admin.register(ProfileIdentifier)
+class ProfileIdentifierAdmin(admin.ModelAdmin):
+    list_display = ('value', 'prefix', 'year', 'claimed_at')
+    list_filter = ('prefix', 'year')
+    search_fields = ('value',)
@@ -0,0 +1,106 @@
+"""
+Profile identifiers (PAT-, DOC-, STF-, PHR-YYYY-XXXXXX) from a pre-generated pool.
+
+refill_profile_ids (a run_scheduler job) keeps POOL_SIZE unclaimed, unique
+codes per prefix for the current year. Creating a profile claims one with a
+conditional UPDATE; inside a signup transaction that rolls back, the code
+goes back to the pool. If the pool is empty (new year, refill not
+run yet) a code is generated on the spot, as before.
+"""
+import random
+import string
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import ProfileIdentifier
+
+# prefix -> (model, ID field)
+PREFIXES = {
+    'PAT': ('patients.PatientProfile', 'patient_id'),
+    'DOC': ('doctors.DoctorProfile', 'doctor_id'),
+    'STF': ('staff.StaffProfile', 'staff_id'),
+    'PHR': ('pharmacy.PharmacyProfile', 'pharmacy_id'),
+}
+
+CODE_LENGTH = 6
+# No O/0 or I/1, they are misread on printed cards
+CODE_CHARS = ''.join(c for c in string.ascii_uppercase + string.digits if c not in 'O0I1')
+
+# Unclaimed rows looked at per claim attempt; picking one at random keeps
+# concurrent signups from all racing for the same row
+CLAIM_WINDOW = 20
+CLAIM_ATTEMPTS = 5
+
+
+def pool_size():
+    return getattr(settings, 'PROFILE_ID_POOL_SIZE', 500)
+
+
+def random_code():
+    return ''.join(random.choice(CODE_CHARS) for _ in range(CODE_LENGTH))
+
+
+def format_identifier(prefix, year, code):
+    return f"{prefix}-{year}-{code}"
+
+
+def _taken_by_profiles(prefix, values):
+    """Values among `values` already used by profiles created before the pool."""
+    model_label, field = PREFIXES[prefix]
+    model = apps.get_model(model_label)
+    return set(model.objects.filter(**{f"{field}__in": values}).values_list(field, flat=True))
+
+
+def refill_pool(prefix, year=None, size=None):
+    """Top the pool up to `size` unclaimed codes. Returns how many were added."""
+    year = year or timezone.now().year
+    size = size or pool_size()
+
+    pool = ProfileIdentifier.objects.filter(prefix=prefix, year=year, claimed_at__isnull=True)
+    initial = free = pool.count()
+    while free < size:
+        candidates = {format_identifier(prefix, year, random_code()) for _ in range(size - free)}
+        candidates -= set(ProfileIdentifier.objects.filter(value__in=candidates).values_list('value', flat=True))
+        candidates -= _taken_by_profiles(prefix, candidates)
+
+        # Another refill may insert the same code meanwhile, so count again
+        ProfileIdentifier.objects.bulk_create(
+            [ProfileIdentifier(prefix=prefix, year=year, value=value) for value in candidates],
+            ignore_conflicts=True,
+        )
+        free = pool.count()
+    return max(free - initial, 0)
+
+
+def claim_identifier(prefix):
+    """Claim an unused identifier for a new profile."""
+    year = timezone.now().year
+    free = ProfileIdentifier.objects.filter(prefix=prefix, year=year, claimed_at__isnull=True)
+
+    for attempt in range(CLAIM_ATTEMPTS):
+        candidates = list(free.values_list('id', 'value')[:CLAIM_WINDOW])
+        if not candidates:
+            break
+        pk, value = random.choice(candidates)
+        if ProfileIdentifier.objects.filter(pk=pk, claimed_at__isnull=True).update(claimed_at=timezone.now()):
+            return value
+
+    return _generate_identifier(prefix, year)
+
+
+def _generate_identifier(prefix, year):
+    for attempt in range(10):
+        value = format_identifier(prefix, year, random_code())
+        if _taken_by_profiles(prefix, [value]):
+            continue
+        try:
+            with transaction.atomic():
+                ProfileIdentifier.objects.create(prefix=prefix, year=year, value=value, claimed_at=timezone.now())
+            return value
+        except IntegrityError:
+            continue
+
+    raise IntegrityError(f"Failed to generate a unique {prefix} identifier after 10 attempts")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from accounts.identifiers import PREFIXES, pool_size, refill_pool
+
+
+class Command(BaseCommand):
+    help = 'Top up the pools of pre-generated patient/doctor/staff/pharmacy IDs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, help='Unclaimed IDs to keep per prefix (default PROFILE_ID_POOL_SIZE)')
+        parser.add_argument('--year', type=int, help='Year to fill (default current year)')
+
+    def handle(self, *args, **options):
+        size = options['size'] or pool_size()
+        for prefix in PREFIXES:
+            added = refill_pool(prefix, year=options['year'], size=size)
+            self.stdout.write(self.style.SUCCESS(f" {prefix}: added {added} ID(s)"))
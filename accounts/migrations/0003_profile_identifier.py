@@ -0,0 +1,26 @@
+# Generated by Django 6.0 on 2026-10-18 05:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_remove_patientprofile_user_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileIdentifier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=3)),
+                ('year', models.PositiveIntegerField()),
+                ('value', models.CharField(max_length=20, unique=True)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['prefix', 'year', 'claimed_at'], name='profileid_pool_idx')],
+            },
+        ),
+    ]
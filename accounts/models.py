@@ -13,3 +13,20 @@ class SignupCode(models.Model):
 
     def __str__(self):
         return f"{self.role} - {self.code}"
+
+
+class ProfileIdentifier(models.Model):
+    """A pre-generated profile ID (PAT-2026-7KQ2MX ...). See accounts.identifiers"""
+    prefix = models.CharField(max_length=3)
+    year = models.PositiveIntegerField()
+    value = models.CharField(max_length=20, unique=True)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Unclaimed codes of a prefix and year
+            models.Index(fields=['prefix', 'year', 'claimed_at'], name='profileid_pool_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.value} ({'claimed' if self.claimed_at else 'free'})"
@@ -0,0 +1,149 @@
+"""
+Slot availability engine.
+
+Answers "which consultation slots are free for doctors D1..Dn on dates
+[a, b]" with one DoctorSchedule query and one Appointment query, however
+many doctors or days are asked for. Each (doctor, day) is kept as an int
+bitmap over the minutes of the day - bit n set means a slot starts n
+minutes after midnight - so merging schedules and removing bookings are
+plain bitwise operations. Live slot holds taken by other patients count
+as occupied.
+"""
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import Appointment, DoctorSchedule, SlotHold
+
+
+SLOT_MINUTES = 15
+
+# Appointment statuses that occupy a slot
+ACTIVE_STATUSES = ('pending', 'confirmed')
+
+# date.weekday() -> DoctorSchedule.day_of_week
+DAY_NAMES = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+
+
+def _format_minute(minute):
+    hour, minute = divmod(minute, 60)
+    ampm = 'AM' if hour < 12 else 'PM'
+    return f"{hour % 12 or 12}:{minute:02d} {ampm}"
+
+
+# "9:00 AM" style label for every minute of the day, built once
+SLOT_LABELS = tuple(_format_minute(m) for m in range(24 * 60))
+
+
+def minute_of_day(value):
+    return value.hour * 60 + value.minute
+
+
+def slot_label(value):
+    """Format a time the same way free slots are labelled (e.g. '9:15 AM')."""
+    return SLOT_LABELS[minute_of_day(value)]
+
+
+def next_days(start, count=7):
+    """The `count` calendar days following `start`."""
+    return [start + timedelta(days=i) for i in range(1, count + 1)]
+
+
+def _schedule_mask(start_time, end_time):
+    mask = 0
+    minute = minute_of_day(start_time)
+    end = minute_of_day(end_time)
+    while minute < end:
+        mask |= 1 << minute
+        minute += SLOT_MINUTES
+    return mask
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def _iter_minutes(mask):
+    """Yield the set bit positions of `mask` in ascending order."""
+    while mask:
+        lowest = mask & -mask
+        yield lowest.bit_length() - 1
+        mask ^= lowest
+
+
+class DoctorAvailability:
+    """Free consultation slots for a set of doctors over a set of dates."""
+
+    def __init__(self, doctor_ids, dates, patient=None):
+        self.doctor_ids = list(doctor_ids)
+        self.dates = sorted(set(dates))
+
+        self._schedule_masks = {}   # (doctor_id, day_of_week) -> mask
+        self._booked_masks = {}     # (doctor_id, date) -> mask
+
+        if not self.doctor_ids or not self.dates:
+            return
+
+        day_names = {DAY_NAMES[d.weekday()] for d in self.dates}
+        schedules = DoctorSchedule.objects.filter(
+            doctor_id__in=self.doctor_ids,
+            day_of_week__in=day_names,
+            is_active=True,
+            slot_type='consultation'
+        ).values_list('doctor_id', 'day_of_week', 'start_time', 'end_time')
+
+        for doctor_id, day_name, start_time, end_time in schedules:
+            key = (doctor_id, day_name)
+            self._schedule_masks[key] = self._schedule_masks.get(key, 0) | _schedule_mask(start_time, end_time)
+
+        bookings = Appointment.objects.filter(
+            doctor_id__in=self.doctor_ids,
+            appointment_date__in=self.dates,
+            status__in=ACTIVE_STATUSES
+        ).values_list('doctor_id', 'appointment_date', 'appointment_time')
+
+        for doctor_id, appointment_date, appointment_time in bookings:
+            key = (doctor_id, appointment_date)
+            self._booked_masks[key] = self._booked_masks.get(key, 0) | (1 << minute_of_day(appointment_time))
+
+        # The requesting patient's own hold stays selectable
+        holds = SlotHold.objects.filter(
+            doctor_id__in=self.doctor_ids,
+            scheduled_at__gte=_start_of_day(self.dates[0]),
+            scheduled_at__lt=_start_of_day(self.dates[-1] + timedelta(days=1)),
+            expires_at__gt=timezone.now()
+        )
+        if patient is not None:
+            holds = holds.exclude(patient=patient)
+
+        for doctor_id, scheduled_at in holds.values_list('doctor_id', 'scheduled_at'):
+            local = timezone.localtime(scheduled_at)
+            key = (doctor_id, local.date())
+            self._booked_masks[key] = self._booked_masks.get(key, 0) | (1 << minute_of_day(local))
+
+    def works_on(self, doctor_id, day):
+        """True if the doctor has an active consultation schedule on `day`."""
+        return (doctor_id, DAY_NAMES[day.weekday()]) in self._schedule_masks
+
+    def has_schedule(self, doctor_id):
+        """True if the doctor works on any of the loaded dates."""
+        return any(key[0] == doctor_id for key in self._schedule_masks)
+
+    def free_mask(self, doctor_id, day):
+        schedule = self._schedule_masks.get((doctor_id, DAY_NAMES[day.weekday()]), 0)
+        return schedule & ~self._booked_masks.get((doctor_id, day), 0)
+
+    def free_slots(self, doctor_id, day):
+        """Free slot labels for the doctor on `day`, earliest first."""
+        return [SLOT_LABELS[m] for m in _iter_minutes(self.free_mask(doctor_id, day))]
+
+    def is_free(self, doctor_id, day, slot_time):
+        return bool(self.free_mask(doctor_id, day) >> minute_of_day(slot_time) & 1)
+
+    def first_free_slot(self, doctor_id, dates=None):
+        """(date, minute_of_day) of the doctor's earliest free slot, or None."""
+        for day in (dates if dates is not None else self.dates):
+            mask = self.free_mask(doctor_id, day)
+            if mask:
+                return day, (mask & -mask).bit_length() - 1
+        return None
@@ -0,0 +1,122 @@
+"""
+Race-free slot booking.
+
+The database guarantees at most one pending/confirmed appointment per
+(doctor, scheduled_at) via the unique_active_doctor_slot constraint; this
+module turns constraint violations into SlotUnavailable and manages the
+short-lived SlotHold a patient can take while filling in the booking form.
+"""
+from datetime import datetime, timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Appointment, SlotHold
+
+
+HOLD_DURATION = timedelta(minutes=5)
+
+TIME_FORMATS = ('%H:%M', '%H:%M:%S', '%I:%M %p')
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def parse_slot_time(value):
+    """Parse '14:30', '14:30:00' or '2:30 PM' into a time."""
+    if not isinstance(value, str):
+        return value
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).time()
+        except ValueError:
+            continue
+    raise ValueError("Invalid time format")
+
+
+def parse_slot_date(value):
+    if not isinstance(value, str):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def slot_datetime(slot_date, slot_time):
+    return timezone.make_aware(datetime.combine(slot_date, slot_time), timezone.get_current_timezone())
+
+
+def _check_not_held_by_others(doctor_id, scheduled_at, patient):
+    held = SlotHold.objects.filter(
+        doctor_id=doctor_id,
+        scheduled_at=scheduled_at,
+        expires_at__gt=timezone.now()
+    ).exclude(patient=patient).exists()
+
+    if held:
+        raise SlotUnavailable("This time slot is being booked by another patient. Please choose another time.")
+
+
+def hold_slot(doctor, patient, scheduled_at):
+    """
+    Reserve a slot for HOLD_DURATION. Taking a hold again on the same slot
+    extends it. Raises SlotUnavailable if the slot is booked or held.
+    """
+    now = timezone.now()
+    expires_at = now + HOLD_DURATION
+
+    try:
+        with transaction.atomic():
+            # Expired holds never block anyone
+            SlotHold.objects.filter(doctor=doctor, scheduled_at=scheduled_at, expires_at__lte=now).delete()
+
+            booked = Appointment.objects.filter(
+                doctor=doctor,
+                scheduled_at=scheduled_at,
+                status__in=['pending', 'confirmed']
+            ).exists()
+            if booked:
+                raise SlotUnavailable("This time slot is already booked. Please choose another time.")
+
+            # A patient holds one slot at a time
+            SlotHold.objects.filter(patient=patient).exclude(doctor=doctor, scheduled_at=scheduled_at).delete()
+
+            refreshed = SlotHold.objects.filter(
+                doctor=doctor, scheduled_at=scheduled_at, patient=patient
+            ).update(expires_at=expires_at)
+            if refreshed:
+                return SlotHold.objects.get(doctor=doctor, scheduled_at=scheduled_at)
+
+            return SlotHold.objects.create(
+                doctor=doctor,
+                patient=patient,
+                scheduled_at=scheduled_at,
+                expires_at=expires_at
+            )
+    except IntegrityError:
+        raise SlotUnavailable("This time slot is being booked by another patient. Please choose another time.")
+
+
+def save_into_slot(appointment, patient):
+    """
+    Save `appointment` into its (doctor, date, time) slot atomically.
+    Raises SlotUnavailable if another active appointment or another
+    patient's hold already owns the slot. The patient's own hold on the
+    slot is consumed.
+    """
+    scheduled_at = appointment.sync_scheduled_at()
+
+    try:
+        with transaction.atomic():
+            _check_not_held_by_others(appointment.doctor_id, scheduled_at, patient)
+            appointment.save()
+            SlotHold.objects.filter(patient=patient).delete()
+    except IntegrityError:
+        raise SlotUnavailable("This time slot is already booked. Please choose another time.")
+
+    return appointment
+
+
+def expire_slot_holds(now=None):
+    """Delete expired holds. Returns the number removed."""
+    deleted, _ = SlotHold.objects.filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
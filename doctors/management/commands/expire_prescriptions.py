@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from doctors.models import Prescription
+
+
+class Command(BaseCommand):
+    help = 'Mark active prescriptions past their valid_until date as expired'
+
+    def handle(self, *args, **kwargs):
+        today = timezone.now().date()
+
+        expired_count = Prescription.objects.filter(
+            status='active',
+            valid_until__lt=today
+        ).update(status='expired', updated_at=timezone.now())
+
+        self.stdout.write(
+            self.style.SUCCESS(f" Expired {expired_count} prescription(s)")
+        )
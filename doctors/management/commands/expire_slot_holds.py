@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from doctors.booking import expire_slot_holds
+
+
+class Command(BaseCommand):
+    help = 'Delete slot holds that have expired'
+
+    def handle(self, *args, **kwargs):
+        deleted_count = expire_slot_holds()
+
+        self.stdout.write(
+            self.style.SUCCESS(f" Removed {deleted_count} expired slot hold(s)")
+        )
@@ -0,0 +1,107 @@
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from doctors.models import Appointment, Prescription, ConsultationHistory, SharedConsultation
+from notifications.models import Notification
+from pharmacy.models import PharmacyFulfillment
+from staff.models import LabReport
+
+
+# SQLite: "SCAN doctors_appointment" (a bare table scan; "SCAN x USING INDEX"
+# walks an index and is fine). PostgreSQL: "Seq Scan on doctors_appointment".
+SQLITE_FULL_SCAN = re.compile(r'\bSCAN (\w+)(?! USING (?:COVERING )?INDEX)(?:\s|$)')
+POSTGRES_FULL_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def view_queries():
+    """The hot queries behind the list/dashboard views, keyed by a short label."""
+    now = timezone.now()
+    today = now.date()
+
+    # EXPLAIN does not need matching rows, any id will do
+    doctor_id = patient_id = staff_id = 1
+
+    return [
+        ('patient appointments', Appointment.objects.filter(patient_id=patient_id, status='completed')),
+        ('patient upcoming appointments', Appointment.objects.filter(
+            patient_id=patient_id, status__in=['pending', 'confirmed'], scheduled_at__gte=now)),
+        ('doctor appointments for a day', Appointment.objects.filter(
+            doctor_id=doctor_id, appointment_date=today, status='completed')),
+        ('missed-appointment sweeper', Appointment.objects.filter(
+            status__in=['pending', 'confirmed'], scheduled_at__lte=now - timedelta(hours=3))),
+        ('appointment reminders window', Appointment.objects.filter(
+            status__in=['pending', 'confirmed'], reminder_sent=False,
+            scheduled_at__range=(now + timedelta(minutes=55), now + timedelta(minutes=65)))),
+        ('auto-cancel unscheduled', Appointment.objects.filter(
+            status='needs_rescheduling', updated_at__lt=now - timedelta(hours=24))),
+        ('patient prescriptions', Prescription.objects.filter(patient_id=patient_id, status='active')),
+        ('doctor prescriptions for a day', Prescription.objects.filter(doctor_id=doctor_id, prescribed_date=today)),
+        ('pharmacy prescription queue', Prescription.objects.filter(prescribed_date__gte=today - timedelta(days=30))),
+        ('patient lab reports', LabReport.objects.filter(patient_id=patient_id).order_by('-test_date')),
+        ('staff lab reports for a day', LabReport.objects.filter(uploaded_by_id=staff_id, test_date=today)),
+        ('doctor consultations for a day', ConsultationHistory.objects.filter(
+            doctor_id=doctor_id, consultation_date=today)),
+        ('unread shared consultations', SharedConsultation.objects.filter(shared_with_id=doctor_id, is_read=False)),
+        ('fulfillments by status', PharmacyFulfillment.objects.filter(status='on_hold')),
+        ('overview notification feed', Notification.objects.filter(
+            user_id=patient_id, created_at__gte=now - timedelta(hours=24))[:8]),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on the main view queries and flag any full table scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the full plan for every query')
+        parser.add_argument('--fail-on-scan', action='store_true', help='Exit with an error if any query scans a table')
+
+    def handle(self, *args, **options):
+        vendor = connection.vendor
+        if vendor == 'sqlite':
+            pattern = SQLITE_FULL_SCAN
+        elif vendor == 'postgresql':
+            pattern = POSTGRES_FULL_SCAN
+        else:
+            raise CommandError(f"EXPLAIN checks are only implemented for SQLite and PostgreSQL, not {vendor}")
+
+        self.stdout.write(f"Explaining view queries on {vendor}")
+        self.stdout.write("-" * 50)
+
+        flagged = []
+        for label, queryset in view_queries():
+            plan = self.explain(queryset, vendor)
+            scanned = pattern.findall(plan)
+
+            if scanned:
+                flagged.append(label)
+                self.stdout.write(self.style.ERROR(f" FULL SCAN  {label}: {', '.join(sorted(set(scanned)))}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f" OK         {label}"))
+
+            if options['verbose_plans'] or scanned:
+                for line in plan.splitlines():
+                    self.stdout.write(f"             {line}")
+
+        self.stdout.write("-" * 50)
+        if flagged:
+            message = f"{len(flagged)} of {len(view_queries())} queries fall back to a full table scan"
+            if options['fail_on_scan']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(f" {message}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(" Every query uses an index"))
+
+    def explain(self, queryset, vendor):
+        if vendor != 'postgresql':
+            return queryset.explain()
+
+        # On small tables the planner prefers a seq scan whatever indexes
+        # exist; disabling it shows whether a usable index is available
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
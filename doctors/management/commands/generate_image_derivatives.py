@@ -0,0 +1,28 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from mediconnect.images import ImageDerivativesMixin, generate_image_derivatives, needs_image_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnails and resized copies for images uploaded before derivatives existed'
+
+    def handle(self, *args, **kwargs):
+        for model in apps.get_models():
+            if not issubclass(model, ImageDerivativesMixin):
+                continue
+
+            generated = failed = 0
+            for instance in model._default_manager.iterator():
+                if not needs_image_derivatives(instance):
+                    continue
+                try:
+                    generate_image_derivatives(instance)
+                    generated += 1
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f" {model._meta.label} {instance.pk}: {e}"))
+
+            self.stdout.write(
+                self.style.SUCCESS(f" {model._meta.label}: {generated} generated, {failed} failed")
+            )
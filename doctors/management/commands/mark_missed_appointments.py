@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from doctors.models import Appointment
+from notifications.feed import notify_appointments_missed
+from datetime import timedelta
+
+
+# Appointments still pending/confirmed this long after their slot are missed
+MISSED_GRACE_PERIOD = timedelta(hours=3)
+
+
+def mark_missed_appointments(now=None):
+    """
+    Mark every pending/confirmed appointment that started more than
+    MISSED_GRACE_PERIOD ago as missed with a single UPDATE, and add a
+    missed-appointment notification to each patient's feed.
+
+    Returns (updated_count, watermark) where watermark is the aware cutoff
+    datetime - every open appointment at or before it is now marked.
+    """
+    now = now or timezone.now()
+    watermark = now - MISSED_GRACE_PERIOD
+
+    with transaction.atomic():
+        missed = list(
+            Appointment.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+                status__in=['pending', 'confirmed'],
+                scheduled_at__lte=watermark,
+            ).select_related('patient__user', 'doctor__user')
+        )
+        if not missed:
+            return 0, watermark
+
+        updated_count = Appointment.objects.filter(
+            id__in=[apt.id for apt in missed]
+        ).update(status='missed', updated_at=now)
+
+        notify_appointments_missed(missed)
+
+    return updated_count, watermark
+
+
+class Command(BaseCommand):
+    help = 'Mark pending/confirmed appointments as missed 3 hours after their slot'
+
+    def handle(self, *args, **kwargs):
+        updated_count, watermark = mark_missed_appointments()
+
+        self.stdout.write("-" * 50)
+        self.stdout.write(
+            self.style.SUCCESS(f" Marked {updated_count} appointment(s) as missed")
+        )
+        self.stdout.write(
+            f" Watermark: {timezone.localtime(watermark).strftime('%Y-%m-%d %I:%M %p')}"
+        )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from doctors.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the clinical search index from consultations, prescriptions and lab reports'
+
+    def handle(self, *args, **kwargs):
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f" Indexed {count} record(s)"))
@@ -0,0 +1,89 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from doctors.models import ScheduledJob
+from doctors.scheduler import (
+    LEASE_DURATION, acquire_lease, configured_jobs, lease_heartbeat, make_owner, release_lease, run_job,
+)
+
+
+class Command(BaseCommand):
+    help = 'Run the periodic jobs (reminders, expiry, missed appointments, outbox) in one long-lived process'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run every job once and exit')
+        parser.add_argument('--tick', type=int, default=5, help='Seconds between due-job checks')
+        parser.add_argument('--list', action='store_true', help='Show configured jobs and their metrics')
+
+    def handle(self, *args, **options):
+        jobs = configured_jobs()
+
+        if options['list']:
+            self.list_jobs(jobs)
+            return
+
+        owner = make_owner()
+        self.stdout.write(f"Scheduler {owner} starting with {len(jobs)} job(s)")
+        self.stdout.write("-" * 50)
+
+        next_run = {name: 0 for name in jobs}
+        holding = False
+
+        try:
+            while True:
+                close_old_connections()
+
+                if acquire_lease(owner):
+                    if not holding:
+                        self.stdout.write(self.style.SUCCESS(" Acquired scheduler lease"))
+                        holding = True
+
+                    for name, interval in jobs.items():
+                        if time.monotonic() < next_run[name]:
+                            continue
+                        with lease_heartbeat(owner) as lost:
+                            self.run(name)
+                        next_run[name] = time.monotonic() + interval
+                        # Another scheduler may be running jobs now; stop this tick
+                        if lost.is_set() or not acquire_lease(owner):
+                            self.stdout.write(self.style.WARNING(" Lost scheduler lease"))
+                            holding = False
+                            break
+
+                    if options['once']:
+                        break
+                else:
+                    if holding:
+                        self.stdout.write(self.style.WARNING(" Lost scheduler lease"))
+                        holding = False
+                    if options['once']:
+                        self.stdout.write(self.style.WARNING(" Another scheduler holds the lease, nothing run"))
+                        break
+
+                time.sleep(min(options['tick'], LEASE_DURATION.total_seconds() / 3))
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping scheduler")
+        finally:
+            release_lease(owner)
+
+    def run(self, name):
+        ok, output = run_job(name)
+        if ok:
+            self.stdout.write(self.style.SUCCESS(f" {name}: {output.strip() or 'done'}"))
+        else:
+            self.stdout.write(self.style.ERROR(f" {name} failed:\n{output}"))
+
+    def list_jobs(self, jobs):
+        metrics = {job.name: job for job in ScheduledJob.objects.filter(name__in=jobs)}
+
+        for name, interval in jobs.items():
+            job = metrics.get(name)
+            if job is None:
+                self.stdout.write(f" {name} every {interval}s - never run")
+                continue
+            self.stdout.write(
+                f" {name} every {interval}s - {job.run_count} run(s), {job.failure_count} failed, "
+                f"avg {job.average_duration_ms}ms, last {job.last_status} at {job.last_started_at}"
+            )
@@ -1,12 +1,25 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from django.core.mail import send_mail
+from django.db import transaction
+from notifications.outbox import outbox_email, queue_emails
 from django.template.loader import render_to_string
 from django.conf import settings
-from datetime import timedelta, datetime
+from datetime import timedelta
 from doctors.models import Appointment
 
 
+def due_for_reminder(start, end):
+    """
+    Open, not yet reminded appointments starting in [start, end]: a range
+    scan over appointment_reminder_due_idx.
+    """
+    return Appointment.objects.filter(
+        status__in=['pending', 'confirmed'],
+        reminder_sent=False,  # Don't send twice
+        scheduled_at__range=(start, end)
+    )
+
+
 class Command(BaseCommand):
     help = 'Send email reminders for appointments starting in 1 hour'
 
@@ -17,69 +30,65 @@ class Command(BaseCommand):
         reminder_start = now + timedelta(minutes=55)
         reminder_end   = now + timedelta(minutes=65)
 
-        # Get pending/confirmed appointments in that window
-        upcoming = Appointment.objects.filter(
-            status__in=['pending', 'confirmed'],
-            reminder_sent=False  # Don't send twice
-        ).select_related('patient__user', 'doctor__user')
+        with transaction.atomic():
+            # Rows another run is already handling are skipped on PostgreSQL
+            upcoming = due_for_reminder(reminder_start, reminder_end).select_related(
+                'patient__user', 'doctor__user'
+            ).select_for_update(skip_locked=True, of=('self',))
 
-        sent_count = 0
+            emails = []
+            reminded_ids = []
 
-        for apt in upcoming:
-            apt_datetime_naive = datetime.combine(apt.appointment_date, apt.appointment_time)
-            apt_datetime = timezone.make_aware(apt_datetime_naive, timezone.get_current_timezone())
-
-            if reminder_start <= apt_datetime <= reminder_end:
+            for apt in upcoming:
                 patient_email = apt.patient.user.email
 
                 if not patient_email:
                     self.stdout.write(f'No email for patient {apt.patient.patient_id}, skipping.')
                     continue
 
-                context = {
-                    'patient_name':     apt.patient.user.get_full_name() or apt.patient.user.username,
-                    'patient_id':       apt.patient.patient_id,
-                    'doctor_name':      f"Dr. {apt.doctor.user.get_full_name()}",
-                    'specialty':        apt.doctor.get_specialty_display(),
-                    'appointment_date': apt.appointment_date.strftime('%A, %B %d, %Y'),
-                    'appointment_time': apt.appointment_time.strftime('%I:%M %p'),
-                    'appointment_type': apt.get_appointment_type_display(),
-                    'location':         apt.doctor.room_location or 'Visit Reception at Ground Floor',
-                }
-
-                # Render HTML template
-                html_message = render_to_string(
-                    'registration/appointment_reminder_email.html',
-                    context
-                )
-
-                # Send email
+                # One bad row must not hold back everyone else's reminder
                 try:
-                    send_mail(
+                    context = {
+                        'patient_name':     apt.patient.user.get_full_name() or apt.patient.user.username,
+                        'patient_id':       apt.patient.patient_id,
+                        'doctor_name':      f"Dr. {apt.doctor.user.get_full_name()}",
+                        'specialty':        apt.doctor.get_specialty_display(),
+                        'appointment_date': apt.appointment_date.strftime('%A, %B %d, %Y'),
+                        'appointment_time': apt.appointment_time.strftime('%I:%M %p'),
+                        'appointment_type': apt.get_appointment_type_display(),
+                        'location':         apt.doctor.room_location or 'Visit Reception at Ground Floor',
+                    }
+
+                    # Render HTML template
+                    html_message = render_to_string(
+                        'registration/appointment_reminder_email.html',
+                        context
+                    )
+
+                    emails.append(outbox_email(
                         subject=f' Appointment Reminder - {context["appointment_time"]} Today | MediConnect',
                         message=f'Reminder: You have an appointment with {context["doctor_name"]} at {context["appointment_time"]} today.',
                         from_email=settings.DEFAULT_FROM_EMAIL,
                         recipient_list=[patient_email],
                         html_message=html_message,
-                        fail_silently=False,
-                    )
+                    ))
+                    reminded_ids.append(apt.id)
 
-                    # Mark reminder as sent so it doesn't send again
-                    apt.reminder_sent = True
-                    apt.save()
-
-                    sent_count += 1
                     self.stdout.write(
                         self.style.SUCCESS(
-                            f' Reminder sent to {patient_email} for appointment at {context["appointment_time"]}'
+                            f' Reminder queued for {patient_email} for appointment at {context["appointment_time"]}'
                         )
                     )
 
                 except Exception as e:
                     self.stdout.write(
-                        self.style.ERROR(f' Failed to send to {patient_email}: {e}')
+                        self.style.ERROR(f' Failed to queue reminder for appointment {apt.id}: {e}')
                     )
 
+            # One INSERT for the emails, one UPDATE so they don't send again
+            queue_emails(emails)
+            Appointment.objects.filter(id__in=reminded_ids).update(reminder_sent=True)
+
         self.stdout.write(
-            self.style.SUCCESS(f'\n Done! Sent {sent_count} reminder(s).')
-        )
\ No newline at end of file
+            self.style.SUCCESS(f'\n Done! Queued {len(reminded_ids)} reminder(s).')
+        )
@@ -2,7 +2,8 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
 from doctors.models import Appointment
-from django.core.mail import send_mail
+from django.db import transaction
+from notifications.outbox import queue_email
 from django.template.loader import render_to_string
 from django.conf import settings
 
@@ -58,22 +59,23 @@ class Command(BaseCommand):
                     'appointment_id': appointment.id,
                 })
                 
-                send_mail(
-                    subject,
-                    '', 
-                    settings.EMAIL_HOST_USER,
-                    [patient_email],
-                    html_message=html_message,  
-                    fail_silently=False,
-                )
-                
-                appointment.reminder_sent = True
-                appointment.save(update_fields=['reminder_sent'])
+                # Queue the email and flag the reminder in one transaction
+                with transaction.atomic():
+                    queue_email(
+                        subject,
+                        '', 
+                        settings.EMAIL_HOST_USER,
+                        [patient_email],
+                        html_message=html_message,  
+                    )
+                    
+                    appointment.reminder_sent = True
+                    appointment.save(update_fields=['reminder_sent'])
                 
                 sent_count += 1
                 self.stdout.write(
                     self.style.SUCCESS(
-                        f" Sent 12-hour reminder to {patient_name} ({patient_email})"
+                        f" Queued 12-hour reminder to {patient_name} ({patient_email})"
                     )
                 )
                 
@@ -86,5 +88,5 @@ class Command(BaseCommand):
         
         self.stdout.write("-" * 50)
         self.stdout.write(
-            self.style.SUCCESS(f" Successfully sent {sent_count} reminder email(s)")
+            self.style.SUCCESS(f" Successfully queued {sent_count} reminder email(s)")
         )
\ No newline at end of file
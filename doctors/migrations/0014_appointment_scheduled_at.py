@@ -0,0 +1,45 @@
+# Generated by Django 6.0 on 2026-10-18 04:39
+
+from datetime import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_scheduled_at(apps, schema_editor):
+    Appointment = apps.get_model('doctors', 'Appointment')
+    tz = timezone.get_default_timezone()
+
+    batch = []
+    for apt in Appointment.objects.only('id', 'appointment_date', 'appointment_time').iterator(chunk_size=1000):
+        apt.scheduled_at = timezone.make_aware(
+            datetime.combine(apt.appointment_date, apt.appointment_time), tz
+        )
+        batch.append(apt)
+        if len(batch) >= 1000:
+            Appointment.objects.bulk_update(batch, ['scheduled_at'])
+            batch = []
+
+    if batch:
+        Appointment.objects.bulk_update(batch, ['scheduled_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0013_alter_consultationhistory_appointment'),
+        ('patients', '0008_patientprofile_city_patientprofile_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='scheduled_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_scheduled_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'scheduled_at'], name='appointment_status_sched_idx'),
+        ),
+    ]
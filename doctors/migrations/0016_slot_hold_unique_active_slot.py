@@ -0,0 +1,58 @@
+# Generated by Django 6.0 on 2026-10-18 04:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def release_double_booked_slots(apps, schema_editor):
+    # Keep the earliest booking of any double-booked slot and send the rest
+    # back to the patient for rescheduling so the unique constraint can apply
+    Appointment = apps.get_model('doctors', 'Appointment')
+    active = Appointment.objects.filter(status__in=['pending', 'confirmed'])
+
+    duplicates = active.values('doctor_id', 'scheduled_at').annotate(n=Count('id')).filter(n__gt=1)
+    for slot in duplicates:
+        ids = list(active.filter(
+            doctor_id=slot['doctor_id'], scheduled_at=slot['scheduled_at']
+        ).order_by('created_at', 'id').values_list('id', flat=True))
+        Appointment.objects.filter(id__in=ids[1:]).update(status='needs_rescheduling')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0014_appointment_scheduled_at'),
+        ('patients', '0008_patientprofile_city_patientprofile_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotHold',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scheduled_at', models.DateTimeField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(release_double_booked_slots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='appointment',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'confirmed'])), fields=('doctor', 'scheduled_at'), name='unique_active_doctor_slot'),
+        ),
+        migrations.AddField(
+            model_name='slothold',
+            name='doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to='doctors.doctorprofile'),
+        ),
+        migrations.AddField(
+            model_name='slothold',
+            name='patient',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_holds', to='patients.patientprofile'),
+        ),
+        migrations.AddConstraint(
+            model_name='slothold',
+            constraint=models.UniqueConstraint(fields=('doctor', 'scheduled_at'), name='unique_slot_hold'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-18 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0016_slot_hold_unique_active_slot'),
+        ('patients', '0008_patientprofile_city_patientprofile_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'appointment_date', 'status'], name='appointment_doctor_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'status'], name='appointment_patient_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['status', 'updated_at'], name='appointment_status_upd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultationhistory',
+            index=models.Index(fields=['doctor', 'consultation_date'], name='consultation_doctor_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['prescribed_date'], name='prescription_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['doctor', 'prescribed_date'], name='prescription_doctor_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prescription',
+            index=models.Index(fields=['patient', 'status'], name='prescription_patient_stat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharedconsultation',
+            index=models.Index(fields=['shared_with', 'is_read'], name='shared_with_read_idx'),
+        ),
+    ]
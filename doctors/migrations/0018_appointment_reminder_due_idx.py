@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 04:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0017_access_pattern_indexes'),
+        ('patients', '0008_patientprofile_city_patientprofile_created_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('reminder_sent', False)), fields=['status', 'scheduled_at'], name='appointment_reminder_due_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 6.0 on 2026-10-18 05:10
+
+from django.db import migrations, models
+
+
+def seed_number_sequences(apps, schema_editor):
+    """Start every (prefix, year) after the highest number already issued."""
+    NumberSequence = apps.get_model('doctors', 'NumberSequence')
+    sources = [
+        (apps.get_model('doctors', 'Prescription'), 'prescription_number'),
+        (apps.get_model('doctors', 'ConsultationHistory'), 'consultation_number'),
+        (apps.get_model('staff', 'LabReport'), 'report_number'),
+    ]
+
+    last_values = {}
+    for model, field in sources:
+        for number in model.objects.values_list(field, flat=True).iterator(chunk_size=1000):
+            # PREFIX-YYYY-NNN; anything else cannot collide with new numbers
+            parts = (number or '').split('-')
+            if len(parts) != 3 or not parts[1].isdigit() or not parts[2].isdigit():
+                continue
+            key = (parts[0], int(parts[1]))
+            last_values[key] = max(last_values.get(key, 0), int(parts[2]))
+
+    NumberSequence.objects.bulk_create([
+        NumberSequence(prefix=prefix, year=year, last_value=last_value)
+        for (prefix, year), last_value in last_values.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0020_image_derivatives'),
+        ('staff', '0011_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=10)),
+                ('year', models.PositiveIntegerField()),
+                ('last_value', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('prefix', 'year'), name='numbersequence_prefix_year_uniq')],
+            },
+        ),
+        migrations.RunPython(seed_number_sequences, migrations.RunPython.noop),
+    ]
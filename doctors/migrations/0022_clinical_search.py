@@ -0,0 +1,153 @@
+# Generated by Django 6.0 on 2026-10-18 05:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+DOCUMENT_TABLE = 'doctors_clinicalsearchdocument'
+FTS_TABLE = 'doctors_clinical_fts'
+COLUMNS = 'record_number, heading, body'
+NEW_VALUES = 'new.record_number, new.heading, new.body'
+OLD_VALUES = 'old.record_number, old.heading, old.body'
+
+SQLITE_FORWARD = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({COLUMNS}, content='{DOCUMENT_TABLE}', "
+    f"content_rowid='id', tokenize='porter unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, {COLUMNS}) VALUES (new.id, {NEW_VALUES}); END",
+    f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNS}) VALUES ('delete', old.id, {OLD_VALUES}); END",
+    f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNS}) VALUES ('delete', old.id, {OLD_VALUES}); "
+    f"INSERT INTO {FTS_TABLE}(rowid, {COLUMNS}) VALUES (new.id, {NEW_VALUES}); END",
+]
+SQLITE_REVERSE = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# Same expression as doctors.search.PG_VECTOR
+POSTGRES_FORWARD = [
+    f"CREATE INDEX clinical_search_vector_idx ON {DOCUMENT_TABLE} USING gin (("
+    "setweight(to_tsvector('simple', record_number), 'A') || "
+    "setweight(to_tsvector('english', heading), 'A') || "
+    "setweight(to_tsvector('english', body), 'B')))",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS clinical_search_vector_idx",
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_search_backend(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD})
+
+
+def drop_search_backend(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE})
+
+
+# Frozen copies of the doctors.search document builders as of this
+# migration; later changes are backfilled by rebuild_clinical_search.
+def _join(*parts):
+    return '\n'.join(part.strip() for part in parts if part and part.strip())
+
+
+def consultation_document(consultation):
+    return {
+        'patient_id': consultation.patient_id,
+        'doctor_id': consultation.doctor_id,
+        'record_number': consultation.consultation_number,
+        'record_date': consultation.consultation_date,
+        'heading': consultation.diagnosis,
+        'body': _join(
+            consultation.chief_complaint, consultation.symptoms, consultation.examination_findings,
+            consultation.treatment_plan, consultation.notes,
+        ),
+    }
+
+
+def prescription_document(prescription):
+    return {
+        'patient_id': prescription.patient_id,
+        'doctor_id': prescription.doctor_id,
+        'record_number': prescription.prescription_number,
+        'record_date': prescription.prescribed_date,
+        'heading': prescription.diagnosis,
+        'body': _join(*[m.medicine_name for m in prescription.medicines.all()], prescription.notes),
+    }
+
+
+def lab_report_document(report):
+    sections = list(report.test_sections.all())
+    findings = []
+    for section in sections:
+        findings.append(section.findings)
+        findings.extend(parameter.name for parameter in section.parameters.all())
+    return {
+        'patient_id': report.patient_id,
+        'doctor_id': report.doctor_id,
+        'record_number': report.report_number,
+        'record_date': report.test_date,
+        'heading': ', '.join(s.custom_test_name or s.test_name_choice or '' for s in sections),
+        'body': _join(*findings, report.notes),
+    }
+
+
+# kind -> (model label, prefetch, document builder)
+RECORD_KINDS = {
+    'consultation': ('doctors.ConsultationHistory', (), consultation_document),
+    'prescription': ('doctors.Prescription', ('medicines',), prescription_document),
+    'lab_report': ('staff.LabReport', ('test_sections__parameters',), lab_report_document),
+}
+
+
+def index_existing_records(apps, schema_editor):
+    ClinicalSearchDocument = apps.get_model('doctors', 'ClinicalSearchDocument')
+    for kind, (label, prefetch, build) in RECORD_KINDS.items():
+        records = apps.get_model(label).objects.order_by('pk').prefetch_related(*prefetch)
+        batch = []
+        for record in records.iterator(chunk_size=1000):
+            batch.append(ClinicalSearchDocument(kind=kind, object_id=record.pk, **build(record)))
+            if len(batch) >= 1000:
+                ClinicalSearchDocument.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            ClinicalSearchDocument.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0021_number_sequence'),
+        ('patients', '0011_patient_search_index'),
+        ('staff', '0011_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClinicalSearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('consultation', 'Consultation'), ('prescription', 'Prescription'), ('lab_report', 'Lab Report')], max_length=20)),
+                ('object_id', models.PositiveIntegerField()),
+                ('record_number', models.CharField(max_length=50)),
+                ('record_date', models.DateField()),
+                ('heading', models.TextField()),
+                ('body', models.TextField(blank=True)),
+                ('doctor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='doctors.doctorprofile')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='patients.patientprofile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', 'kind'], name='clinicalsearch_patient_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='clinicalsearch_record_uniq')],
+            },
+        ),
+        migrations.RunPython(create_search_backend, drop_search_backend),
+        migrations.RunPython(index_existing_records, migrations.RunPython.noop),
+    ]
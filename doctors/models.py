@@ -1,14 +1,18 @@
-from django.db import models, transaction, IntegrityError
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils import timezone
-from django.core.mail import send_mail
 from django.template.loader import render_to_string
-from datetime import timedelta
-import random
-import string
+from datetime import timedelta, datetime
+from notifications.outbox import queue_email
+from accounts.identifiers import claim_identifier
+from mediconnect.images import ImageDerivativesMixin
 
 
-class DoctorProfile(models.Model):
+class DoctorProfile(ImageDerivativesMixin, models.Model):
+    IMAGE_DERIVATIVES = {
+        'profile_photo': {'thumb': 'profile_photo_thumb', 'medium': 'profile_photo_medium'},
+    }
+
     SPECIALTY_CHOICES = [
         ('cardiology', 'Cardiologist'),
         ('general', 'General Physician'),
@@ -40,6 +44,9 @@ class DoctorProfile(models.Model):
     is_active = models.BooleanField(default=True)
     
     profile_photo = models.ImageField(upload_to='doctor_photos/', null=True, blank=True)
+    # Resized copies written by mediconnect.images
+    profile_photo_thumb = models.ImageField(blank=True, null=True, editable=False)
+    profile_photo_medium = models.ImageField(blank=True, null=True, editable=False)
     sub_specialty = models.CharField(max_length=100, blank=True, null=True)
     room_location = models.CharField(max_length=200, blank=True, null=True)
     department = models.CharField(max_length=100, blank=True, null=True)
@@ -51,12 +58,6 @@ class DoctorProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def generate_random_code(self, length=6):
-        """Generate random alphanumeric code (uppercase letters + digits)"""
-        chars = ''.join([c for c in (string.ascii_uppercase + string.digits) 
-                        if c not in 'O0I1'])  
-        return ''.join(random.choice(chars) for _ in range(length))
-
     def save(self, *args, **kwargs):
         if self.license_number == '':
             self.license_number = None
@@ -73,27 +74,9 @@ class DoctorProfile(models.Model):
         if self.department == '':
             self.department = None
         
-        if self.doctor_id:
-            return super().save(*args, **kwargs)
-        
-        year = timezone.now().year
-        
-        for attempt in range(10):
-            try:
-                with transaction.atomic():
-                    random_code = self.generate_random_code(6)
-                    self.doctor_id = f"DOC-{year}-{random_code}"
-                    
-                    if DoctorProfile.objects.filter(doctor_id=self.doctor_id).exists():
-                        continue
-                    
-                    super().save(*args, **kwargs)
-                    return
-
-            except IntegrityError:
-                continue
-        
-        raise IntegrityError("Failed to generate unique doctor_id after 10 attempts")
+        if not self.doctor_id:
+            self.doctor_id = claim_identifier('DOC')
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.doctor_id} - Dr. {self.user.get_full_name() or self.user.username}"
@@ -134,6 +117,8 @@ class Appointment(models.Model):
     
     appointment_date = models.DateField()
     appointment_time = models.TimeField()
+    # Aware datetime of appointment_date + appointment_time, kept in sync on save
+    scheduled_at = models.DateTimeField(null=True, blank=True, editable=False)
     appointment_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
     reason = models.TextField()
     reminder_sent = models.BooleanField(default=False)
@@ -146,10 +131,57 @@ class Appointment(models.Model):
     
     class Meta:
         ordering = ['-appointment_date', '-appointment_time']
+        indexes = [
+            # Time-window queries: reminders, missed sweeper, upcoming lists
+            models.Index(fields=['status', 'scheduled_at'], name='appointment_status_sched_idx'),
+            # send_appointment_reminders: only rows not reminded yet. The
+            # status stays a key column: a status IN (...) condition is sent
+            # as parameters, which SQLite cannot match to a partial index
+            models.Index(
+                fields=['status', 'scheduled_at'],
+                condition=models.Q(reminder_sent=False),
+                name='appointment_reminder_due_idx',
+            ),
+            # Doctor's day list and its stats
+            models.Index(fields=['doctor', 'appointment_date', 'status'], name='appointment_doctor_date_idx'),
+            # Patient appointment list filtered by status
+            models.Index(fields=['patient', 'status'], name='appointment_patient_status_idx'),
+            # auto_cancel_unscheduled: needs_rescheduling rows older than 24h
+            models.Index(fields=['status', 'updated_at'], name='appointment_status_upd_idx'),
+        ]
+        constraints = [
+            # A doctor's slot can only hold one pending/confirmed appointment
+            models.UniqueConstraint(
+                fields=['doctor', 'scheduled_at'],
+                condition=models.Q(status__in=['pending', 'confirmed']),
+                name='unique_active_doctor_slot',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.patient.patient_id} - {self.doctor.doctor_id} - {self.appointment_date}"
     
+    def sync_scheduled_at(self):
+        # Views pass the raw JSON strings through, so normalise before combining
+        self.appointment_date = self._meta.get_field('appointment_date').to_python(self.appointment_date)
+        self.appointment_time = self._meta.get_field('appointment_time').to_python(self.appointment_time)
+        self.scheduled_at = timezone.make_aware(
+            datetime.combine(self.appointment_date, self.appointment_time),
+            timezone.get_current_timezone()
+        )
+        return self.scheduled_at
+
+    def save(self, *args, **kwargs):
+        self.sync_scheduled_at()
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and (
+            'appointment_date' in update_fields or 'appointment_time' in update_fields
+        ):
+            kwargs['update_fields'] = set(update_fields) | {'scheduled_at'}
+
+        super().save(*args, **kwargs)
+    
     def get_appointment_type_display(self):
         return dict(self.TYPE_CHOICES).get(self.appointment_type, self.appointment_type)
     
@@ -159,6 +191,27 @@ class Appointment(models.Model):
         return self.appointment_date >= today and self.status in ['pending', 'confirmed']
 
 
+class SlotHold(models.Model):
+    """Short-lived reservation of a doctor's slot while a patient fills in the booking form"""
+    doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='slot_holds')
+    patient = models.ForeignKey('patients.PatientProfile', on_delete=models.CASCADE, related_name='slot_holds')
+    scheduled_at = models.DateTimeField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['doctor', 'scheduled_at'], name='unique_slot_hold'),
+        ]
+
+    def __str__(self):
+        return f"{self.doctor.doctor_id} - {self.scheduled_at} (held by {self.patient.patient_id})"
+
+    @property
+    def is_active(self):
+        return self.expires_at > timezone.now()
+
+
 class Prescription(models.Model):
     STATUS_CHOICES = [
         ('active', 'Active'),
@@ -182,21 +235,19 @@ class Prescription(models.Model):
     
     class Meta:
         ordering = ['-prescribed_date']
+        indexes = [
+            # Pharmacy queue and period filters
+            models.Index(fields=['prescribed_date'], name='prescription_date_idx'),
+            # Doctor's prescriptions for a day
+            models.Index(fields=['doctor', 'prescribed_date'], name='prescription_doctor_date_idx'),
+            # Patient's active/expired prescriptions
+            models.Index(fields=['patient', 'status'], name='prescription_patient_stat_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.prescription_number:
-            year = timezone.now().year
-            last_prescription = Prescription.objects.filter(
-                prescription_number__startswith=f"RX-{year}-"
-            ).order_by('-prescription_number').first()
-            
-            if last_prescription:
-                last_number = int(last_prescription.prescription_number.split('-')[-1])
-                next_number = last_number + 1
-            else:
-                next_number = 1
-            
-            self.prescription_number = f"RX-{year}-{next_number:03d}"
+            from .sequences import next_number
+            self.prescription_number = next_number('RX')
         
         super().save(*args, **kwargs)
     
@@ -259,22 +310,15 @@ class ConsultationHistory(models.Model):
     
     class Meta:
         ordering = ['-consultation_date', '-consultation_time']
+        indexes = [
+            models.Index(fields=['doctor', 'consultation_date'], name='consultation_doctor_date_idx'),
+        ]
         verbose_name_plural = 'Consultation Histories'
     
     def save(self, *args, **kwargs):
         if not self.consultation_number:
-            year = timezone.now().year
-            last_consultation = ConsultationHistory.objects.filter(
-                consultation_number__startswith=f"CONS-{year}-"
-            ).order_by('-consultation_number').first()
-            
-            if last_consultation:
-                last_number = int(last_consultation.consultation_number.split('-')[-1])
-                next_number = last_number + 1
-            else:
-                next_number = 1
-            
-            self.consultation_number = f"CONS-{year}-{next_number:03d}"
+            from .sequences import next_number
+            self.consultation_number = next_number('CONS')
         
         super().save(*args, **kwargs)
     
@@ -366,11 +410,13 @@ class DoctorSchedule(models.Model):
         ).select_related('patient__user')
         
         for appointment in affected_appointments:
-            appointment.status = 'needs_rescheduling'
-            appointment.save()
-            
-            # Send email notification
-            self.send_reschedule_email(appointment)
+            # Status change and its email are committed together
+            with transaction.atomic():
+                appointment.status = 'needs_rescheduling'
+                appointment.save()
+                
+                # Queue email notification
+                self.send_reschedule_email(appointment)
     
     def send_reschedule_email(self, appointment):
         try:
@@ -395,17 +441,16 @@ class DoctorSchedule(models.Model):
                 'appointment_id': appointment.id,
             })
             
-            send_mail(
+            queue_email(
                 subject,
                 '', 
                 'noreply@mediconnect.com',
                 [patient_email],
                 html_message=html_message,
-                fail_silently=True,
             )
             
         except Exception as e:
-            print(f"Error sending reschedule email: {e}")
+            print(f"Error queueing reschedule email: {e}")
 
 
 class SharedConsultation(models.Model):
@@ -418,7 +463,92 @@ class SharedConsultation(models.Model):
 
     class Meta:
         ordering = ['-shared_at']
+        indexes = [
+            # Unread shared consultations for a doctor
+            models.Index(fields=['shared_with', 'is_read'], name='shared_with_read_idx'),
+        ]
         unique_together = ['consultation', 'shared_by', 'shared_with']
 
     def __str__(self):
-        return f"{self.consultation.consultation_number} shared by {self.shared_by.doctor_id} to {self.shared_with.doctor_id}"
\ No newline at end of file
+        return f"{self.consultation.consultation_number} shared by {self.shared_by.doctor_id} to {self.shared_with.doctor_id}"
+
+class SchedulerLease(models.Model):
+    """Named lease so only one run_scheduler process is active at a time"""
+    name = models.CharField(max_length=50, unique=True)
+    owner = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} held by {self.owner} until {self.expires_at}"
+
+
+class ScheduledJob(models.Model):
+    """Runtime metrics for a run_scheduler job"""
+    name = models.CharField(max_length=100, unique=True)
+    run_count = models.PositiveIntegerField(default=0)
+    failure_count = models.PositiveIntegerField(default=0)
+    total_duration_ms = models.BigIntegerField(default=0)
+    last_started_at = models.DateTimeField(blank=True, null=True)
+    last_duration_ms = models.PositiveIntegerField(blank=True, null=True)
+    last_status = models.CharField(max_length=10, blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name} ({self.run_count} runs, {self.failure_count} failed)"
+
+    @property
+    def average_duration_ms(self):
+        if not self.run_count:
+            return 0
+        return self.total_duration_ms // self.run_count
+
+
+class NumberSequence(models.Model):
+    """Last issued number per (prefix, year), e.g. RX-2026-042 -> ('RX', 2026, 42). See doctors.sequences"""
+    prefix = models.CharField(max_length=10)
+    year = models.PositiveIntegerField()
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['prefix', 'year'], name='numbersequence_prefix_year_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.prefix}-{self.year}: {self.last_value}"
+
+
+class ClinicalSearchDocument(models.Model):
+    """
+    Searchable text of one consultation, prescription or lab report, kept up
+    to date by doctors.signals and queried through doctors.search.
+    """
+    KIND_CHOICES = [
+        ('consultation', 'Consultation'),
+        ('prescription', 'Prescription'),
+        ('lab_report', 'Lab Report'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    patient = models.ForeignKey('patients.PatientProfile', on_delete=models.CASCADE, related_name='+')
+    doctor = models.ForeignKey(DoctorProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    record_number = models.CharField(max_length=50)
+    record_date = models.DateField()
+    heading = models.TextField()
+    body = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='clinicalsearch_record_uniq'),
+        ]
+        indexes = [
+            # Lab reports of a doctor's patients (see doctors.search)
+            models.Index(fields=['patient', 'kind'], name='clinicalsearch_patient_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.record_number}"
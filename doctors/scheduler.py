@@ -0,0 +1,140 @@
+"""
+In-process job scheduler used by the run_scheduler command.
+
+Jobs are management commands run with call_command() on fixed intervals, so
+Django is set up once for the life of the process. A row in SchedulerLease
+makes sure only one scheduler runs the jobs at a time; other instances wait
+until the lease expires. Each run is recorded on a ScheduledJob row.
+"""
+import io
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import SchedulerLease, ScheduledJob
+
+
+LEASE_NAME = 'run_scheduler'
+LEASE_DURATION = timedelta(seconds=90)
+
+# Command name -> interval in seconds. SCHEDULER_JOBS in settings overrides
+# single entries; an interval of 0 or None disables the job.
+DEFAULT_JOBS = {
+    'send_queued_emails': 30,
+    'expire_slot_holds': 300,
+    'send_appointment_reminders': 300,
+    'mark_missed_appointments': 900,
+    'send_reschedule_reminders': 3600,
+    'auto_cancel_unscheduled': 3600,
+    'expire_prescriptions': 3600,
+    'purge_export_jobs': 86400,
+    'purge_change_events': 3600,
+    'refill_profile_ids': 3600,
+    'snapshot_stock': 3600,
+}
+
+
+def configured_jobs():
+    jobs = dict(DEFAULT_JOBS)
+    jobs.update(getattr(settings, 'SCHEDULER_JOBS', {}))
+    return {name: interval for name, interval in jobs.items() if interval}
+
+
+def make_owner():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def acquire_lease(owner, name=LEASE_NAME, duration=LEASE_DURATION):
+    """
+    Take or renew the lease. Returns True while `owner` holds it.
+    """
+    now = timezone.now()
+    expires_at = now + duration
+
+    renewed = SchedulerLease.objects.filter(name=name).filter(
+        Q(owner=owner) | Q(expires_at__lt=now)
+    ).update(owner=owner, expires_at=expires_at)
+    if renewed:
+        return True
+
+    try:
+        with transaction.atomic():
+            SchedulerLease.objects.create(name=name, owner=owner, expires_at=expires_at)
+    except IntegrityError:
+        # Held by another live scheduler
+        return False
+    return True
+
+
+@contextmanager
+def lease_heartbeat(owner, name=LEASE_NAME, duration=LEASE_DURATION):
+    """
+    Renew the lease from a background thread while the block runs, so a job
+    longer than `duration` does not let another scheduler take over. Yields
+    an Event that is set if the lease was lost meanwhile.
+    """
+    stop = threading.Event()
+    lost = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(duration.total_seconds() / 3):
+                if not acquire_lease(owner, name, duration):
+                    lost.set()
+                    return
+        except Exception:
+            # Cannot tell whether we still hold it
+            lost.set()
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=beat, name='scheduler-lease', daemon=True)
+    thread.start()
+    try:
+        yield lost
+    finally:
+        stop.set()
+        thread.join()
+
+
+def release_lease(owner, name=LEASE_NAME):
+    SchedulerLease.objects.filter(name=name, owner=owner).delete()
+
+
+def run_job(name):
+    """
+    Run one job and record its metrics. Returns (ok, output).
+    """
+    job, _ = ScheduledJob.objects.get_or_create(name=name)
+    started_at = timezone.now()
+    start = time.monotonic()
+    output = io.StringIO()
+
+    try:
+        call_command(name, stdout=output, stderr=output)
+        ok, error = True, None
+    except Exception:
+        ok, error = False, traceback.format_exc()
+
+    duration_ms = int((time.monotonic() - start) * 1000)
+    ScheduledJob.objects.filter(pk=job.pk).update(
+        run_count=F('run_count') + 1,
+        failure_count=F('failure_count') + (0 if ok else 1),
+        total_duration_ms=F('total_duration_ms') + duration_ms,
+        last_started_at=started_at,
+        last_duration_ms=duration_ms,
+        last_status='ok' if ok else 'failed',
+        last_error=error,
+    )
+    return ok, error or output.getvalue()
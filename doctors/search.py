@@ -0,0 +1,226 @@
+"""
+Full-text search over a doctor's clinical records.
+
+Every consultation, prescription and lab report has a ClinicalSearchDocument
+row holding its record number, a heading (the diagnosis, or the lab test
+names) and a body: chief complaint, symptoms, examination, treatment plan,
+prescribed medicine names, lab findings and parameter names, notes.
+doctors.signals rewrites the row when the record or one of its medicines is
+saved; the lab report views save the report last, after its test sections.
+
+The rows are indexed by the database:
+- SQLite: an FTS5 table with porter stemming and 2-3 letter prefix
+  indexes, synced by triggers, ranked with bm25 (number and heading weigh
+  more than the body).
+- PostgreSQL: a GIN index on a weighted tsvector, ranked with ts_rank.
+- Anything else: icontains filters, no index.
+Both indexes are created by migration 0022.
+
+A doctor finds their own records, consultations shared with them and the
+lab reports of patients they have appointments with (as on the lab reports
+page).
+"""
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from patients.search import normalize
+from staff.models import LabReport
+
+from .models import Appointment, ClinicalSearchDocument, ConsultationHistory, Prescription, SharedConsultation
+
+FTS_TABLE = 'doctors_clinical_fts'
+
+# Must match the expression index created by migration 0022
+PG_VECTOR = (
+    "setweight(to_tsvector('simple', record_number), 'A') || "
+    "setweight(to_tsvector('english', heading), 'A') || "
+    "setweight(to_tsvector('english', body), 'B')"
+)
+
+MIN_QUERY_LENGTH = 2
+MAX_QUERY_TERMS = 8
+
+
+def _join(*parts):
+    return '\n'.join(part.strip() for part in parts if part and part.strip())
+
+
+def consultation_document(consultation):
+    return {
+        'patient_id': consultation.patient_id,
+        'doctor_id': consultation.doctor_id,
+        'record_number': consultation.consultation_number,
+        'record_date': consultation.consultation_date,
+        'heading': consultation.diagnosis,
+        'body': _join(
+            consultation.chief_complaint, consultation.symptoms, consultation.examination_findings,
+            consultation.treatment_plan, consultation.notes,
+        ),
+    }
+
+
+def prescription_document(prescription):
+    """Needs prescription.medicines (prefetched when indexing in bulk)."""
+    return {
+        'patient_id': prescription.patient_id,
+        'doctor_id': prescription.doctor_id,
+        'record_number': prescription.prescription_number,
+        'record_date': prescription.prescribed_date,
+        'heading': prescription.diagnosis,
+        'body': _join(*[m.medicine_name for m in prescription.medicines.all()], prescription.notes),
+    }
+
+
+def lab_report_document(report):
+    """Needs report.test_sections and their parameters."""
+    sections = list(report.test_sections.all())
+    findings = []
+    for section in sections:
+        findings.append(section.findings)
+        findings.extend(parameter.name for parameter in section.parameters.all())
+    return {
+        'patient_id': report.patient_id,
+        'doctor_id': report.doctor_id,
+        'record_number': report.report_number,
+        'record_date': report.test_date,
+        # Plain fields rather than get_test_name(), as in migration 0022
+        'heading': ', '.join(s.custom_test_name or s.test_name_choice or '' for s in sections),
+        'body': _join(*findings, report.notes),
+    }
+
+
+# kind -> (model, prefetch, document builder)
+RECORD_KINDS = {
+    'consultation': (ConsultationHistory, (), consultation_document),
+    'prescription': (Prescription, ('medicines',), prescription_document),
+    'lab_report': (LabReport, ('test_sections__parameters',), lab_report_document),
+}
+
+
+def index_record(kind, record):
+    _, _, build = RECORD_KINDS[kind]
+    ClinicalSearchDocument.objects.update_or_create(kind=kind, object_id=record.pk, defaults=build(record))
+
+
+def index_record_id(kind, object_id):
+    model, prefetch, _ = RECORD_KINDS[kind]
+    record = model.objects.filter(pk=object_id).prefetch_related(*prefetch).first()
+    if record is None:
+        remove_record(kind, object_id)
+    else:
+        index_record(kind, record)
+
+
+def remove_record(kind, object_id):
+    ClinicalSearchDocument.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def iter_documents(kind, records, batch_size=1000):
+    """Unsaved ClinicalSearchDocument rows for `records`, in lists of `batch_size`."""
+    _, _, build = RECORD_KINDS[kind]
+    batch = []
+    for record in records.iterator(chunk_size=batch_size):
+        batch.append(ClinicalSearchDocument(kind=kind, object_id=record.pk, **build(record)))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def rebuild_index(batch_size=1000):
+    """Rewrite every record's document. Returns the number indexed."""
+    ClinicalSearchDocument.objects.all().delete()
+    count = 0
+    for kind, (model, prefetch, _) in RECORD_KINDS.items():
+        records = model.objects.order_by('pk').prefetch_related(*prefetch)
+        for batch in iter_documents(kind, records, batch_size):
+            ClinicalSearchDocument.objects.bulk_create(batch)
+            count += len(batch)
+    return count
+
+
+def query_words(query):
+    """Each query word as its normalized tokens: "CONS-2026-04" -> ['cons', '2026', '04']."""
+    words = [normalize(word).split() for word in query.split()]
+    return [tokens for tokens in words if tokens][:MAX_QUERY_TERMS]
+
+
+def _fts_match(words):
+    # One quoted phrase per query word, so FTS5 operators in user input are
+    # plain text and "CONS-2026-04" stays together; * = prefix of the last token
+    return ' '.join('"{}"*'.format(' '.join(tokens)) for tokens in words)
+
+
+def _tsquery(words):
+    return ' & '.join(f"{token}:*" for tokens in words for token in tokens)
+
+
+def _accessible_ids_sql(profile):
+    """
+    SELECT of the ids of the documents `profile` may see. Each branch is an
+    indexed lookup, so this stays cheap next to the text match.
+    """
+    documents = ClinicalSearchDocument._meta.db_table
+    sql = (
+        f"SELECT id FROM {documents} WHERE doctor_id = %s "
+        f"UNION ALL SELECT doc.id FROM {SharedConsultation._meta.db_table} s "
+        f"JOIN {documents} doc ON doc.kind = 'consultation' AND doc.object_id = s.consultation_id "
+        f"WHERE s.shared_with_id = %s "
+        f"UNION ALL SELECT doc.id FROM {Appointment._meta.db_table} a "
+        f"JOIN {documents} doc ON doc.patient_id = a.patient_id AND doc.kind = 'lab_report' "
+        f"WHERE a.doctor_id = %s"
+    )
+    return sql, [profile.id, profile.id, profile.id]
+
+
+def _fetch_ids(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_records(profile, query, kinds=None, limit=20):
+    """ClinicalSearchDocuments `profile` may see that match `query`, best match first."""
+    words = query_words(query)
+    if not words or len(''.join(t for tokens in words for t in tokens)) < MIN_QUERY_LENGTH:
+        return []
+
+    accessible, access_params = _accessible_ids_sql(profile)
+    kind_filter, kind_params = '', []
+    if kinds:
+        kind_filter = f" AND d.kind IN ({', '.join(['%s'] * len(kinds))})"
+        kind_params = list(kinds)
+
+    if connection.vendor == 'sqlite':
+        # "+rowid" keeps SQLite from handing each accessible id to FTS5 as a
+        # separate lookup (which re-runs the match per id); instead the
+        # matches are checked against the accessible set
+        ranked_ids = _fetch_ids(
+            f"SELECT d.id FROM {FTS_TABLE} JOIN {ClinicalSearchDocument._meta.db_table} d "
+            f"ON d.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH %s AND +{FTS_TABLE}.rowid IN ({accessible}){kind_filter} "
+            f"ORDER BY bm25({FTS_TABLE}, 5.0, 4.0, 1.0) LIMIT %s",
+            [_fts_match(words)] + access_params + kind_params + [limit],
+        )
+    elif connection.vendor == 'postgresql':
+        tsquery = _tsquery(words)
+        ranked_ids = _fetch_ids(
+            f"SELECT d.id FROM {ClinicalSearchDocument._meta.db_table} d "
+            f"WHERE {PG_VECTOR} @@ to_tsquery('english', %s) AND d.id IN ({accessible}){kind_filter} "
+            f"ORDER BY ts_rank({PG_VECTOR}, to_tsquery('english', %s)) DESC, d.record_date DESC LIMIT %s",
+            [tsquery] + access_params + kind_params + [tsquery, limit],
+        )
+    else:
+        matches = ClinicalSearchDocument.objects.filter(id__in=RawSQL(accessible, access_params))
+        if kinds:
+            matches = matches.filter(kind__in=kinds)
+        for token in (t for tokens in words for t in tokens):
+            matches = matches.filter(
+                Q(record_number__icontains=token) | Q(heading__icontains=token) | Q(body__icontains=token)
+            )
+        ranked_ids = list(matches.order_by('-record_date').values_list('id', flat=True)[:limit])
+
+    documents = ClinicalSearchDocument.objects.select_related('patient__user').in_bulk(ranked_ids)
+    return [documents[pk] for pk in ranked_ids if pk in documents]
@@ -0,0 +1,72 @@
+"""
+Human-readable document numbers (RX-2026-001, CONS-2026-001, LAB-2026-0001).
+
+Each (prefix, year) has a NumberSequence row that is bumped with a single
+UPDATE ... SET last_value = last_value + n. The UPDATE takes the row lock,
+so concurrent creators queue on it instead of reading the same "highest
+number so far" and colliding on the unique column, and the cost does not
+grow with the table.
+
+By default a number is allocated in the caller's transaction: if that rolls
+back, so does the number, and numbers stay gapless. NUMBER_SEQUENCE_BLOCKS
+can instead let a process reserve a block of numbers at a time, e.g.
+{'RX': 20}, for very busy prefixes. Reserved numbers that are never used
+(the process exits) are skipped, and numbers are then only increasing per
+process, not globally.
+"""
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import NumberSequence
+
+_blocks = {}
+_blocks_lock = threading.Lock()
+
+
+def allocate(prefix, year, count=1):
+    """Reserve `count` consecutive numbers; returns them as a range."""
+    with transaction.atomic():
+        sequence = NumberSequence.objects.filter(prefix=prefix, year=year)
+        if not sequence.update(last_value=F('last_value') + count):
+            try:
+                with transaction.atomic():
+                    NumberSequence.objects.create(prefix=prefix, year=year, last_value=count)
+                return range(1, count + 1)
+            except IntegrityError:
+                # Another process created the row first
+                sequence.update(last_value=F('last_value') + count)
+        # We hold the row lock until commit, so this is our own value
+        last_value = sequence.values_list('last_value', flat=True).get()
+    return range(last_value - count + 1, last_value + 1)
+
+
+def _block_size(prefix):
+    return getattr(settings, 'NUMBER_SEQUENCE_BLOCKS', {}).get(prefix, 1)
+
+
+def next_value(prefix, year):
+    block_size = _block_size(prefix)
+    # A block reserved inside the caller's transaction would be handed out
+    # again if that transaction rolled back, so only refill outside one
+    if block_size <= 1 or connection.in_atomic_block:
+        with _blocks_lock:
+            block = _blocks.get((prefix, year))
+            if block:
+                return block.pop(0)
+        return allocate(prefix, year)[0]
+
+    with _blocks_lock:
+        block = _blocks.get((prefix, year))
+        if not block:
+            block = _blocks[(prefix, year)] = list(allocate(prefix, year, block_size))
+        return block.pop(0)
+
+
+def next_number(prefix, width=3):
+    """The next formatted number for this year, e.g. next_number('RX') -> 'RX-2026-001'."""
+    year = timezone.now().year
+    return f"{prefix}-{year}-{next_value(prefix, year):0{width}d}"
@@ -0,0 +1,46 @@
+"""
+Keep ClinicalSearchDocument in step with consultations, prescriptions and
+lab reports.
+"""
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from staff.models import LabReport
+
+from .models import ConsultationHistory, PrescribedMedicine, Prescription
+from .search import index_record_id, remove_record
+
+RECORD_KINDS = {
+    ConsultationHistory: 'consultation',
+    Prescription: 'prescription',
+    LabReport: 'lab_report',
+}
+
+
+@receiver(post_save, sender=ConsultationHistory)
+@receiver(post_save, sender=Prescription)
+@receiver(post_save, sender=LabReport)
+def record_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    index_record_id(RECORD_KINDS[sender], instance.pk)
+
+
+@receiver(post_delete, sender=ConsultationHistory)
+@receiver(post_delete, sender=Prescription)
+@receiver(post_delete, sender=LabReport)
+def record_deleted(sender, instance, **kwargs):
+    remove_record(RECORD_KINDS[sender], instance.pk)
+
+
+@receiver(post_save, sender=PrescribedMedicine)
+@receiver(post_delete, sender=PrescribedMedicine)
+def medicine_changed(sender, instance, raw=False, origin=None, **kwargs):
+    if raw:
+        return
+    # Deleting the prescription removes its document anyway
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin is not None and origin_model is not PrescribedMedicine:
+        return
+    index_record_id('prescription', instance.prescription_id)
@@ -1,3 +1,301 @@
-from django.test import TestCase
+import random
+import unittest
+from datetime import date, datetime, time, timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from mediconnect.testing import run_concurrently
+from notifications.models import EmailOutbox
+from patients.models import PatientProfile
+
+from . import sequences
+from .availability import DoctorAvailability
+from .management.commands.send_appointment_reminders import due_for_reminder
+from .booking import SlotUnavailable, hold_slot, save_into_slot, slot_datetime
+from .models import Appointment, DoctorProfile, DoctorSchedule, Prescription, SlotHold
+
+
+def make_patient(username):
+    return PatientProfile.objects.create(user=User.objects.create(username=username))
+
+
+def make_doctor(username):
+    return DoctorProfile.objects.create(user=User.objects.create(username=username), specialization='cardiology')
+
+
+def per_day_available_time_slots(doctor, check_date):
+    """The per-day lookup DoctorAvailability replaced, kept as the reference."""
+    day_name = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'][check_date.weekday()]
+    schedules = DoctorSchedule.objects.filter(
+        doctor=doctor, day_of_week=day_name, is_active=True, slot_type='consultation'
+    )
+    if not schedules.exists():
+        return []
+
+    booked_times = set(Appointment.objects.filter(
+        doctor=doctor, appointment_date=check_date, status__in=['pending', 'confirmed']
+    ).values_list('appointment_time', flat=True))
+
+    available_slots = []
+    for schedule in schedules:
+        current_slot = datetime.combine(check_date, schedule.start_time)
+        end_slot = datetime.combine(check_date, schedule.end_time)
+        while current_slot < end_slot:
+            slot_time = current_slot.time()
+            if slot_time not in booked_times:
+                available_slots.append(f"{int(slot_time.strftime('%I'))}:{slot_time.strftime('%M')} {slot_time.strftime('%p')}")
+            current_slot += timedelta(minutes=15)
+    return available_slots
+
+
+class DoctorAvailabilityTests(TestCase):
+    DOCTORS = 5
+    DAYS = 14
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(3)
+        patient = make_patient('pat')
+        cls.doctors = [make_doctor(f'doc{i}') for i in range(cls.DOCTORS)]
+        cls.dates = [date.today() + timedelta(days=offset) for offset in range(1, cls.DAYS + 1)]
+
+        for doctor in cls.doctors:
+            for day_name in rng.sample(DoctorSchedule.DAY_CHOICES, 5):
+                DoctorSchedule.objects.create(
+                    doctor=doctor, day_of_week=day_name[0], start_time=time(9, 0), end_time=time(12, 0)
+                )
+                DoctorSchedule.objects.create(
+                    doctor=doctor, day_of_week=day_name[0], start_time=time(14, 0), end_time=time(16, 30)
+                )
+            # An inactive schedule adds no slots
+            DoctorSchedule.objects.create(
+                doctor=doctor, day_of_week='sunday', start_time=time(18, 0), end_time=time(19, 0), is_active=False
+            )
+
+            for day in cls.dates:
+                for minute in rng.sample(range(9 * 60, 17 * 60, 15), 8):
+                    Appointment.objects.create(
+                        patient=patient, doctor=doctor, appointment_date=day,
+                        appointment_time=time(*divmod(minute, 60)), appointment_type='consultation',
+                        reason='Checkup', status=rng.choice(['pending', 'confirmed', 'cancelled', 'completed']),
+                    )
+
+    def test_free_slots_match_the_per_day_lookup(self):
+        availability = DoctorAvailability([doctor.id for doctor in self.doctors], self.dates)
+        for doctor in self.doctors:
+            for day in self.dates:
+                self.assertEqual(
+                    availability.free_slots(doctor.id, day), per_day_available_time_slots(doctor, day), (doctor, day)
+                )
+
+    def test_range_lookup_runs_a_fixed_number_of_queries(self):
+        doctor_ids = [doctor.id for doctor in self.doctors]
+        # Schedules, appointments and slot holds, however many doctors and days
+        with self.assertNumQueries(3):
+            availability = DoctorAvailability(doctor_ids, self.dates)
+            for doctor_id in doctor_ids:
+                for day in self.dates:
+                    availability.free_slots(doctor_id, day)
+
+        with CaptureQueriesContext(connection) as per_day:
+            for doctor in self.doctors:
+                for day in self.dates:
+                    per_day_available_time_slots(doctor, day)
+        # Two or three queries per (doctor, day) before
+        self.assertGreaterEqual(len(per_day), 2 * self.DOCTORS * self.DAYS)
+
+
+def reminders_due_by_loop(now):
+    """The full-table loop send_appointment_reminders used before the indexed window."""
+    start, end = now + timedelta(minutes=55), now + timedelta(minutes=65)
+    return {
+        apt.id
+        for apt in Appointment.objects.filter(status__in=['pending', 'confirmed'], reminder_sent=False)
+        if start <= timezone.make_aware(
+            datetime.combine(apt.appointment_date, apt.appointment_time), timezone.get_current_timezone()
+        ) <= end
+    }
+
+
+class AppointmentReminderTests(TestCase):
+    BACKGROUND = 2000
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(9)
+        cls.patient = PatientProfile.objects.create(
+            user=User.objects.create(username='pat', email='pat@example.com')
+        )
+        cls.doctors = [make_doctor(f'doc{i}') for i in range(4)]
+
+        # Appointments on other days, in every state: none of them is due
+        background = []
+        tz = timezone.get_current_timezone()
+        for index in range(cls.BACKGROUND):
+            day = date.today() + timedelta(days=rng.choice([-1, 1]) * (2 + index // 20))
+            slot = time(*divmod(8 * 60 + index % 20 * 15, 60))
+            background.append(Appointment(
+                patient=cls.patient, doctor=cls.doctors[0], appointment_date=day, appointment_time=slot,
+                scheduled_at=timezone.make_aware(datetime.combine(day, slot), tz),
+                appointment_type='consultation', reason='Checkup',
+                status=rng.choice([status for status, _ in Appointment.STATUS_CHOICES]),
+                reminder_sent=rng.random() < 0.5,
+            ))
+        Appointment.objects.bulk_create(background)
+
+    def book(self, minutes_ahead, status='pending', doctor=None, patient=None, reminder_sent=False):
+        starts = (timezone.localtime() + timedelta(minutes=minutes_ahead)).replace(second=0, microsecond=0)
+        return Appointment.objects.create(
+            patient=patient or self.patient, doctor=doctor or self.doctors[1],
+            appointment_date=starts.date(), appointment_time=starts.time(),
+            appointment_type='consultation', reason='Checkup', status=status, reminder_sent=reminder_sent,
+        )
+
+    def send_reminders(self):
+        """Ids of the appointments this run reminded."""
+        reminded = Appointment.objects.filter(reminder_sent=True)
+        before = set(reminded.values_list('id', flat=True))
+        call_command('send_appointment_reminders', stdout=StringIO())
+        return set(reminded.values_list('id', flat=True)) - before
+
+    def test_window_picks_the_same_appointments_as_the_full_loop(self):
+        due = {self.book(57).id, self.book(60, status='confirmed').id, self.book(63).id}
+        self.book(30)
+        self.book(53)
+        self.book(67)
+        self.book(59, reminder_sent=True)
+        self.book(61, status='cancelled', doctor=self.doctors[2])
+        self.book(62, status='completed', doctor=self.doctors[2])
+        self.book(60 + 24 * 60)
+        self.book(60 - 24 * 60)
+        no_email = self.book(58, patient=make_patient('no-email'), doctor=self.doctors[3])
+
+        self.assertEqual(reminders_due_by_loop(timezone.now()), due | {no_email.id})
+        self.assertEqual(self.send_reminders(), due)
+        self.assertEqual(EmailOutbox.objects.count(), len(due))
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', 'reads the SQLite query plan')
+    def test_window_is_a_scan_of_the_partial_index(self):
+        now = timezone.now()
+        plan = due_for_reminder(now + timedelta(minutes=55), now + timedelta(minutes=65)).explain()
+        self.assertIn('appointment_reminder_due_idx', plan)
+
+    def test_queries_do_not_grow_with_the_batch(self):
+        self.book(58)
+        with CaptureQueriesContext(connection) as one:
+            self.assertEqual(len(self.send_reminders()), 1)
+
+        for doctor in self.doctors:
+            for minutes in (57, 59, 61, 63):
+                self.book(minutes, doctor=doctor)
+        with CaptureQueriesContext(connection) as sixteen:
+            self.assertEqual(len(self.send_reminders()), 16)
+        # One SELECT for the window, one INSERT for the emails, one UPDATE
+        self.assertEqual(len(sixteen), len(one))
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    THREADS = 12
+    SLOTS = [time(9, 0), time(9, 30), time(10, 0)]
+
+    def setUp(self):
+        self.doctor = make_doctor('doc')
+        self.patients = [make_patient(f'pat{i}') for i in range(self.THREADS)]
+        self.day = date.today() + timedelta(days=3)
+
+    def assert_one_winner_per_slot(self, results, winner_type):
+        for slot in range(len(self.SLOTS)):
+            slot_results = results[slot::len(self.SLOTS)]
+            winners = [r for r in slot_results if isinstance(r, winner_type)]
+            self.assertEqual(len(winners), 1, slot_results)
+            for result in slot_results:
+                if not isinstance(result, winner_type):
+                    self.assertIsInstance(result, SlotUnavailable)
+
+    def test_concurrent_bookings_of_a_slot_have_one_winner(self):
+        def book(index):
+            appointment = Appointment(
+                patient=self.patients[index],
+                doctor=self.doctor,
+                appointment_date=self.day,
+                appointment_time=self.SLOTS[index % len(self.SLOTS)],
+                appointment_type='consultation',
+                reason='Checkup',
+                status='pending',
+            )
+            return save_into_slot(appointment, self.patients[index])
+
+        results = run_concurrently(book, self.THREADS)
+
+        self.assert_one_winner_per_slot(results, Appointment)
+        self.assertEqual(
+            Appointment.objects.filter(doctor=self.doctor, status='pending').count(), len(self.SLOTS)
+        )
+
+    def test_concurrent_holds_on_a_slot_have_one_winner(self):
+        def hold(index):
+            scheduled_at = slot_datetime(self.day, self.SLOTS[index % len(self.SLOTS)])
+            return hold_slot(self.doctor, self.patients[index], scheduled_at)
+
+        results = run_concurrently(hold, self.THREADS)
+
+        self.assert_one_winner_per_slot(results, SlotHold)
+        self.assertEqual(SlotHold.objects.filter(doctor=self.doctor).count(), len(self.SLOTS))
+
+    def test_booking_is_refused_while_another_patient_holds_the_slot(self):
+        holder, other = self.patients[:2]
+        hold_slot(self.doctor, holder, slot_datetime(self.day, self.SLOTS[0]))
+
+        appointment = Appointment(
+            patient=other, doctor=self.doctor, appointment_date=self.day, appointment_time=self.SLOTS[0],
+            appointment_type='consultation', reason='Checkup', status='pending',
+        )
+        with self.assertRaises(SlotUnavailable):
+            save_into_slot(appointment, other)
+
+
+class ConcurrentPrescriptionNumberTests(TransactionTestCase):
+    THREADS = 16
+    PER_THREAD = 10
+
+    def setUp(self):
+        self.doctor = make_doctor('doc')
+        self.patient = make_patient('pat')
+        # Blocks reserved by an earlier test belong to a flushed database
+        sequences._blocks.clear()
+        self.addCleanup(sequences._blocks.clear)
+
+    def create_prescriptions(self, index):
+        return [
+            Prescription.objects.create(
+                patient=self.patient, doctor=self.doctor, diagnosis='Hypertension',
+                valid_until=date.today() + timedelta(days=30),
+            ).prescription_number
+            for _ in range(self.PER_THREAD)
+        ]
+
+    def issued_values(self):
+        results = run_concurrently(self.create_prescriptions, self.THREADS)
+        errors = [result for result in results if isinstance(result, Exception)]
+        self.assertEqual(errors, [])
+
+        numbers = [number for result in results for number in result]
+        self.assertEqual(len(numbers), self.THREADS * self.PER_THREAD)
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertEqual(Prescription.objects.count(), len(numbers))
+        return sorted(int(number.rsplit('-', 1)[1]) for number in numbers)
+
+    def test_concurrent_prescriptions_get_unique_gapless_numbers(self):
+        self.assertEqual(self.issued_values(), list(range(1, self.THREADS * self.PER_THREAD + 1)))
+
+    @override_settings(NUMBER_SEQUENCE_BLOCKS={'RX': 5})
+    def test_concurrent_prescriptions_get_unique_numbers_from_blocks(self):
+        values = self.issued_values()
+        # Blocks are shared by the threads of this process, so none are left half used
+        self.assertEqual(values, list(range(1, self.THREADS * self.PER_THREAD + 1)))
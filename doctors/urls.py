@@ -5,6 +5,7 @@ urlpatterns = [
     path('sidebar-data/', views.get_doctor_sidebar_data, name='doctor-sidebar-data'),
     path('logout/', views.doctor_logout, name='doctor-logout'),
     path('overview/', views.doctor_overview, name='doctor-overview'),
+    path('events/', views.doctor_events, name='doctor-events'),
     path('patient/<int:patient_id>/details/', views.get_patient_details, name='patient-details'),
 
     path('appointments/', views.get_doctor_appointments, name='doctor-appointments'),
@@ -24,6 +25,7 @@ urlpatterns = [
     path('consultations/<int:consultation_id>/share/', views.share_consultation, name='share-consultation'),
     path('doctors/list/', views.get_doctors_list_for_share, name='doctors-list-for-share'),
     path('consultations/<int:consultation_id>/update/', views.update_consultation, name='update_consultation'),
+    path('search/', views.search_clinical_records, name='doctor-clinical-search'),
 
     path('schedule/', views.get_doctor_schedule, name='schedule'),
     path('schedule/add-slot/', views.add_time_slot, name='add-slot'),
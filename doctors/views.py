@@ -4,6 +4,15 @@ from django.contrib.auth import logout
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_protect
 from django.db.models import Q
+from mediconnect.stats import count_buckets
+from mediconnect.images import image_url
+from patients.search import patient_search_q
+from .search import search_records
+from notifications.events import event_stream_response
+from notifications.feed import (
+    latest_notifications, serialize_notification, mark_read,
+    notify_appointment_completed, notify_prescription, notify_consultation, notify_shared_consultation,
+)
 from .models import DoctorProfile, Appointment, Prescription, ConsultationHistory, PrescribedMedicine, DoctorSchedule, SharedConsultation
 from django.utils import timezone
 from datetime import timedelta
@@ -32,7 +41,7 @@ def get_doctor_sidebar_data(request):
     
     profile_photo = None
     if profile.profile_photo:
-        profile_photo = request.build_absolute_uri(profile.profile_photo.url)
+        profile_photo = image_url(request, profile, 'profile_photo', 'thumb')
     
     return JsonResponse({
         "name": full_name,
@@ -62,7 +71,6 @@ def doctor_overview(request):
         return JsonResponse({"error": "Doctor profile not found"}, status=404)
     
     from patients.models import PatientProfile
-    from staff.models import LabReport
     
     full_name = request.user.get_full_name() or request.user.username
     period = request.GET.get('period', 'today')
@@ -115,7 +123,7 @@ def doctor_overview(request):
     for apt in upcoming_appointments:
         profile_photo = None
         if apt.patient.profile_photo:
-            profile_photo = request.build_absolute_uri(apt.patient.profile_photo.url)
+            profile_photo = image_url(request, apt.patient, 'profile_photo', 'thumb')
         upcoming_list.append({
             'id': apt.patient.id,
             'appointmentId': apt.id,
@@ -212,185 +220,38 @@ def doctor_overview(request):
     notifications = []
     one_hour_later = now + timezone.timedelta(hours=1)
     
-    # Type 1: Upcoming appointments in next 1 hour
+    # Upcoming appointments in next 1 hour depend on the current time, not on
+    # an event, so they are not part of the notification feed
     upcoming_soon = Appointment.objects.filter(
-        doctor=profile, appointment_date=today, status__in=['pending', 'confirmed']
-    ).select_related('patient__user').order_by('appointment_time')
+        doctor=profile, status__in=['pending', 'confirmed'],
+        scheduled_at__gt=now, scheduled_at__lte=one_hour_later
+    ).select_related('patient__user').order_by('scheduled_at')
     
     for apt in upcoming_soon:
-        apt_datetime = timezone.datetime.combine(apt.appointment_date, apt.appointment_time)
-        apt_datetime = timezone.make_aware(apt_datetime)
-        if apt_datetime > now and apt_datetime <= one_hour_later:
-            time_diff = apt_datetime - now
-            minutes = int(time_diff.total_seconds() / 60)
-            if minutes < 1:
-                time_text = "Starting now"
-            elif minutes < 60:
-                time_text = f"in {minutes} min"
-            else:
-                time_text = f"in {int(minutes / 60)} hour"
-            priority = 'high' if minutes < 15 else 'medium' if minutes < 30 else 'low'
-            notifications.append({
-                'id': f'upcoming-{apt.id}',
-                'type': 'appointment',
-                'message': f"Upcoming: {apt.patient.user.get_full_name() or apt.patient.user.username}",
-                'time': time_text,
-                'priority': priority
-            })
-    
-    # Type 2: Newly booked appointments (last 1 hour)
-    newly_booked = Appointment.objects.filter(
-        doctor=profile, created_at__gte=one_hour_ago, status__in=['pending', 'confirmed']
-    ).select_related('patient__user').order_by('-created_at')[:5]
-    
-    for apt in newly_booked:
-        time_since_booking = now - apt.created_at
-        total_minutes = int(time_since_booking.total_seconds() / 60)
-        hours_ago = int(time_since_booking.total_seconds() / 3600)
-        if total_minutes < 1:
-            time_text = "Just now"
-        elif total_minutes < 60:
-            time_text = f"{total_minutes} min ago"
-        elif hours_ago < 24:
-            time_text = f"{hours_ago} hr ago" if hours_ago > 1 else "1 hr ago"
-        else:
-            time_text = "Yesterday"
-        apt_date = apt.appointment_date.strftime('%b %d')
-        apt_time = apt.appointment_time.strftime('%I:%M %p')
-        notifications.append({
-            'id': f'booked-{apt.id}',
-            'type': 'appointment',
-            'message': f"New booking: {apt.patient.user.get_full_name() or apt.patient.user.username} on {apt_date} at {apt_time}",
-            'time': time_text,
-            'priority': 'medium'
-        })
-    
-    # ✅ Type 3: Critical lab reports (last 1 hour) - FIXED
-    doctor_patients = Appointment.objects.filter(doctor=profile).values_list('patient_id', flat=True).distinct()
-    critical_lab_reports = LabReport.objects.filter(
-        patient_id__in=doctor_patients, created_at__gte=one_hour_ago, overall_status='critical'
-    ).select_related('patient__user').prefetch_related('test_sections').order_by('-created_at')[:5]
-    
-    for report in critical_lab_reports:
-        time_since = now - report.created_at
-        total_minutes = int(time_since.total_seconds() / 60)
-        hours_ago = int(time_since.total_seconds() / 3600)
-        if total_minutes < 1:
-            time_text = "Just now"
-        elif total_minutes < 60:
-            time_text = f"{total_minutes} min ago"
-        elif hours_ago < 24:
-            time_text = f"{hours_ago} hr ago" if hours_ago > 1 else "1 hr ago"
-        else:
-            time_text = "Yesterday"
-        
-        # ✅ Get test name from test_sections
-        test_sections = report.test_sections.all()
-        if test_sections.exists():
-            if test_sections.count() == 1:
-                test_name = test_sections.first().get_test_name()
-            else:
-                test_name = f"{test_sections.count()} tests"
-        else:
-            test_name = "lab report"
-        
-        notifications.append({
-            'id': f'lab-critical-{report.id}',
-            'type': 'lab',
-            'message': f"⚠️ Critical Lab: {report.patient.user.get_full_name() or report.patient.user.username} - {test_name}",
-            'time': time_text,
-            'priority': 'high'
-        })
-    
-    # ✅ Type 4: New lab reports (last 1 hour, non-critical) - FIXED
-    new_lab_reports = LabReport.objects.filter(
-        patient_id__in=doctor_patients, created_at__gte=one_hour_ago, overall_status__in=['normal', 'abnormal']
-    ).select_related('patient__user').prefetch_related('test_sections').order_by('-created_at')[:3]
-    
-    for report in new_lab_reports:
-        time_since = now - report.created_at
-        total_minutes = int(time_since.total_seconds() / 60)
-        hours_ago = int(time_since.total_seconds() / 3600)
-        if total_minutes < 1:
-            time_text = "Just now"
-        elif total_minutes < 60:
-            time_text = f"{total_minutes} min ago"
-        elif hours_ago < 24:
-            time_text = f"{hours_ago} hr ago" if hours_ago > 1 else "1 hr ago"
-        else:
-            time_text = "Yesterday"
-        
-        # ✅ Get test name from test_sections
-        test_sections = report.test_sections.all()
-        if test_sections.exists():
-            if test_sections.count() == 1:
-                test_name = test_sections.first().get_test_name()
-            else:
-                test_name = f"{test_sections.count()} tests"
-        else:
-            test_name = "lab report"
-        
-        notifications.append({
-            'id': f'lab-new-{report.id}',
-            'type': 'lab',
-            'message': f"New Lab Result: {report.patient.user.get_full_name() or report.patient.user.username} - {test_name}",
-            'time': time_text,
-            'priority': 'medium'
-        })
-    
-    # Type 5: Recently completed appointments (last 1 hour)
-    recent_completed_notif = Appointment.objects.filter(
-        doctor=profile, status='completed', updated_at__gte=one_hour_ago
-    ).select_related('patient__user').order_by('-updated_at')[:3]
-    
-    for apt in recent_completed_notif:
-        time_diff = now - apt.updated_at
+        time_diff = apt.scheduled_at - now
         minutes = int(time_diff.total_seconds() / 60)
         if minutes < 1:
-            time_text = "Just now"
+            time_text = "Starting now"
         elif minutes < 60:
-            time_text = f"{minutes} min ago"
+            time_text = f"in {minutes} min"
         else:
-            time_text = f"{int(minutes / 60)} hr ago"
+            time_text = f"in {int(minutes / 60)} hour"
+        priority = 'high' if minutes < 15 else 'medium' if minutes < 30 else 'low'
         notifications.append({
-            'id': f'completed-{apt.id}',
-            'type': 'appointment',
-            'message': f"Completed: {apt.patient.user.get_full_name() or apt.patient.user.username}",
+            'id': f'upcoming-{apt.id}',
+            'type': 'appointment_upcoming',
+            'title': '',
+            'message': f"Upcoming: {apt.patient.user.get_full_name() or apt.patient.user.username}",
             'time': time_text,
-            'priority': 'low'
+            'priority': priority,
+            'is_read': False,
         })
     
-    # Type 6: Shared consultations (last 1 hour — auto-disappears like other notifications)
-    shared_with_me = SharedConsultation.objects.filter(
-        shared_with=profile,
-        shared_at__gte=one_hour_ago,
-        is_read=False
-    ).select_related('shared_by__user', 'consultation__patient__user').order_by('-shared_at')[:5]
-    
-    for shared in shared_with_me:
-        time_since = now - shared.shared_at
-        total_minutes = int(time_since.total_seconds() / 60)
-        hours_ago = int(time_since.total_seconds() / 3600)
-        if total_minutes < 1:
-            time_text = "Just now"
-        elif total_minutes < 60:
-            time_text = f"{total_minutes} min ago"
-        elif hours_ago < 24:
-            time_text = f"{hours_ago} hr ago" if hours_ago > 1 else "1 hr ago"
-        else:
-            time_text = "Yesterday"
-        
-        sharer_name = shared.shared_by.user.get_full_name() or shared.shared_by.user.username
-        patient_name = shared.consultation.patient.user.get_full_name() or shared.consultation.patient.user.username
-        message_preview = f' — "{shared.message[:40]}..."' if shared.message and len(shared.message) > 40 else (f' — "{shared.message}"' if shared.message else '')
-        
-        notifications.append({
-            'id': f'shared-{shared.id}',
-            'type': 'shared',
-            'message': f"📋 Dr. {sharer_name} shared a consultation | Patient: {patient_name}{message_preview}",
-            'time': time_text,
-            'priority': 'medium'
-        })
+    # Bookings, lab results, completions and shared consultations (last 1 hour)
+    notifications += [
+        serialize_notification(notification, now)
+        for notification in latest_notifications(request.user, one_hour_ago, 10)
+    ]
     
     priority_order = {'high': 0, 'medium': 1, 'low': 2}
     notifications.sort(key=lambda x: priority_order[x['priority']])
@@ -441,6 +302,15 @@ def doctor_overview(request):
     })
 
 
+@login_required
+async def doctor_events(request):
+    """Server-Sent Events stream telling the dashboard what to refetch"""
+    user = await request.auser()
+    if not await DoctorProfile.objects.filter(user=user).aexists():
+        return JsonResponse({"error": "Doctor profile not found"}, status=404)
+    return event_stream_response(request, user)
+
+
 @login_required
 def get_patient_details(request, patient_id):
     try:
@@ -472,7 +342,7 @@ def get_patient_details(request, patient_id):
             'totalVisits': appointments_count,
             'lastVisit': last_visit or 'First visit',
             'status': 'Active' if patient.is_active else 'Inactive',
-            'profilePhoto': request.build_absolute_uri(patient.profile_photo.url) if patient.profile_photo else None,
+            'profilePhoto': image_url(request, patient, 'profile_photo', 'thumb') if patient.profile_photo else None,
         })
     except PatientProfile.DoesNotExist:
         return JsonResponse({"error": "Patient not found"}, status=404)
@@ -505,11 +375,7 @@ def get_doctor_appointments(request):
             appointments = appointments.filter(status=status_filter)
     
     if search_query:
-        appointments = appointments.filter(
-            Q(patient__user__first_name__icontains=search_query) |
-            Q(patient__user__last_name__icontains=search_query) |
-            Q(patient__patient_id__icontains=search_query)
-        )
+        appointments = appointments.filter(patient_search_q(search_query))
     
     appointments_list = []
     for apt in appointments:
@@ -518,7 +384,7 @@ def get_doctor_appointments(request):
         ).order_by('-appointment_date').first()
         profile_photo = None
         if apt.patient.profile_photo:
-            profile_photo = request.build_absolute_uri(apt.patient.profile_photo.url)
+            profile_photo = image_url(request, apt.patient, 'profile_photo', 'thumb')
         appointments_list.append({
             'id': apt.id,
             'patientName': apt.patient.user.get_full_name() or apt.patient.user.username,
@@ -538,15 +404,18 @@ def get_doctor_appointments(request):
             'profilePhoto': profile_photo,
         })
     
-    total_today = Appointment.objects.filter(doctor=profile, appointment_date=filter_date).count()
-    scheduled = Appointment.objects.filter(doctor=profile, appointment_date=filter_date, status__in=['pending', 'confirmed']).count()
-    completed = Appointment.objects.filter(doctor=profile, appointment_date=filter_date, status='completed').count()
-    missed = Appointment.objects.filter(doctor=profile, appointment_date=filter_date, status='missed').count()
-    cancelled = Appointment.objects.filter(doctor=profile, appointment_date=filter_date, status='cancelled').count()
+    stats = count_buckets(
+        Appointment.objects.filter(doctor=profile, appointment_date=filter_date),
+        total=Q(),
+        scheduled=Q(status__in=['pending', 'confirmed']),
+        completed=Q(status='completed'),
+        missed=Q(status='missed'),
+        cancelled=Q(status='cancelled'),
+    )
     
     return JsonResponse({
         'appointments': appointments_list,
-        'stats': {'total': total_today, 'scheduled': scheduled, 'completed': completed, 'missed': missed, 'cancelled': cancelled}
+        'stats': stats
     })
 
 
@@ -566,6 +435,7 @@ def mark_appointment_complete(request, appointment_id):
             return JsonResponse({"error": "Cannot complete a cancelled appointment"}, status=400)
         appointment.status = 'completed'
         appointment.save()
+        notify_appointment_completed(appointment)
         return JsonResponse({"success": True, "message": "Appointment marked as completed"})
     except Appointment.DoesNotExist:
         return JsonResponse({"error": "Appointment not found"}, status=404)
@@ -646,12 +516,13 @@ def get_doctor_prescriptions(request):
         })
     
     # ✅ UPDATED: Stats for selected date only
-    stats = {
-        'total': Prescription.objects.filter(doctor=profile, prescribed_date=filter_date).count(),
-        'active': Prescription.objects.filter(doctor=profile, prescribed_date=filter_date, status='active').count(),
-        'completed': Prescription.objects.filter(doctor=profile, prescribed_date=filter_date, status='completed').count(),
-        'expired': Prescription.objects.filter(doctor=profile, prescribed_date=filter_date, status='expired').count(),
-    }
+    stats = count_buckets(
+        Prescription.objects.filter(doctor=profile, prescribed_date=filter_date),
+        total=Q(),
+        active=Q(status='active'),
+        completed=Q(status='completed'),
+        expired=Q(status='expired'),
+    )
     
     return JsonResponse({'prescriptions': prescriptions_list, 'stats': stats})
 
@@ -718,6 +589,8 @@ def create_prescription(request):
                 duration=med.get('duration'), instructions=med.get('instructions', '')
             )
         
+        notify_prescription(prescription)
+        
         return JsonResponse({
             "success": True, "message": "Prescription created successfully",
             "prescription_id": prescription.id, "prescription_number": prescription.prescription_number
@@ -827,12 +700,13 @@ def get_doctor_lab_reports(request):
     # ✅ UPDATED: Stats for selected date only
     return JsonResponse({
         'reports': reports_list,
-        'stats': {
-            'total': LabReport.objects.filter(patient_id__in=patient_ids, test_date=filter_date).count(),
-            'normal': LabReport.objects.filter(patient_id__in=patient_ids, test_date=filter_date, overall_status='normal').count(),
-            'abnormal': LabReport.objects.filter(patient_id__in=patient_ids, test_date=filter_date, overall_status='abnormal').count(),
-            'critical': LabReport.objects.filter(patient_id__in=patient_ids, test_date=filter_date, overall_status='critical').count(),
-        }
+        'stats': count_buckets(
+            LabReport.objects.filter(patient_id__in=patient_ids, test_date=filter_date),
+            total=Q(),
+            normal=Q(overall_status='normal'),
+            abnormal=Q(overall_status='abnormal'),
+            critical=Q(overall_status='critical'),
+        )
     })
 
 
@@ -973,6 +847,7 @@ def get_doctor_consultations(request):
         SharedConsultation.objects.filter(
             shared_with=profile, is_read=False
         ).update(is_read=True)
+        mark_read(request.user, 'shared_consultation')
 
         for record in shared_records_list:
             c = record.consultation
@@ -1104,31 +979,68 @@ def get_doctor_consultations(request):
         except:
             filter_date = timezone.now().date()
         
-        total = ConsultationHistory.objects.filter(doctor=profile, consultation_date=filter_date).count()
-        this_week = ConsultationHistory.objects.filter(doctor=profile, consultation_date=filter_date).count()
-        follow_ups = ConsultationHistory.objects.filter(doctor=profile, consultation_date=filter_date, consultation_type='follow_up').count()
-        new_visits = ConsultationHistory.objects.filter(doctor=profile, consultation_date=filter_date, consultation_type='new_visit').count()
+        counts = count_buckets(
+            ConsultationHistory.objects.filter(doctor=profile, consultation_date=filter_date),
+            total=Q(),
+            this_week=Q(),
+            follow_ups=Q(consultation_type='follow_up'),
+            new_visits=Q(consultation_type='new_visit'),
+        )
     else:
-        total = ConsultationHistory.objects.filter(doctor=profile).count()
         week_ago = timezone.now().date() - timedelta(days=7)
-        this_week = ConsultationHistory.objects.filter(doctor=profile, consultation_date__gte=week_ago).count()
-        follow_ups = ConsultationHistory.objects.filter(doctor=profile, consultation_type='follow_up').count()
-        new_visits = ConsultationHistory.objects.filter(doctor=profile, consultation_type='new_visit').count()
+        counts = count_buckets(
+            ConsultationHistory.objects.filter(doctor=profile),
+            total=Q(),
+            this_week=Q(consultation_date__gte=week_ago),
+            follow_ups=Q(consultation_type='follow_up'),
+            new_visits=Q(consultation_type='new_visit'),
+        )
 
     shared_count = SharedConsultation.objects.filter(shared_with=profile).count()
 
     return JsonResponse({
         'consultations': consultations_list,
         'stats': {
-            'total': total,
-            'this_week': this_week,
-            'follow_ups': follow_ups,
-            'new_visits': new_visits,
+            **counts,
             'shared': shared_count,
         }
     })
 
 
+@login_required
+def search_clinical_records(request):
+    """
+    Full-text search across the doctor's consultations, prescriptions and lab
+    reports (own, shared with them, or of their patients), best match first.
+    ?type= narrows to one of consultation / prescription / lab_report.
+    """
+    try:
+        profile = request.user.doctorprofile
+    except DoctorProfile.DoesNotExist:
+        return JsonResponse({"error": "Doctor profile not found"}, status=404)
+
+    query = request.GET.get('q', '').strip()
+    record_type = request.GET.get('type', 'all')
+    kinds = None if record_type == 'all' else [record_type]
+
+    results = []
+    for document in search_records(profile, query, kinds=kinds):
+        patient_user = document.patient.user
+        results.append({
+            'type': document.kind,
+            'id': document.object_id,
+            'recordNumber': document.record_number,
+            'patientName': patient_user.get_full_name() or patient_user.username,
+            'patientId': document.patient.patient_id,
+            'date': document.record_date.isoformat(),
+            'title': document.heading,
+            'summary': document.body[:200],
+            'isOwn': document.doctor_id == profile.id,
+        })
+
+    return JsonResponse({'results': results, 'count': len(results)})
+
+
 @login_required
 @csrf_protect
 @require_http_methods(["POST"])
@@ -1192,6 +1104,8 @@ def create_consultation(request):
             notes=data.get('notes', '')
         )
         
+        notify_consultation(consultation)
+        
         return JsonResponse({
             "success": True, "message": "Consultation note created successfully",
             "consultation_id": consultation.id, "consultation_number": consultation.consultation_number
@@ -1270,7 +1184,7 @@ def get_doctors_list_for_share(request):
     doctors_list = []
     for doctor in doctors:
         full_name = doctor.user.get_full_name() or doctor.user.username
-        photo_url = request.build_absolute_uri(doctor.profile_photo.url) if doctor.profile_photo else None
+        photo_url = image_url(request, doctor, 'profile_photo', 'thumb') if doctor.profile_photo else None
         doctors_list.append({
             'id': doctor.id,
             'name': f"Dr. {full_name}",
@@ -1324,6 +1238,8 @@ def share_consultation(request, consultation_id):
         if not created:
             return JsonResponse({"error": "Already shared with this doctor"}, status=400)
 
+        notify_shared_consultation(shared)
+
         target_name = target_doctor.user.get_full_name() or target_doctor.user.username
         return JsonResponse({
             "success": True,
@@ -1485,7 +1401,7 @@ def get_doctor_profile(request):
     except DoctorProfile.DoesNotExist:
         return JsonResponse({"error": "Doctor profile not found"}, status=404)
     
-    photo_url = request.build_absolute_uri(profile.profile_photo.url) if profile.profile_photo else None
+    photo_url = image_url(request, profile, 'profile_photo', 'medium') if profile.profile_photo else None
     member_since = profile.created_at.strftime('%B %Y')
     last_updated = 'Today' if profile.updated_at.date() == timezone.now().date() else profile.updated_at.strftime('%B %d, %Y')
     
@@ -1573,7 +1489,7 @@ def upload_doctor_photo(request):
     profile.save()
     return JsonResponse({
         "success": True, "message": "Photo uploaded successfully",
-        "photo_url": request.build_absolute_uri(profile.profile_photo.url)
+        "photo_url": image_url(request, profile, 'profile_photo', 'medium')
     })
 
 
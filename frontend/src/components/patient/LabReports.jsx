@@ -16,6 +16,7 @@ import {
   MdChevronLeft,
   MdChevronRight
 } from 'react-icons/md';
+import { fetchExport } from '../../utils/exports';
 import '../../styles/patient/LabReports.css';
 
 const LabReports = () => {
@@ -127,9 +128,8 @@ const LabReports = () => {
     }
 
     try {
-      const response = await fetch(
-        `http://localhost:8000/patient/lab-reports/${report.id}/download/`,
-        { credentials: 'include' }
+      const response = await fetchExport(
+        `http://localhost:8000/patient/lab-reports/${report.id}/download/`
       );
 
       if (response.ok) {
@@ -574,7 +574,7 @@ const LabReports = () => {
                       <div key={index} className="file-item">
                         {attachment.type === 'image' ? (
                           <div className="file-preview-image" onClick={() => window.open(attachment.url, '_blank')}>
-                            <img src={attachment.url} alt={attachment.filename || 'Lab Report Image'} />
+                            <img src={attachment.previewUrl || attachment.url} alt={attachment.filename || 'Lab Report Image'} />
                             <div className="file-overlay">
                               <MdVisibility size={24} />
                               <span>Click to view</span>
@@ -14,6 +14,7 @@ import {
   MdChevronLeft,
   MdChevronRight
 } from 'react-icons/md';
+import { fetchExport } from '../../utils/exports';
 import '../../styles/patient/Prescriptions.css';
 
 const Prescriptions = () => {
@@ -119,9 +120,8 @@ const Prescriptions = () => {
   const handleDownload = async (prescription) => {
     setDownloadingId(prescription.id);
     try {
-      const response = await fetch(
-        `http://localhost:8000/patient/prescriptions/${prescription.id}/download/`,
-        { credentials: 'include' }
+      const response = await fetchExport(
+        `http://localhost:8000/patient/prescriptions/${prescription.id}/download/`
       );
 
       if (response.ok) {
@@ -9,7 +9,8 @@ import {
   MdSave,
   MdCancel,
   MdCamera,
-  MdCheckCircle
+  MdCheckCircle,
+  MdDownload
 } from 'react-icons/md';
 import { FaTransgender, FaTint } from 'react-icons/fa';
 import { getCSRFToken } from '../../utils/csrf';
@@ -177,10 +178,16 @@ const Profile = () => {
           <p>Manage your personal information</p>
         </div>
         {!isEditing ? (
-          <button className="btn-edit" onClick={handleEdit}>
-            <MdEdit size={18} />
-            Edit Profile
-          </button>
+          <div className="edit-actions">
+            <a className="btn-cancel btn-records" href="http://localhost:8000/patient/records/export/">
+              <MdDownload size={18} />
+              Download All Records
+            </a>
+            <button className="btn-edit" onClick={handleEdit}>
+              <MdEdit size={18} />
+              Edit Profile
+            </button>
+          </div>
         ) : (
           <div className="edit-actions">
             <button className="btn-cancel" onClick={handleCancel}>
@@ -321,7 +321,8 @@ const PharmacyStock = () => {
             'Content-Type': 'application/json',
             'X-CSRFToken': getCookie('csrftoken'),
           },
-          body: JSON.stringify(formData)
+          // The stock the form was loaded with, so a dispense since then is not overwritten
+          body: JSON.stringify({ ...formData, expected_quantity: selectedMedicine.quantity })
         }
       );
 
@@ -330,6 +331,11 @@ const PharmacyStock = () => {
         alert(data.message);
         setShowEditModal(false);
         fetchMedicines();
+      } else if (response.status === 409) {
+        const errorData = await response.json();
+        alert(errorData.error);
+        handleEditMedicine(selectedMedicine);
+        fetchMedicines();
       } else {
         const errorData = await response.json();
         alert(`Failed: ${errorData.error || 'Unknown error'}`);
@@ -0,0 +1,28 @@
+const API_BASE = 'http://localhost:8000';
+const POLL_INTERVAL_MS = 1000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Fetch a PDF download. When the server answers 202 it is rendering the file
+// in the background: poll the export job until it is done, then fetch the file.
+export const fetchExport = async (url) => {
+  const response = await fetch(url, { credentials: 'include' });
+  if (response.status !== 202) {
+    return response;
+  }
+
+  let { job } = await response.json();
+  while (job.status === 'queued' || job.status === 'running') {
+    await sleep(POLL_INTERVAL_MS);
+    const statusResponse = await fetch(`${API_BASE}${job.statusUrl}`, { credentials: 'include' });
+    if (!statusResponse.ok) {
+      return statusResponse;
+    }
+    ({ job } = await statusResponse.json());
+  }
+
+  if (job.status !== 'done') {
+    return new Response(null, { status: 500, statusText: job.error || 'Export failed' });
+  }
+  return fetch(`${API_BASE}${job.downloadUrl}`, { credentials: 'include' });
+};
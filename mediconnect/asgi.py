@@ -3,6 +3,10 @@ ASGI config for mediconnect project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve the live dashboard event streams (*/events/, see notifications.events)
+through it, e.g. ``uvicorn mediconnect.asgi:application``. Under WSGI those
+endpoints answer 204 and the dashboards fall back to polling.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
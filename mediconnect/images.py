@@ -0,0 +1,163 @@
+"""
+Resized copies of uploaded images.
+
+Models list their image fields in IMAGE_DERIVATIVES, e.g.
+
+    IMAGE_DERIVATIVES = {
+        'profile_photo': {'thumb': 'profile_photo_thumb', 'medium': 'profile_photo_medium'},
+    }
+
+and mix in ImageDerivativesMixin. After a save that changed the source image,
+the derivatives are generated with Pillow on a background thread once the
+transaction commits, and stored in the listed fields. Until they exist,
+image_url() falls back to the original upload.
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+
+# size name -> (bounding box, format, quality)
+DERIVATIVE_SIZES = {
+    'thumb': ((128, 128), 'WEBP', 80),      # list avatars
+    'medium': ((640, 640), 'WEBP', 82),     # profile pages, attachment previews
+    'pdf': ((1600, 1600), 'JPEG', 80),      # embedded in PDFs; ReportLab passes JPEG through as-is
+}
+
+FORMAT_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-derivatives')
+
+
+def derivative_name(source_name, size):
+    stem, _ = os.path.splitext(source_name)
+    return f"derivatives/{stem}_{size}.{FORMAT_EXTENSIONS[DERIVATIVE_SIZES[size][1]]}"
+
+
+def image_url(request, instance, field, size):
+    """
+    Absolute URL of the `size` derivative of `instance.<field>`, or of the
+    original upload while the derivative is not ready. None without an image.
+    """
+    source = getattr(instance, field)
+    if not source:
+        return None
+    target = instance.image_derivative_sources().get(field, {}).get(size)
+    derived = getattr(instance, target) if target else None
+    if derived and derived.name == derivative_name(source.name, size):
+        return request.build_absolute_uri(derived.url)
+    return request.build_absolute_uri(source.url)
+
+
+def image_path(instance, field, size):
+    """Filesystem path of a ready derivative, falling back to the original."""
+    source = getattr(instance, field)
+    target = instance.image_derivative_sources().get(field, {}).get(size)
+    derived = getattr(instance, target) if target else None
+    if derived and derived.name == derivative_name(source.name, size):
+        return derived.path
+    return source.path
+
+
+def render_derivative(fileobj, size):
+    box, image_format, quality = DERIVATIVE_SIZES[size]
+    with Image.open(fileobj) as img:
+        # Let the JPEG decoder downscale while decoding large photos
+        img.draft('RGB', (box[0] * 2, box[1] * 2))
+        img = ImageOps.exif_transpose(img)
+        if image_format == 'JPEG':
+            img = img.convert('RGB')
+        elif img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        img.thumbnail(box, Image.LANCZOS)
+
+        out = io.BytesIO()
+        img.save(out, image_format, quality=quality, optimize=True)
+        return out.getvalue()
+
+
+def generate_image_derivatives(instance):
+    """
+    Write missing or stale derivatives for `instance` and store their names
+    with a single UPDATE (so save() and its hooks do not run again).
+    """
+    model = type(instance)
+    updates = {}
+
+    for field, targets in instance.image_derivative_sources().items():
+        source = getattr(instance, field)
+        for size, target in targets.items():
+            current = getattr(instance, target)
+            if not source:
+                if current:
+                    current.storage.delete(current.name)
+                    updates[target] = None
+                continue
+
+            name = derivative_name(source.name, size)
+            if current and current.name == name:
+                continue
+            if current:
+                current.storage.delete(current.name)
+
+            with source.open('rb') as fileobj:
+                data = render_derivative(fileobj, size)
+            storage = current.storage
+            storage.delete(name)
+            updates[target] = storage.save(name, ContentFile(data))
+
+    if updates:
+        model._default_manager.filter(pk=instance.pk).update(**updates)
+        for target, name in updates.items():
+            setattr(instance, target, name)
+    return updates
+
+
+def _generate_in_background(model_label, pk):
+    close_old_connections()
+    try:
+        instance = apps.get_model(model_label)._default_manager.filter(pk=pk).first()
+        if instance is not None:
+            generate_image_derivatives(instance)
+    except Exception:
+        logger.exception("Generating image derivatives for %s %s failed", model_label, pk)
+    finally:
+        close_old_connections()
+
+
+def needs_image_derivatives(instance):
+    for field, targets in instance.image_derivative_sources().items():
+        source = getattr(instance, field)
+        for size, target in targets.items():
+            current = getattr(instance, target)
+            expected = derivative_name(source.name, size) if source else None
+            if (current.name or None) != expected:
+                return True
+    return False
+
+
+def schedule_image_derivatives(instance):
+    if not needs_image_derivatives(instance):
+        return
+    label = instance._meta.label
+    pk = instance.pk
+    transaction.on_commit(lambda: _executor.submit(_generate_in_background, label, pk))
+
+
+class ImageDerivativesMixin:
+    IMAGE_DERIVATIVES = {}
+
+    def image_derivative_sources(self):
+        return self.IMAGE_DERIVATIVES
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        schedule_image_derivatives(self)
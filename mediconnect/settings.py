@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     'doctors',
     'staff',
     'pharmacy',
+    'notifications',
 ]
 
 AUTHENTICATION_BACKENDS = [
@@ -120,6 +121,15 @@ DATABASES = {
     }
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    # Take the write lock when a transaction starts. A deferred transaction
+    # that reads and then writes (booking a slot, fulfilling a prescription)
+    # fails with "database is locked" instead of waiting its turn.
+    DATABASES['default']['OPTIONS'] = {'transaction_mode': 'IMMEDIATE', 'timeout': 20}
+    # The concurrency tests open several connections at once, which an
+    # in-memory test database cannot serve
+    DATABASES['default']['TEST'] = {'NAME': BASE_DIR / 'test_db.sqlite3'}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -141,6 +151,15 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Rendered PDFs (patient data - keep outside MEDIA_ROOT so it is never served)
+PDF_CACHE_DIR = BASE_DIR / 'cache' / 'pdf'
+
+# Processes rendering PDF export jobs (patients.exports), kept off the request workers
+EXPORT_WORKERS = 2
+
+# Unclaimed pre-generated profile IDs kept per prefix by refill_profile_ids
+PROFILE_ID_POOL_SIZE = 500
+
 # Django Allauth settings
 SOCIALACCOUNT_LOGIN_ON_GET = True
 LOGIN_REDIRECT_URL = '/accounts/google-redirect/'
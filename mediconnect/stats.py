@@ -0,0 +1,21 @@
+from django.db.models import Count
+
+
+def count_buckets(queryset, **buckets):
+    """
+    Count several filtered subsets of `queryset` in a single query.
+
+        count_buckets(
+            Appointment.objects.filter(patient=profile),
+            total=Q(),
+            completed=Q(status='completed'),
+        )
+        # -> {'total': 12, 'completed': 7}
+
+    An empty Q() counts every row of the queryset.
+    """
+    return queryset.order_by().aggregate(**{
+        name: Count('pk', filter=condition) if condition else Count('pk')
+        for name, condition in buckets.items()
+    })
+
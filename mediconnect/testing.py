@@ -0,0 +1,35 @@
+"""
+Helpers for tests that race threads against the database.
+
+Each thread uses its own database connection, so these need a
+TransactionTestCase and a test database other connections can open
+(see DATABASES in settings).
+"""
+import threading
+
+from django.db import connection
+
+
+def run_concurrently(target, threads):
+    """
+    Call target(index) from `threads` threads released at the same moment.
+    Returns each call's result, or the exception it raised, in index order.
+    """
+    barrier = threading.Barrier(threads)
+    results = [None] * threads
+
+    def run(index):
+        barrier.wait()
+        try:
+            results[index] = target(index)
+        except Exception as e:
+            results[index] = e
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=run, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return results
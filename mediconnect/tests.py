@@ -0,0 +1,57 @@
+from datetime import date, time, timedelta
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.test import TestCase
+
+from doctors.models import Appointment, DoctorProfile
+from patients.models import PatientProfile
+
+from .stats import count_buckets
+
+
+class CountBucketsTests(TestCase):
+    STATUSES = {'pending': 3, 'confirmed': 2, 'completed': 4, 'cancelled': 1}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = PatientProfile.objects.create(user=User.objects.create(username='pat'))
+        doctor = DoctorProfile.objects.create(user=User.objects.create(username='doc'), specialization='cardiology')
+        day = date.today() + timedelta(days=2)
+        slot = 0
+        for status, count in cls.STATUSES.items():
+            for _ in range(count):
+                Appointment.objects.create(
+                    patient=cls.patient, doctor=doctor, appointment_date=day,
+                    appointment_time=time(9 + slot // 4, slot % 4 * 15),
+                    appointment_type='consultation', reason='Checkup', status=status,
+                )
+                slot += 1
+
+    def test_counts_every_bucket_in_one_query(self):
+        with self.assertNumQueries(1):
+            stats = count_buckets(
+                Appointment.objects.filter(patient=self.patient),
+                total=Q(),
+                upcoming=Q(status__in=['pending', 'confirmed']),
+                completed=Q(status='completed'),
+                cancelled=Q(status='cancelled'),
+                missed=Q(status='missed'),
+            )
+        self.assertEqual(stats, {'total': 10, 'upcoming': 5, 'completed': 4, 'cancelled': 1, 'missed': 0})
+
+    def test_query_count_does_not_grow_with_buckets(self):
+        buckets = {f'status_{status}': Q(status=status) for status, _ in Appointment.STATUS_CHOICES}
+        with self.assertNumQueries(1):
+            stats = count_buckets(Appointment.objects.all(), **buckets)
+        for status, count in self.STATUSES.items():
+            self.assertEqual(stats[f'status_{status}'], count)
+
+    def test_patient_appointments_stats_are_one_aggregate(self):
+        self.client.force_login(self.patient.user)
+        # Session, user, profile, the appointment list and the stats
+        with self.assertNumQueries(5):
+            response = self.client.get('/patient/appointments/')
+        self.assertEqual(response.json()['stats'], {
+            'total': 10, 'upcoming': 5, 'completed': 4, 'cancelled': 1, 'missed': 0, 'needs_rescheduling': 0,
+        })
@@ -28,6 +28,7 @@ urlpatterns = [
     path('doctor/', include('doctors.urls')),
     path('pharmacy/', include('pharmacy.urls')),
     path('staff/', include('staff.urls')),
+    path('notifications/', include('notifications.urls')),
 ]
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
@@ -0,0 +1,16 @@
+from django.contrib import admin
+from .models import EmailOutbox, Notification
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject', 'last_error')
+
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('user', 'kind', 'priority', 'is_read', 'created_at')
+    list_filter = ('kind', 'priority', 'is_read')
+    search_fields = ('user__username', 'message')
@@ -0,0 +1,218 @@
+"""
+Live change events for the dashboards, sent as Server-Sent Events.
+
+Model signals publish small events ({"type": ..., "id": ...}) once the
+surrounding transaction commits. Publishing writes a ChangeEvent row, so an
+event raised in any process (a web worker, run_scheduler, a management
+command) reaches the streams held by every other one. Each open SSE
+connection subscribes to its user's channel and, for staff and pharmacy, to
+a role channel, so the frontend only refetches a list when something in it
+changed instead of polling.
+
+A process with open streams runs one relay thread, which reads the new
+ChangeEvent rows every RELAY_POLL_SECONDS and hands them to the in-process
+broker. The broker fans them out to the subscribed connections. This is one
+query per process, however many connections it holds. purge_change_events
+deletes the rows once every relay has read them.
+
+The streams need an ASGI server, where an idle connection is only a
+coroutine and a queue:
+
+    uvicorn mediconnect.asgi:application --workers 2
+
+Under WSGI (runserver, wsgi.py) a stream would hold a worker for as long as
+it stays open. So there the endpoints answer 204 No Content, which tells
+EventSource not to reconnect, and the dashboards keep polling.
+"""
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .models import ChangeEvent
+
+
+HEARTBEAT_SECONDS = 20
+
+RELAY_POLL_SECONDS = 1
+# How far back each relay poll looks. A row can become visible a little
+# after its created_at (the INSERT commits later, clocks differ between
+# hosts), so relays re-read this window and skip the ids they have seen.
+RELAY_WINDOW = timedelta(seconds=10)
+
+# Events buffered per connection; a client that falls this far behind gets a
+# single "resync" event and refetches everything
+EVENT_QUEUE_SIZE = 50
+
+
+def user_channel(user_id):
+    return f"user:{user_id}"
+
+
+def role_channel(role):
+    return f"role:{role}"
+
+
+class EventBroker:
+    """Fan events out to asyncio queues from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, channels):
+        subscription = (asyncio.get_running_loop(), asyncio.Queue(maxsize=EVENT_QUEUE_SIZE))
+        with self._lock:
+            for channel in channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, channels, subscription):
+        with self._lock:
+            for channel in channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_put, queue, event)
+            except RuntimeError:
+                # Loop already closed - the connection is going away
+                pass
+
+    def connection_count(self):
+        with self._lock:
+            return len({sub for subs in self._subscribers.values() for sub in subs})
+
+
+class EventRelay:
+    """
+    Thread reading new ChangeEvent rows into `broker`. It runs while the
+    process has open streams.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def ensure_running(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='event-relay', daemon=True)
+                self._thread.start()
+
+    def is_running(self):
+        with self._lock:
+            return self._thread is not None
+
+    def _should_stop(self):
+        # Checked under the lock, so a stream that subscribes meanwhile
+        # either keeps this thread running or starts a new one
+        with self._lock:
+            if self.broker.connection_count():
+                return False
+            self._thread = None
+            return True
+
+    def _run(self):
+        started = timezone.now()
+        seen = {}  # id -> created_at of rows relayed within the window
+        try:
+            while not self._should_stop():
+                try:
+                    self.poll(started, seen)
+                except Exception:
+                    # The database went away; streams stay open and catch up
+                    connection.close()
+                time.sleep(RELAY_POLL_SECONDS)
+        finally:
+            connection.close()
+
+    def poll(self, started, seen):
+        since = max(started, timezone.now() - RELAY_WINDOW)
+        rows = ChangeEvent.objects.filter(created_at__gte=since).values_list('id', 'channel', 'payload', 'created_at')
+        for event_id, channel, payload, created_at in rows:
+            if event_id not in seen:
+                seen[event_id] = created_at
+                self.broker.publish(channel, payload)
+        for event_id, created_at in list(seen.items()):
+            if created_at < since:
+                del seen[event_id]
+
+
+def _put(queue, event):
+    if queue.full():
+        while not queue.empty():
+            queue.get_nowait()
+        event = {'type': 'resync'}
+    queue.put_nowait(event)
+
+
+broker = EventBroker()
+relay = EventRelay(broker)
+
+
+def publish(channel, event):
+    """Publish `event` to every process once the current transaction (if any) commits."""
+    transaction.on_commit(lambda: ChangeEvent.objects.create(channel=channel, payload=event), robust=True)
+
+
+def purge_change_events(older_than=timedelta(hours=1)):
+    """Delete change events every relay has read. Returns the number deleted."""
+    deleted, _ = ChangeEvent.objects.filter(created_at__lt=timezone.now() - older_than).delete()
+    return deleted
+
+
+def publish_to_user(user_id, event_type, object_id=None, **data):
+    publish(user_channel(user_id), {'type': event_type, 'id': object_id, **data})
+
+
+def publish_to_role(role, event_type, object_id=None, **data):
+    publish(role_channel(role), {'type': event_type, 'id': object_id, **data})
+
+
+def _format(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def _stream(channels):
+    subscription = broker.subscribe(channels)
+    relay.ensure_running()
+    queue = subscription[1]
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            yield _format(event)
+    finally:
+        broker.unsubscribe(channels, subscription)
+
+
+def event_stream_response(request, user, roles=()):
+    if not isinstance(request, ASGIRequest):
+        # Served by WSGI: an open stream would hold the worker for good
+        return HttpResponse(status=204)
+    channels = [user_channel(user.id)] + [role_channel(role) for role in roles]
+    response = StreamingHttpResponse(_stream(channels), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,205 @@
+"""
+Per-user notification feed.
+
+The notify_* helpers are called where the event happens (booking, lab upload,
+prescription, ...) and write Notification rows, so the overview pages read
+their feed with one indexed query instead of re-deriving it on every load.
+"""
+from .models import Notification
+
+
+def display_name(user):
+    return user.get_full_name() or user.username
+
+
+def time_ago(past_datetime, now):
+    """Convert a past datetime to human readable 'X ago' string"""
+    total_seconds = int((now - past_datetime).total_seconds())
+
+    if total_seconds < 60:
+        return "Just now"
+    elif total_seconds < 3600:
+        return f"{total_seconds // 60} min ago"
+    elif total_seconds < 86400:
+        return f"{total_seconds // 3600} hr ago"
+    else:
+        days = total_seconds // 86400
+        return f"{days} day ago" if days == 1 else f"{days} days ago"
+
+
+def notify(user, kind, message, title='', priority='medium', object_id=None):
+    return Notification.objects.create(
+        user=user, kind=kind, title=title, message=message, priority=priority, object_id=object_id,
+    )
+
+
+def notify_many(notifications):
+    """Write several unsaved Notification rows with one INSERT."""
+    from .signals import publish_notification
+
+    created = Notification.objects.bulk_create(notifications)
+    # bulk_create() sends no post_save, so publish the live events here
+    for notification in created:
+        publish_notification(notification)
+    return created
+
+
+def latest_notifications(user, since, limit):
+    """The user's newest notifications created after `since`."""
+    return list(Notification.objects.filter(user=user, created_at__gte=since)[:limit])
+
+
+def serialize_notification(notification, now):
+    return {
+        'id': notification.id,
+        'type': notification.kind,
+        'title': notification.title,
+        'message': notification.message,
+        'priority': notification.priority,
+        'time': time_ago(notification.created_at, now),
+        'is_read': notification.is_read,
+    }
+
+
+def mark_read(user, kind, object_ids=None):
+    queryset = Notification.objects.filter(user=user, kind=kind, is_read=False)
+    if object_ids is not None:
+        queryset = queryset.filter(object_id__in=object_ids)
+    return queryset.update(is_read=True)
+
+
+# ─────────────────────────────────────────────
+# Events
+# ─────────────────────────────────────────────
+
+def notify_appointment_booked(appointment):
+    patient_name = display_name(appointment.patient.user)
+    apt_date = appointment.appointment_date.strftime('%b %d')
+    apt_time = appointment.appointment_time.strftime('%I:%M %p')
+    return notify(
+        appointment.doctor.user, 'appointment_booked',
+        f"New booking: {patient_name} on {apt_date} at {apt_time}",
+        object_id=appointment.id,
+    )
+
+
+def notify_appointment_completed(appointment):
+    return notify(
+        appointment.doctor.user, 'appointment_completed',
+        f"Completed: {display_name(appointment.patient.user)}",
+        priority='low', object_id=appointment.id,
+    )
+
+
+def notify_appointments_missed(appointments):
+    """Appointments need patient__user and doctor__user loaded."""
+    return notify_many([
+        Notification(
+            user=apt.patient.user,
+            kind='appointment_missed',
+            title='❌ Missed Appointment',
+            message=f"You missed your appointment with Dr. {apt.doctor.user.get_full_name()} "
+                    f"at {apt.appointment_time.strftime('%I:%M %p')}",
+            priority='high',
+            object_id=apt.id,
+        )
+        for apt in appointments
+    ])
+
+
+def notify_prescription(prescription):
+    return notify(
+        prescription.patient.user, 'prescription',
+        f"Dr. {prescription.doctor.user.get_full_name()} has issued a new prescription",
+        title='💊 New Prescription', object_id=prescription.id,
+    )
+
+
+def notify_consultation(consultation):
+    return notify(
+        consultation.patient.user, 'consultation',
+        f"Dr. {consultation.doctor.user.get_full_name()} has recorded your consultation",
+        title='🩺 Consultation Complete', object_id=consultation.id,
+    )
+
+
+def notify_shared_consultation(shared):
+    sharer_name = display_name(shared.shared_by.user)
+    patient_name = display_name(shared.consultation.patient.user)
+    if shared.message and len(shared.message) > 40:
+        message_preview = f' — "{shared.message[:40]}..."'
+    elif shared.message:
+        message_preview = f' — "{shared.message}"'
+    else:
+        message_preview = ''
+
+    return notify(
+        shared.shared_with.user, 'shared_consultation',
+        f"📋 Dr. {sharer_name} shared a consultation | Patient: {patient_name}{message_preview}",
+        object_id=shared.id,
+    )
+
+
+def lab_test_name(report):
+    sections = list(report.test_sections.all())
+    if len(sections) == 1:
+        return sections[0].get_test_name()
+    if sections:
+        return f"{len(sections)} tests"
+    return "lab report"
+
+
+def notify_lab_report(report):
+    """
+    Notify the patient, and every doctor the patient has seen, that a lab
+    report with test sections and overall status in place is ready.
+    """
+    from doctors.models import DoctorProfile
+
+    test_name = lab_test_name(report)
+    critical = report.overall_status == 'critical'
+    patient_name = display_name(report.patient.user)
+
+    notifications = [Notification(
+        user=report.patient.user,
+        kind='lab_report',
+        title='🧪 Lab Results Ready',
+        message=f"Your {test_name} results are now available",
+        priority='high' if critical else 'medium',
+        object_id=report.id,
+    )]
+
+    doctors = DoctorProfile.objects.filter(
+        appointments__patient=report.patient
+    ).distinct().select_related('user')
+    for doctor in doctors:
+        if critical:
+            message = f"⚠️ Critical Lab: {patient_name} - {test_name}"
+        else:
+            message = f"New Lab Result: {patient_name} - {test_name}"
+        notifications.append(Notification(
+            user=doctor.user,
+            kind='lab_report',
+            message=message,
+            priority='high' if critical else 'medium',
+            object_id=report.id,
+        ))
+
+    return notify_many(notifications)
+
+
+def notify_low_stock(schedule, level):
+    medicine_name = schedule.prescribed_medicine.medicine_name
+    if level == 'out':
+        title = '🚨 Medicine Out of Stock'
+        message = f"{medicine_name} is out of stock. Please refill."
+        priority = 'high'
+    else:
+        title = '⚠️ Low Medicine Stock'
+        message = f"{medicine_name} is running low ({schedule.remaining_quantity} left)"
+        priority = 'medium'
+
+    return notify(
+        schedule.prescription.patient.user, 'low_stock', message,
+        title=title, priority=priority, object_id=schedule.id,
+    )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from notifications.events import purge_change_events
+
+
+class Command(BaseCommand):
+    help = 'Delete live dashboard change events older than an hour'
+
+    def handle(self, *args, **kwargs):
+        deleted = purge_change_events()
+        self.stdout.write(self.style.SUCCESS(f" Deleted {deleted} change event(s)"))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from notifications.outbox import drain_outbox
+
+
+class Command(BaseCommand):
+    help = 'Send queued emails from the outbox over a single SMTP connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--loop', action='store_true', help='Keep polling the outbox instead of exiting when empty')
+        parser.add_argument('--interval', type=int, default=10, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            totals = drain_outbox(batch_size=options['batch_size'])
+
+            if totals['sent'] or totals['retried'] or totals['dead'] or not options['loop']:
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f" Sent {totals['sent']} email(s), "
+                        f"{totals['retried']} scheduled for retry, "
+                        f"{totals['dead']} dead-lettered"
+                    )
+                )
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
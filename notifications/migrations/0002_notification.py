@@ -0,0 +1,35 @@
+# Generated by Django 6.0 on 2026-10-18 04:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('appointment_booked', 'Appointment Booked'), ('appointment_completed', 'Appointment Completed'), ('appointment_missed', 'Appointment Missed'), ('lab_report', 'Lab Report'), ('prescription', 'Prescription'), ('consultation', 'Consultation'), ('shared_consultation', 'Shared Consultation'), ('low_stock', 'Low Medicine Stock')], max_length=30)),
+                ('title', models.CharField(blank=True, max_length=100)),
+                ('message', models.CharField(max_length=255)),
+                ('priority', models.CharField(choices=[('high', 'High'), ('medium', 'Medium'), ('low', 'Low')], default='medium', max_length=10)),
+                ('object_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('is_read', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', 'created_at'], name='notification_user_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,97 @@
+from django.db import models
+from django.conf import settings
+from django.utils import timezone
+
+
+class EmailOutbox(models.Model):
+    """Outgoing email, queued inside the business transaction and sent by send_queued_emails"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead'),  # gave up after max attempts
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    html_body = models.TextField(blank=True, null=True)
+    from_email = models.CharField(max_length=255, blank=True, null=True)
+    recipients = models.JSONField(default=list)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, null=True)
+
+    # Set while a worker owns the row so two workers never send it twice
+    locked_by = models.CharField(max_length=64, blank=True, null=True)
+    locked_until = models.DateTimeField(blank=True, null=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
+
+
+class Notification(models.Model):
+    """In-app notification, written when the event happens and read by the overview feeds"""
+    KIND_CHOICES = [
+        ('appointment_booked', 'Appointment Booked'),
+        ('appointment_completed', 'Appointment Completed'),
+        ('appointment_missed', 'Appointment Missed'),
+        ('lab_report', 'Lab Report'),
+        ('prescription', 'Prescription'),
+        ('consultation', 'Consultation'),
+        ('shared_consultation', 'Shared Consultation'),
+        ('low_stock', 'Low Medicine Stock'),
+    ]
+
+    PRIORITY_CHOICES = [
+        ('high', 'High'),
+        ('medium', 'Medium'),
+        ('low', 'Low'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    title = models.CharField(max_length=100, blank=True)
+    message = models.CharField(max_length=255)
+    priority = models.CharField(max_length=10, choices=PRIORITY_CHOICES, default='medium')
+
+    # id of the appointment/report/prescription/... the notification is about
+    object_id = models.PositiveIntegerField(blank=True, null=True)
+
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='notification_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} - {self.get_kind_display()}: {self.message}"
+
+
+class ChangeEvent(models.Model):
+    """Dashboard change event, relayed to the open event streams of every process (notifications.events)"""
+    channel = models.CharField(max_length=50)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['created_at'], name='changeevent_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.channel}: {self.payload}"
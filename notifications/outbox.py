@@ -0,0 +1,171 @@
+"""
+Transactional email outbox.
+
+queue_email() only inserts an EmailOutbox row, so it is cheap to call from a
+request and commits (or rolls back) together with the caller's transaction.
+drain_outbox() is the worker side: it claims due rows in batches and sends
+them over one reused SMTP connection, retrying failures with exponential
+backoff and dead-lettering rows that keep failing.
+"""
+import smtplib
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+
+MAX_ATTEMPTS = 5
+BASE_BACKOFF = timedelta(minutes=1)
+MAX_BACKOFF = timedelta(hours=1)
+LOCK_DURATION = timedelta(minutes=5)
+
+
+def outbox_email(subject, message, from_email, recipient_list, html_message=None):
+    """
+    Build an unsaved EmailOutbox row. Takes send_mail()'s arguments in the
+    same order; a from_email of None means DEFAULT_FROM_EMAIL.
+    """
+    return EmailOutbox(
+        subject=subject,
+        body=message or '',
+        html_body=html_message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        recipients=list(recipient_list),
+    )
+
+
+def queue_email(subject, message, from_email, recipient_list, html_message=None):
+    """Queue an email for the outbox worker. Arguments as for outbox_email()."""
+    email = outbox_email(subject, message, from_email, recipient_list, html_message=html_message)
+    email.save()
+    return email
+
+
+def queue_emails(emails):
+    """Queue several outbox_email() rows with one INSERT."""
+    return EmailOutbox.objects.bulk_create(emails)
+
+
+def backoff_for(attempts):
+    return min(BASE_BACKOFF * (2 ** (attempts - 1)), MAX_BACKOFF)
+
+
+def _claim_batch(worker_id, batch_size, now):
+    due = Q(status='pending', next_attempt_at__lte=now) | Q(status='sending', locked_until__lt=now)
+
+    ids = list(EmailOutbox.objects.filter(due).order_by('next_attempt_at').values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return []
+
+    # Rows another worker claimed in the meantime no longer match `due`
+    EmailOutbox.objects.filter(due, id__in=ids).update(
+        status='sending',
+        locked_by=worker_id,
+        locked_until=now + LOCK_DURATION,
+    )
+    return list(EmailOutbox.objects.filter(locked_by=worker_id, status='sending'))
+
+
+def _build_message(item, connection):
+    message = EmailMultiAlternatives(
+        subject=item.subject,
+        body=item.body,
+        from_email=item.from_email,
+        to=item.recipients,
+        connection=connection,
+    )
+    if item.html_body:
+        message.attach_alternative(item.html_body, 'text/html')
+    return message
+
+
+def drain_outbox(batch_size=50, max_batches=None):
+    """
+    Send due outbox rows. Returns a dict with sent/retried/dead counts.
+    """
+    worker_id = uuid.uuid4().hex
+    totals = {'sent': 0, 'retried': 0, 'dead': 0}
+    connection = None
+    batches = 0
+
+    try:
+        while max_batches is None or batches < max_batches:
+            now = timezone.now()
+            batch = _claim_batch(worker_id, batch_size, now)
+            if not batch:
+                break
+            batches += 1
+
+            if connection is None:
+                try:
+                    connection = get_connection(fail_silently=False)
+                    connection.open()
+                except Exception as e:
+                    # SMTP unreachable - count it against the claimed batch and stop
+                    connection = None
+                    for item in batch:
+                        _record_failure(item, e, totals, worker_id)
+                    break
+
+            sent_ids = []
+            reconnect_failed = False
+            try:
+                for index, item in enumerate(batch):
+                    try:
+                        connection.send_messages([_build_message(item, connection)])
+                        sent_ids.append(item.id)
+                    except smtplib.SMTPServerDisconnected as e:
+                        _record_failure(item, e, totals, worker_id)
+                        # Connection dropped - reconnect for the rest of the batch
+                        try:
+                            connection.close()
+                            connection.open()
+                        except Exception as reopen_error:
+                            # SMTP went away - release the rest of the batch for a retry
+                            for rest in batch[index + 1:]:
+                                _record_failure(rest, reopen_error, totals, worker_id)
+                            reconnect_failed = True
+                            break
+                    except Exception as e:
+                        _record_failure(item, e, totals, worker_id)
+            finally:
+                # Whatever happens, never leave delivered rows to be claimed and sent again
+                if sent_ids:
+                    EmailOutbox.objects.filter(id__in=sent_ids, locked_by=worker_id).update(
+                        status='sent', sent_at=timezone.now(), locked_by=None, locked_until=None
+                    )
+                    totals['sent'] += len(sent_ids)
+
+            if reconnect_failed:
+                connection = None
+                break
+    finally:
+        if connection is not None:
+            connection.close()
+
+    return totals
+
+
+def _record_failure(item, error, totals, worker_id):
+    attempts = item.attempts + 1
+    if attempts >= MAX_ATTEMPTS:
+        status = 'dead'
+        totals['dead'] += 1
+    else:
+        status = 'pending'
+        totals['retried'] += 1
+
+    # Only while this worker still holds the row's lock
+    EmailOutbox.objects.filter(id=item.id, locked_by=worker_id).update(
+        status=status,
+        attempts=attempts,
+        next_attempt_at=timezone.now() + backoff_for(attempts),
+        last_error=str(error),
+        locked_by=None,
+        locked_until=None,
+    )
@@ -0,0 +1,49 @@
+"""
+Model signals feeding the live event streams in notifications.events.
+"""
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from doctors.models import Appointment, Prescription
+from pharmacy.models import PharmacyFulfillment
+from staff.models import LabReport
+
+from .events import publish_to_role, publish_to_user
+from .models import Notification
+
+
+@receiver(post_save, sender=Notification)
+def notification_saved(sender, instance, created, **kwargs):
+    # Lab results, shared consultations, bookings, ... all reach their
+    # recipients as notifications
+    if created:
+        publish_notification(instance)
+
+
+def publish_notification(notification):
+    publish_to_user(notification.user_id, notification.kind, notification.object_id)
+
+
+@receiver(post_save, sender=Appointment)
+def appointment_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    for user_id in (instance.patient.user_id, instance.doctor.user_id):
+        publish_to_user(user_id, 'appointment', instance.id, status=instance.status)
+
+
+@receiver(post_save, sender=Prescription)
+def prescription_saved(sender, instance, created, **kwargs):
+    if created:
+        publish_to_role('pharmacy', 'pharmacy_queue', instance.id)
+
+
+@receiver(post_save, sender=PharmacyFulfillment)
+def fulfillment_saved(sender, instance, **kwargs):
+    publish_to_role('pharmacy', 'pharmacy_queue', instance.prescription_id)
+
+
+@receiver(post_save, sender=LabReport)
+def lab_report_saved(sender, instance, created, **kwargs):
+    if created:
+        publish_to_role('staff', 'lab_report', instance.id)
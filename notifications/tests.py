@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.test import TransactionTestCase
+
+from patients.models import PatientProfile
+
+from .events import broker, publish_to_user, relay
+from .models import ChangeEvent
+
+
+class EventStreamTests(TransactionTestCase):
+    CONNECTIONS = 1000
+
+    def setUp(self):
+        self.patient = PatientProfile.objects.create(user=User.objects.create(username='pat'))
+        self.client.force_login(self.patient.user)
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+    def open_streams(self, count, stop, received):
+        """Tasks holding `count` patient/events/ requests open on the ASGI application until `stop` is set."""
+        application = get_asgi_application()
+
+        async def stream(index):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': '/patient/events/', 'raw_path': b'/patient/events/',
+                'query_string': b'', 'root_path': '', 'client': ('127.0.0.1', 10000 + index),
+                'server': ('testserver', 80), 'headers': [(b'host', b'testserver'), (b'cookie', self.cookie.encode())],
+            }
+            requested = False
+
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                await stop.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    received['statuses'].append(message['status'])
+                elif b'event: appointment' in message.get('body', b''):
+                    received['events'] += 1
+
+            await application(scope, receive, send)
+
+        return [asyncio.create_task(stream(index)) for index in range(count)]
+
+    async def wait_for(self, condition, timeout):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return condition()
+
+    def test_1000_idle_connections_on_one_worker(self):
+        received = {'statuses': [], 'events': 0}
+
+        async def run():
+            stop = asyncio.Event()
+            tasks = self.open_streams(self.CONNECTIONS, stop, received)
+            subscribed = await self.wait_for(lambda: broker.connection_count() == self.CONNECTIONS, 120)
+
+            # Published as any process would: a ChangeEvent row the relay picks up
+            start = time.monotonic()
+            await sync_to_async(publish_to_user)(self.patient.user_id, 'appointment', 1, status='confirmed')
+            delivered = await self.wait_for(lambda: received['events'] == self.CONNECTIONS, 10)
+            latency = time.monotonic() - start
+
+            stop.set()
+            await asyncio.wait_for(asyncio.gather(*tasks), 60)
+            return subscribed, delivered, latency
+
+        subscribed, delivered, latency = asyncio.run(run())
+
+        self.assertTrue(subscribed, f"{broker.connection_count()} of {self.CONNECTIONS} streams subscribed")
+        self.assertTrue(delivered, f"event reached {received['events']} of {self.CONNECTIONS} streams")
+        self.assertLess(latency, 5)
+        self.assertEqual(received['statuses'], [200] * self.CONNECTIONS)
+        self.assertEqual(ChangeEvent.objects.count(), 1)
+
+        # Every subscription is released, and the relay stops with the last one
+        self.assertEqual(broker.connection_count(), 0)
+        self.assertTrue(self.wait_until_relay_stops())
+
+    def wait_until_relay_stops(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while relay.is_running() and time.monotonic() < deadline:
+            time.sleep(0.1)
+        return not relay.is_running()
+
+    def test_event_written_by_another_process_reaches_the_stream(self):
+        received = {'statuses': [], 'events': 0}
+
+        async def run():
+            stop = asyncio.Event()
+            tasks = self.open_streams(1, stop, received)
+            await self.wait_for(lambda: broker.connection_count() == 1, 10)
+            # The row another process's publish() writes
+            await sync_to_async(ChangeEvent.objects.create)(
+                channel=f'user:{self.patient.user_id}', payload={'type': 'appointment', 'id': 7}
+            )
+            delivered = await self.wait_for(lambda: received['events'] == 1, 5)
+            stop.set()
+            await asyncio.gather(*tasks)
+            return delivered
+
+        self.assertTrue(asyncio.run(run()))
+        self.assertTrue(self.wait_until_relay_stops())
+
+    def test_wsgi_request_is_told_not_to_reconnect(self):
+        # A WSGI worker must not be held by an endless stream
+        response = self.client.get('/patient/events/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(broker.connection_count(), 0)
@@ -0,0 +1,7 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('<int:notification_id>/read/', views.mark_notification_read, name='mark-notification-read'),
+    path('read-all/', views.mark_all_notifications_read, name='mark-all-notifications-read'),
+]
@@ -0,0 +1,23 @@
+from django.http import JsonResponse
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_http_methods
+from django.views.decorators.csrf import csrf_protect
+from .models import Notification
+
+
+@login_required
+@csrf_protect
+@require_http_methods(["POST"])
+def mark_notification_read(request, notification_id):
+    updated = Notification.objects.filter(id=notification_id, user=request.user).update(is_read=True)
+    if not updated:
+        return JsonResponse({"error": "Notification not found"}, status=404)
+    return JsonResponse({"success": True})
+
+
+@login_required
+@csrf_protect
+@require_http_methods(["POST"])
+def mark_all_notifications_read(request):
+    updated = Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    return JsonResponse({"success": True, "updated": updated})
@@ -1,7 +1,13 @@
 from django.contrib import admin
-from .models import PatientProfile
+from .models import PatientProfile, ExportJob
 
 @admin.register(PatientProfile)
 class PatientProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'patient_id')  
-    search_fields = ('user__first_name', 'user__last_name', 'phone_number') 
\ No newline at end of file
+    search_fields = ('user__first_name', 'user__last_name', 'phone_number') 
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'kind', 'object_id', 'status', 'progress', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('source_key', 'file_path', 'error', 'started_at', 'finished_at')
@@ -0,0 +1,189 @@
+"""
+"Download all my records": every prescription and lab report PDF plus the
+consultation history in one ZIP, streamed while it is being built.
+
+zipfile writes to a sink that the response generator drains after every
+chunk, so the request process holds at most one chunk of the archive.
+The PDFs come from the export worker pool (patients.exports) with only a
+few renders in flight at a time; already cached PDFs are not rendered again.
+"""
+import io
+import json
+import logging
+import zipfile
+from collections import deque
+
+from django.utils import timezone
+
+from doctors.models import ConsultationHistory, Prescription
+from staff.models import LabReport
+
+from . import export_worker
+from .exports import submit
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, unseekable buffer emptied by drain()."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def consultation_record(consultation):
+    """The consultation as the patient API shows it. Needs doctor__user loaded."""
+    vital_signs = {}
+    if consultation.blood_pressure:
+        vital_signs['bloodPressure'] = consultation.blood_pressure
+    if consultation.heart_rate:
+        vital_signs['heartRate'] = consultation.heart_rate
+    if consultation.temperature:
+        vital_signs['temperature'] = consultation.temperature
+    if consultation.weight:
+        vital_signs['weight'] = consultation.weight
+    if consultation.height:
+        vital_signs['height'] = consultation.height
+
+    return {
+        'id': consultation.id,
+        'consultationNumber': consultation.consultation_number,
+        'doctorName': f"Dr. {consultation.doctor.user.get_full_name()}",
+        'specialty': consultation.doctor.get_specialty_display(),
+        'date': consultation.consultation_date.isoformat(),
+        'time': consultation.consultation_time.strftime('%I:%M %p'),
+        'type': consultation.get_consultation_type_display(),
+        'chiefComplaint': consultation.chief_complaint,
+        'diagnosis': consultation.diagnosis,
+        'symptoms': consultation.get_symptoms_list(),
+        'vitalSigns': vital_signs,
+        'examination': consultation.examination_findings or '',
+        'treatmentPlan': consultation.treatment_plan,
+        'prescriptionIssued': 'Yes' if consultation.prescription_issued else 'No',
+        'followUpDate': consultation.follow_up_date.isoformat() if consultation.follow_up_date else None,
+        'notes': consultation.notes or ''
+    }
+
+
+def patient_documents(profile):
+    """(kind, id, name in the archive) for every PDF of the patient."""
+    for prescription_id, number, issued in Prescription.objects.filter(
+        patient=profile
+    ).order_by('created_at').values_list('id', 'prescription_number', 'created_at'):
+        yield 'prescription', prescription_id, f"prescriptions/{issued:%Y-%m-%d}_{number}.pdf"
+
+    for report_id, number, test_date in LabReport.objects.filter(
+        patient=profile
+    ).order_by('test_date', 'id').values_list('id', 'report_number', 'test_date'):
+        yield 'lab_report', report_id, f"lab_reports/{test_date:%Y-%m-%d}_{number}.pdf"
+
+
+def rendered_documents(documents, in_flight):
+    """
+    Yield (name, path or None, error) in order, keeping at most `in_flight`
+    renders queued on the worker pool.
+    """
+    documents = iter(documents)
+    pending = deque()
+
+    def submit_next():
+        for kind, object_id, name in documents:
+            try:
+                pending.append((name, submit(export_worker.render, kind, object_id), None))
+            except Exception as e:
+                # Not even a fresh pool takes work; the document goes in MISSING_FILES.txt
+                logger.exception("Queueing %s for a records export failed", name)
+                pending.append((name, None, str(e)))
+            return
+
+    for _ in range(in_flight):
+        submit_next()
+
+    try:
+        while pending:
+            name, future, error = pending.popleft()
+            submit_next()
+            if future is None:
+                yield name, None, error
+                continue
+            try:
+                yield name, future.result(), None
+            except Exception as e:
+                # Includes BrokenProcessPool when a worker died mid-render
+                logger.exception("Rendering %s for a records export failed", name)
+                yield name, None, str(e)
+    finally:
+        # Client went away: drop renders nobody will read
+        for _, future, _ in pending:
+            if future is not None:
+                future.cancel()
+
+
+def _entry(name, date_time, compress_type):
+    info = zipfile.ZipInfo(name, date_time)
+    info.compress_type = compress_type
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def records_archive(profile, in_flight=4):
+    """Generate the patient's records ZIP in chunks."""
+    return (chunk for chunk in _build_archive(profile, in_flight) if chunk)
+
+
+def _build_archive(profile, in_flight):
+    sink = _ZipSink()
+    now = timezone.localtime()
+    date_time = now.timetuple()[:6]
+    failed = []
+
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        consultations = ConsultationHistory.objects.filter(
+            patient=profile
+        ).select_related('doctor__user').order_by('consultation_date', 'consultation_time')
+
+        with archive.open(_entry('consultation_history.json', date_time, zipfile.ZIP_DEFLATED), 'w') as entry:
+            entry.write(b'[')
+            for index, consultation in enumerate(consultations.iterator(chunk_size=200)):
+                if index:
+                    entry.write(b',')
+                entry.write(b'\n  ' + json.dumps(consultation_record(consultation)).encode())
+                yield sink.drain()
+            entry.write(b'\n]\n')
+        yield sink.drain()
+
+        for name, path, error in rendered_documents(patient_documents(profile), in_flight):
+            if path is None:
+                failed.append(f"{name}: {error}")
+                continue
+
+            # PDFs are already compressed
+            info = _entry(name, date_time, zipfile.ZIP_STORED)
+            with open(path, 'rb') as source, archive.open(info, 'w', force_zip64=True) as entry:
+                while chunk := source.read(CHUNK_SIZE):
+                    entry.write(chunk)
+                    yield sink.drain()
+            yield sink.drain()
+
+        if failed:
+            archive.writestr(
+                _entry('MISSING_FILES.txt', date_time, zipfile.ZIP_DEFLATED),
+                "These documents could not be generated, please download them separately:\n"
+                + "\n".join(failed) + "\n",
+            )
+
+    yield sink.drain()
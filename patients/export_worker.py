@@ -0,0 +1,26 @@
+"""
+Entry points of the export worker processes (see patients.exports).
+
+Spawned workers import this module before Django is set up, so it must not
+import models at module level.
+"""
+
+
+def init_worker():
+    import django
+    django.setup()
+
+
+def run(job_id):
+    from .exports import run_export_job
+    return run_export_job(job_id)
+
+
+def render(kind, object_id):
+    from django.db import close_old_connections
+    from .exports import render_source
+
+    try:
+        return render_source(kind, object_id)
+    finally:
+        close_old_connections()
@@ -0,0 +1,230 @@
+"""
+Background PDF exports.
+
+A download that has no finished render yet becomes an ExportJob. Once the
+transaction commits, the job is handed to a pool of EXPORT_WORKERS
+processes, so CPU-bound ReportLab and PyPDF2 work never ties up a request
+worker. The worker writes progress to the job row and leaves the file in
+the PDF cache (patients.pdf), where later downloads of the same version are
+served from without rendering again.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from . import export_worker
+from .models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+# A queued or running job older than this was lost (e.g. the server
+# restarted) and is not reused
+STALE_AFTER = timedelta(minutes=10)
+
+# Finished jobs kept for the status API; the rendered files live in the cache
+KEEP_JOBS_FOR = timedelta(days=7)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn, not fork: a forked child would share the parent's
+            # database connections and threads
+            _executor = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'EXPORT_WORKERS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=export_worker.init_worker,
+            )
+        return _executor
+
+
+def submit(fn, *args):
+    """Run fn(*args) on the worker pool, starting a fresh pool if a worker died."""
+    global _executor
+    executor = get_executor()
+    try:
+        return executor.submit(fn, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool
+        with _executor_lock:
+            if _executor is executor:
+                _executor = None
+        return get_executor().submit(fn, *args)
+
+
+def _submit(job_id):
+    future = submit(export_worker.run, job_id)
+    future.add_done_callback(lambda f: _check_result(f, job_id))
+
+
+def _check_result(future, job_id):
+    """Fail the job if its worker process died before it could record that."""
+    error = future.exception()
+    if error is None:
+        return
+    logger.error("Export worker for job %s died: %r", job_id, error)
+    try:
+        ExportJob.objects.filter(id=job_id, status__in=['queued', 'running']).update(
+            status='failed', error='Export worker stopped unexpectedly', finished_at=timezone.now()
+        )
+    finally:
+        close_old_connections()
+
+
+# ─────────────────────────────────────────────
+# Sources
+# ─────────────────────────────────────────────
+
+def load_source(kind, object_id, patient=None):
+    """The prescription or lab report with what its PDF needs loaded."""
+    from doctors.models import Prescription
+    from staff.models import LabReport
+
+    if kind == 'prescription':
+        queryset = Prescription.objects.select_related('patient__user', 'doctor__user')
+    else:
+        queryset = LabReport.objects.select_related(
+            'patient__user', 'uploaded_by__user'
+        ).prefetch_related('test_sections__parameters', 'attachments')
+    if patient is not None:
+        queryset = queryset.filter(patient=patient)
+    return queryset.get(id=object_id)
+
+
+def source_key(kind, source):
+    from .pdf import lab_report_etag, prescription_etag
+
+    if kind == 'prescription':
+        return prescription_etag(source)
+    return lab_report_etag(source)
+
+
+def export_filename(kind, source):
+    if kind == 'prescription':
+        return f"prescription_{source.prescription_number}.pdf"
+    user = source.patient.user
+    patient_name_safe = (user.get_full_name() or user.username).replace(' ', '_')
+    return f"LabReport_{source.report_number}_{patient_name_safe}_{source.test_date.strftime('%Y%m%d')}.pdf"
+
+
+# ─────────────────────────────────────────────
+# Jobs
+# ─────────────────────────────────────────────
+
+def finished_job(user, kind, object_id, key):
+    """The newest done job for this version whose file is still on disk."""
+    job = ExportJob.objects.filter(
+        user=user, kind=kind, object_id=object_id, source_key=key, status='done'
+    ).first()
+    if job and os.path.exists(job.file_path):
+        return job
+    return None
+
+
+def request_export(user, kind, source, key=None):
+    """
+    Return a job rendering this version of `source`: a finished or
+    in-flight one if there is one, otherwise a new job queued on commit.
+    """
+    key = key or source_key(kind, source)
+    job = finished_job(user, kind, source.id, key)
+    if job:
+        return job
+
+    job = ExportJob.objects.filter(
+        user=user, kind=kind, object_id=source.id, source_key=key,
+        status__in=['queued', 'running'], created_at__gte=timezone.now() - STALE_AFTER,
+    ).first()
+    if job:
+        return job
+
+    job = ExportJob.objects.create(
+        user=user, kind=kind, object_id=source.id, source_key=key,
+        filename=export_filename(kind, source),
+    )
+    job_id = job.id
+    transaction.on_commit(lambda: _submit(job_id))
+    return job
+
+
+def render_source(kind, object_id, key=None, progress=None):
+    """
+    Path of the cached PDF of the prescription or lab report, rendering it
+    if needed. Runs in an export worker process.
+    """
+    from .pdf import lab_report_pdf_path, prescription_pdf_path
+
+    source = load_source(kind, object_id)
+    if kind == 'prescription':
+        return prescription_pdf_path(source, key)
+    return lab_report_pdf_path(source, key, progress=progress)
+
+
+def run_export_job(job_id):
+    """Render one job. Runs in an export worker process."""
+    close_old_connections()
+    try:
+        claimed = ExportJob.objects.filter(id=job_id, status='queued').update(
+            status='running', started_at=timezone.now()
+        )
+        if not claimed:
+            return
+
+        job = ExportJob.objects.get(id=job_id)
+        progress = {'last': 0}
+
+        def report_progress(done, total):
+            percent = int(done * 100 / total)
+            # Only write when it moved enough for the UI to show
+            if percent - progress['last'] >= 10 or percent == 100:
+                progress['last'] = percent
+                ExportJob.objects.filter(id=job_id).update(progress=percent)
+
+        path = render_source(job.kind, job.object_id, job.source_key, progress=report_progress)
+
+        ExportJob.objects.filter(id=job_id).update(
+            status='done', progress=100, file_path=path, finished_at=timezone.now()
+        )
+    except Exception as e:
+        logger.exception("Export job %s failed", job_id)
+        ExportJob.objects.filter(id=job_id).update(
+            status='failed', error=str(e), finished_at=timezone.now()
+        )
+    finally:
+        close_old_connections()
+
+
+def serialize_job(job):
+    data = {
+        'id': job.id,
+        'type': job.kind,
+        'objectId': job.object_id,
+        'status': job.status,
+        'progress': job.progress,
+        'filename': job.filename,
+        'createdAt': job.created_at.isoformat(),
+        'finishedAt': job.finished_at.isoformat() if job.finished_at else None,
+        'statusUrl': f"/patient/exports/{job.id}/",
+        'downloadUrl': f"/patient/exports/{job.id}/download/" if job.status == 'done' else None,
+    }
+    if job.status == 'failed':
+        data['error'] = job.error
+    return data
+
+
+def purge_export_jobs():
+    """Delete job rows older than KEEP_JOBS_FOR. Returns the count deleted."""
+    deleted, _ = ExportJob.objects.filter(created_at__lt=timezone.now() - KEEP_JOBS_FOR).delete()
+    return deleted
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from patients.exports import purge_export_jobs
+
+
+class Command(BaseCommand):
+    help = 'Delete PDF export job records older than a week'
+
+    def handle(self, *args, **kwargs):
+        deleted = purge_export_jobs()
+        self.stdout.write(self.style.SUCCESS(f" Deleted {deleted} export job(s)"))
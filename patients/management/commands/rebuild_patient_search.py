@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from patients.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the patient search index from the patient profiles'
+
+    def handle(self, *args, **kwargs):
+        count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f" Indexed {count} patient(s)"))
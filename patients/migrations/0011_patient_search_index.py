@@ -0,0 +1,105 @@
+# Generated by Django 6.0 on 2026-10-18 05:13
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+INDEX_TABLE = 'patients_patientsearchindex'
+FTS_TABLE = 'patients_search_fts'
+
+SQLITE_FORWARD = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"search_key, content='{INDEX_TABLE}', content_rowid='patient_id', tokenize='unicode61')",
+    f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {INDEX_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, search_key) VALUES (new.patient_id, new.search_key); END",
+    f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {INDEX_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_key) VALUES ('delete', old.patient_id, old.search_key); END",
+    f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {INDEX_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_key) VALUES ('delete', old.patient_id, old.search_key); "
+    f"INSERT INTO {FTS_TABLE}(rowid, search_key) VALUES (new.patient_id, new.search_key); END",
+]
+SQLITE_REVERSE = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX patient_search_trgm_idx ON {INDEX_TABLE} USING gin (search_key gin_trgm_ops)",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS patient_search_trgm_idx",
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def create_search_backend(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD})
+
+
+def drop_search_backend(apps, schema_editor):
+    _run(schema_editor, {'sqlite': SQLITE_REVERSE, 'postgresql': POSTGRES_REVERSE})
+
+
+# Frozen copies of patients.search.normalize() and search_key() as of this
+# migration; later changes to the key are backfilled by rebuild_patient_search.
+def normalize(text):
+    text = text or ''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = text.lower()
+    text = re.sub(r"['’`]", '', text)
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+
+def search_key(profile):
+    user = profile.user
+    parts = [user.first_name, user.last_name, user.username, profile.patient_id]
+    if profile.patient_id:
+        compact = profile.patient_id.replace('-', '')
+        parts.extend([compact, compact[3:]])
+    if profile.phone_number:
+        parts.append(re.sub(r'\D', '', profile.phone_number))
+    return normalize(' '.join(part for part in parts if part))
+
+
+def index_existing_patients(apps, schema_editor):
+    PatientProfile = apps.get_model('patients', 'PatientProfile')
+    PatientSearchIndex = apps.get_model('patients', 'PatientSearchIndex')
+
+    batch = []
+    for profile in PatientProfile.objects.select_related('user').iterator(chunk_size=2000):
+        batch.append(PatientSearchIndex(patient=profile, search_key=search_key(profile)))
+        if len(batch) >= 2000:
+            PatientSearchIndex.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        PatientSearchIndex.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0010_export_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSearchIndex',
+            fields=[
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='patients.patientprofile')),
+                ('search_key', models.TextField()),
+            ],
+        ),
+        migrations.RunPython(create_search_backend, drop_search_backend),
+        migrations.RunPython(index_existing_patients, migrations.RunPython.noop),
+    ]
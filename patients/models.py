@@ -1,10 +1,13 @@
-from django.db import models, transaction, IntegrityError
+from django.db import models
 from django.contrib.auth.models import User
-from django.utils import timezone
-import random
-import string
+from accounts.identifiers import claim_identifier
+from mediconnect.images import ImageDerivativesMixin
+
+class PatientProfile(ImageDerivativesMixin, models.Model):
+    IMAGE_DERIVATIVES = {
+        'profile_photo': {'thumb': 'profile_photo_thumb', 'medium': 'profile_photo_medium'},
+    }
 
-class PatientProfile(models.Model):
     GENDER_CHOICES = [
         ('M', 'Male'),
         ('F', 'Female'),
@@ -38,6 +41,9 @@ class PatientProfile(models.Model):
     
     # Profile Photo
     profile_photo = models.ImageField(upload_to='profile_photos/', null=True, blank=True)
+    # Resized copies written by mediconnect.images
+    profile_photo_thumb = models.ImageField(blank=True, null=True, editable=False)
+    profile_photo_medium = models.ImageField(blank=True, null=True, editable=False)
     
     # Emergency Contact
     emergency_contact_name = models.CharField(max_length=150, blank=True, null=True)
@@ -48,38 +54,67 @@ class PatientProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def generate_random_code(self, length=6):
-        chars = ''.join([c for c in (string.ascii_uppercase + string.digits) 
-                        if c not in 'O0I1'])
-        return ''.join(random.choice(chars) for _ in range(length))
-
     def save(self, *args, **kwargs):
-        if self.patient_id:
-            return super().save(*args, **kwargs)
-
-        year = timezone.now().year
-
-        for attempt in range(10):
-            try:
-                with transaction.atomic():
-                    # Generate random code
-                    random_code = self.generate_random_code(6)
-                    
-                    self.patient_id = f"PAT-{year}-{random_code}"
-                    
-                    if PatientProfile.objects.filter(patient_id=self.patient_id).exists():
-                        continue  
-                    
-                    super().save(*args, **kwargs)
-                    return
-
-            except IntegrityError:
-                continue
-
-        raise IntegrityError("Failed to generate unique patient_id after 10 attempts")
+        if not self.patient_id:
+            self.patient_id = claim_identifier('PAT')
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.patient_id} - {self.user.username}"
     
     def get_gender_display_short(self):
         return dict(self.GENDER_CHOICES).get(self.gender, None)
+
+
+
+class PatientSearchIndex(models.Model):
+    """
+    Normalized search text of a patient (names, patient ID, phone), kept up
+    to date by patients.signals and queried through patients.search.
+    """
+    patient = models.OneToOneField(PatientProfile, on_delete=models.CASCADE, primary_key=True, related_name='search_index')
+    search_key = models.TextField()
+
+    def __str__(self):
+        return self.search_key
+
+class ExportJob(models.Model):
+    """A PDF download rendered in the background by patients.exports."""
+
+    KIND_CHOICES = [
+        ('prescription', 'Prescription'),
+        ('lab_report', 'Lab Report'),
+    ]
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='export_jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    # Version of the source object the file was rendered from (its PDF ETag)
+    source_key = models.CharField(max_length=64)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    progress = models.PositiveSmallIntegerField(default=0)
+    file_path = models.CharField(max_length=500, blank=True)
+    filename = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Reusing a job for the same version of a document
+            models.Index(fields=['user', 'kind', 'object_id', 'source_key'], name='exportjob_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} for {self.user.username} ({self.status})"
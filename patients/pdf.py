@@ -0,0 +1,732 @@
+"""
+PDF rendering for patient downloads.
+
+Prescriptions do not change after they are issued, so a rendered PDF is kept
+on disk under PDF_CACHE_DIR and reused until anything printed on it changes.
+The cache key doubles as the download's ETag.
+
+Lab reports are assembled with StreamingPdfWriter so large scanned
+attachments never have to be held in memory at once, and are cached the same
+way keyed by lab_report_etag().
+"""
+import glob
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+
+from django.conf import settings
+from PyPDF2 import PdfReader
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, EncodedStreamObject, IndirectObject,
+    NameObject, NumberObject, StreamObject,
+)
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.units import mm
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, HRFlowable, Image, PageBreak
+
+from mediconnect.images import image_path
+
+
+def cache_dir(kind):
+    path = os.path.join(getattr(settings, 'PDF_CACHE_DIR', os.path.join(settings.BASE_DIR, 'cache', 'pdf')), kind)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _write_atomic(path, render):
+    """Render into a temp file next to `path` and move it into place."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            render(tmp)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _cached_pdf(kind, object_id, key, render):
+    """
+    Path of `{object_id}-{key}.pdf` under cache_dir(kind), rendering it on a
+    miss and dropping renders of older versions of the same object.
+    """
+    path = os.path.join(cache_dir(kind), f"{object_id}-{key}.pdf")
+    if not os.path.exists(path):
+        _write_atomic(path, render)
+        for stale in glob.glob(os.path.join(cache_dir(kind), f"{object_id}-*.pdf")):
+            if stale != path:
+                try:
+                    os.unlink(stale)
+                except FileNotFoundError:
+                    pass
+    return path
+
+
+# ─────────────────────────────────────────────
+# Prescription
+# ─────────────────────────────────────────────
+
+@lru_cache(maxsize=None)
+def prescription_styles():
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'Title', parent=styles['Normal'],
+            fontSize=22, fontName='Helvetica-Bold',
+            textColor=colors.HexColor('#1D4ED8'),
+            alignment=TA_CENTER, spaceAfter=8,
+        ),
+        'normal': ParagraphStyle(
+            'Normal2', parent=styles['Normal'],
+            fontSize=10, textColor=colors.HexColor('#374151'),
+            spaceAfter=3
+        ),
+        'label': ParagraphStyle(
+            'Label', parent=styles['Normal'],
+            fontSize=9, textColor=colors.HexColor('#6B7280'),
+        ),
+        'footer': ParagraphStyle(
+            'Footer', parent=styles['Normal'],
+            fontSize=8, textColor=colors.HexColor('#9CA3AF'), alignment=TA_CENTER
+        ),
+    }
+
+
+def prescription_etag(prescription):
+    """
+    Hash of everything printed on the prescription PDF. The prescription
+    needs patient__user and doctor__user loaded.
+    """
+    patient = prescription.patient
+    doctor = prescription.doctor
+    parts = [
+        prescription.id,
+        prescription.updated_at.isoformat(),
+        prescription.status,
+        patient.patient_id,
+        patient.user.get_full_name() or patient.user.username,
+        doctor.user.get_full_name(),
+        doctor.get_specialty_display(),
+    ]
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def prescription_pdf_path(prescription, etag=None):
+    """
+    Path of the rendered prescription PDF, rendering it on a cache miss.
+    """
+    etag = etag or prescription_etag(prescription)
+    return _cached_pdf('prescriptions', prescription.id, etag, lambda out: render_prescription_pdf(prescription, out))
+
+
+def render_prescription_pdf(prescription, out):
+    styles = prescription_styles()
+    title_style = styles['title']
+    normal_style = styles['normal']
+    label_style = styles['label']
+    medicines = list(prescription.medicines.all())
+
+    doc = SimpleDocTemplate(
+        out,
+        pagesize=A4,
+        rightMargin=20*mm,
+        leftMargin=20*mm,
+        topMargin=20*mm,
+        bottomMargin=20*mm
+    )
+    story = []
+
+    # Header
+    story.append(Paragraph("MediConnect", title_style))
+    story.append(Spacer(1, 4*mm))
+    story.append(HRFlowable(width="100%", thickness=2, color=colors.HexColor('#3B82F6')))
+    story.append(Spacer(1, 5*mm))
+
+    rx_data = [
+        [
+            Paragraph(f"<b>Prescription No:</b> {prescription.prescription_number}", normal_style),
+            Paragraph(f"<b>Status:</b> {prescription.status.upper()}", normal_style),
+            Paragraph(f"<b>Date:</b> {prescription.prescribed_date.strftime('%b %d, %Y')}", normal_style),
+        ]
+    ]
+    rx_table = Table(rx_data, colWidths=[60*mm, 50*mm, 60*mm])
+    rx_table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#EFF6FF')),
+        ('ROUNDEDCORNERS', [5]),
+        ('TOPPADDING', (0,0), (-1,-1), 8),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 8),
+        ('LEFTPADDING', (0,0), (-1,-1), 8),
+    ]))
+    story.append(rx_table)
+    story.append(Spacer(1, 5*mm))
+
+    patient = prescription.patient
+    patient_name = patient.user.get_full_name() or patient.user.username
+    doctor_name = f"Dr. {prescription.doctor.user.get_full_name()}"
+    specialty = prescription.doctor.get_specialty_display()
+
+    info_data = [
+        [
+            Paragraph("<b>PATIENT INFORMATION</b>", label_style),
+            Paragraph("<b>PRESCRIBED BY</b>", label_style),
+        ],
+        [
+            Paragraph(f"<b>{patient_name}</b>", normal_style),
+            Paragraph(f"<b>{doctor_name}</b>", normal_style),
+        ],
+        [
+            Paragraph(f"ID: {patient.patient_id}", normal_style),
+            Paragraph(f"{specialty}", normal_style),
+        ],
+        [
+            Paragraph(f"Valid Until: {prescription.valid_until.strftime('%b %d, %Y')}", normal_style),
+            Paragraph(f"MediConnect Hospital", normal_style),
+        ],
+    ]
+    info_table = Table(info_data, colWidths=[85*mm, 85*mm])
+    info_table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,-1), colors.white),
+        ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#E5E7EB')),
+        ('LINEAFTER', (0,0), (0,-1), 1, colors.HexColor('#E5E7EB')),
+        ('TOPPADDING', (0,0), (-1,-1), 5),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 5),
+        ('LEFTPADDING', (0,0), (-1,-1), 8),
+    ]))
+    story.append(info_table)
+    story.append(Spacer(1, 5*mm))
+
+    if prescription.diagnosis:
+        story.append(Paragraph("DIAGNOSIS", label_style))
+        diag_data = [[Paragraph(prescription.diagnosis, normal_style)]]
+        diag_table = Table(diag_data, colWidths=[170*mm])
+        diag_table.setStyle(TableStyle([
+            ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#F9FAFB')),
+            ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#E5E7EB')),
+            ('TOPPADDING', (0,0), (-1,-1), 8),
+            ('BOTTOMPADDING', (0,0), (-1,-1), 8),
+            ('LEFTPADDING', (0,0), (-1,-1), 8),
+        ]))
+        story.append(diag_table)
+        story.append(Spacer(1, 5*mm))
+
+    story.append(Paragraph("PRESCRIBED MEDICINES", label_style))
+    story.append(Spacer(1, 2*mm))
+
+    med_header = [
+        Paragraph('<b>Medicine</b>', normal_style),
+        Paragraph('<b>Dosage</b>', normal_style),
+        Paragraph('<b>Frequency</b>', normal_style),
+        Paragraph('<b>Duration</b>', normal_style),
+    ]
+    med_rows = [med_header]
+
+    for med in medicines:
+        med_rows.append([
+            Paragraph(med.medicine_name, normal_style),
+            Paragraph(med.dosage, normal_style),
+            Paragraph(med.frequency, normal_style),
+            Paragraph(med.duration, normal_style),
+        ])
+
+    med_table = Table(med_rows, colWidths=[55*mm, 35*mm, 45*mm, 35*mm])
+    med_table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#3B82F6')),
+        ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+        ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.HexColor('#F9FAFB'), colors.white]),
+        ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#E5E7EB')),
+        ('INNERGRID', (0,0), (-1,-1), 0.5, colors.HexColor('#E5E7EB')),
+        ('TOPPADDING', (0,0), (-1,-1), 7),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 7),
+        ('LEFTPADDING', (0,0), (-1,-1), 8),
+    ]))
+    story.append(med_table)
+    story.append(Spacer(1, 5*mm))
+
+    instructions = [med for med in medicines if med.instructions]
+    if instructions:
+        story.append(Paragraph("INSTRUCTIONS", label_style))
+        for med in instructions:
+            story.append(Paragraph(
+                f"<b>{med.medicine_name}:</b> {med.instructions}",
+                normal_style
+            ))
+        story.append(Spacer(1, 4*mm))
+
+    if prescription.notes:
+        story.append(Paragraph("ADDITIONAL NOTES", label_style))
+        notes_data = [[Paragraph(prescription.notes, normal_style)]]
+        notes_table = Table(notes_data, colWidths=[170*mm])
+        notes_table.setStyle(TableStyle([
+            ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#FFFBEB')),
+            ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#FCD34D')),
+            ('TOPPADDING', (0,0), (-1,-1), 8),
+            ('BOTTOMPADDING', (0,0), (-1,-1), 8),
+            ('LEFTPADDING', (0,0), (-1,-1), 8),
+        ]))
+        story.append(notes_table)
+        story.append(Spacer(1, 5*mm))
+
+    # Footer
+    story.append(HRFlowable(width="100%", thickness=1, color=colors.HexColor('#E5E7EB')))
+    story.append(Spacer(1, 3*mm))
+    story.append(Paragraph(
+        "This prescription was generated by MediConnect. For queries, contact your doctor.",
+        styles['footer']
+    ))
+
+    doc.build(story)
+
+
+# ─────────────────────────────────────────────
+# Lab report
+# ─────────────────────────────────────────────
+
+# Merged lab reports stay in memory up to this size, then spill to disk
+LAB_REPORT_SPOOL_SIZE = 8 * 1024 * 1024
+
+
+@lru_cache(maxsize=None)
+def lab_report_styles():
+    styles = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle(
+            'Title', parent=styles['Normal'],
+            fontSize=24, fontName='Helvetica-Bold',
+            textColor=colors.HexColor('#8B5CF6'),
+            alignment=TA_CENTER, spaceAfter=8,
+        ),
+        'subtitle': ParagraphStyle(
+            'Subtitle', parent=styles['Normal'],
+            fontSize=11, textColor=colors.HexColor('#6B7280'),
+            alignment=TA_CENTER, spaceAfter=10
+        ),
+        'section': ParagraphStyle(
+            'Section', parent=styles['Normal'],
+            fontSize=12, fontName='Helvetica-Bold',
+            textColor=colors.HexColor('#1F2937'),
+            spaceBefore=10, spaceAfter=6
+        ),
+        'normal': ParagraphStyle(
+            'Normal2', parent=styles['Normal'],
+            fontSize=10, textColor=colors.HexColor('#374151'),
+            spaceAfter=3
+        ),
+        'label': ParagraphStyle(
+            'Label', parent=styles['Normal'],
+            fontSize=9, textColor=colors.HexColor('#6B7280'),
+            fontName='Helvetica-Bold'
+        ),
+        'caption': ParagraphStyle(
+            'Caption', parent=styles['Normal'],
+            fontSize=9, textColor=colors.HexColor('#6B7280'),
+            alignment=TA_CENTER
+        ),
+    }
+
+
+def lab_report_etag(report):
+    """
+    Hash of everything that goes into the lab report PDF. Section and
+    parameter edits go through the report's save(), which bumps updated_at;
+    attachments can be removed on their own, so they are listed explicitly.
+    """
+    parts = [
+        report.id,
+        report.updated_at.isoformat(),
+        report.overall_status,
+        report.report_file.name if report.report_file else '',
+        report.report_image.name if report.report_image else '',
+        report.report_image_pdf.name or '',
+        report.patient.user.get_full_name() or report.patient.user.username,
+    ]
+    for att in report.attachments.all():
+        parts.extend([att.id, att.file.name, att.pdf_image.name or ''])
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def lab_report_pdf_path(report, etag=None, progress=None):
+    """
+    Path of the rendered lab report PDF, rendering it on a cache miss.
+    """
+    etag = etag or lab_report_etag(report)
+    return _cached_pdf('lab_reports', report.id, etag, lambda out: write_lab_report_pdf(report, out, progress))
+
+
+def lab_report_pdf(report):
+    """
+    The lab report PDF in a spooled temp file positioned at the start.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=LAB_REPORT_SPOOL_SIZE)
+    write_lab_report_pdf(report, out)
+    out.seek(0)
+    return out
+
+
+def write_lab_report_pdf(report, out, progress=None):
+    """
+    Write the downloadable lab report to `out`: the rendered summary and
+    attached images, followed by every attached PDF.
+
+    Attached PDFs are copied page by page, so peak memory is bounded by the
+    largest single page rather than the sum of the attachments. `progress`,
+    if given, is called with (steps done, total steps). The report needs
+    patient__user and uploaded_by__user loaded.
+    """
+    attachments = list(report.attachments.all())
+    pdf_paths = [
+        att.file.path for att in attachments
+        if att.attachment_type == 'document' and att.file and att.file.name.lower().endswith('.pdf')
+    ]
+    if report.report_file and report.report_file.name.lower().endswith('.pdf'):
+        if report.report_file.path not in pdf_paths:
+            pdf_paths.append(report.report_file.path)
+
+    # (path to embed, original name); the 1600px 'pdf' derivative keeps
+    # camera photos from bloating the document
+    images = [
+        (image_path(att, 'file', 'pdf'), att.file.name)
+        for att in attachments if att.attachment_type == 'image' and att.file
+    ]
+    if report.report_image and not any(name == report.report_image.name for _, name in images):
+        images.append((image_path(report, 'report_image', 'pdf'), report.report_image.name))
+
+    total_steps = 1 + len(pdf_paths)
+    writer = StreamingPdfWriter(out)
+
+    with tempfile.SpooledTemporaryFile(max_size=LAB_REPORT_SPOOL_SIZE) as summary:
+        render_lab_report_summary(report, images, summary)
+        summary.seek(0)
+        writer.append(summary)
+    if progress:
+        progress(1, total_steps)
+
+    for step, pdf_path in enumerate(pdf_paths, 2):
+        try:
+            with open(pdf_path, 'rb') as attachment:
+                writer.append(attachment)
+        except Exception as e:
+            print(f"Error merging PDF {pdf_path}: {e}")
+        if progress:
+            progress(step, total_steps)
+
+    writer.close()
+
+
+def render_lab_report_summary(report, images, out):
+    styles = lab_report_styles()
+    title_style = styles['title']
+    section_style = styles['section']
+    normal_style = styles['normal']
+    label_style = styles['label']
+    patient = report.patient
+
+    doc = SimpleDocTemplate(
+        out,
+        pagesize=A4,
+        rightMargin=20*mm,
+        leftMargin=20*mm,
+        topMargin=20*mm,
+        bottomMargin=20*mm
+    )
+    story = []
+
+    # Header & Report Details
+    story.append(Paragraph("LAB REPORT", title_style))
+    story.append(Paragraph("MediConnect Hospital", styles['subtitle']))
+    story.append(HRFlowable(width="100%", thickness=2, color=colors.HexColor('#8B5CF6')))
+    story.append(Spacer(1, 5*mm))
+
+    status_color = {
+        'normal': '#10B981',
+        'abnormal': '#F59E0B',
+        'critical': '#EF4444',
+        'pending': '#6366F1'
+    }.get(report.overall_status if report.is_completed else 'pending', '#6B7280')
+
+    status_text = report.overall_status.upper() if report.is_completed else 'PENDING'
+
+    info_data = [
+        [
+            Paragraph(f"<b>Report No:</b> {report.report_number}", normal_style),
+            Paragraph(f"<b>Status:</b> <font color='{status_color}'>{status_text}</font>", normal_style),
+        ]
+    ]
+    info_table = Table(info_data, colWidths=[85*mm, 85*mm])
+    info_table.setStyle(TableStyle([
+        ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#F9FAFB')),
+        ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#E5E7EB')),
+        ('TOPPADDING', (0,0), (-1,-1), 10),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 10),
+        ('LEFTPADDING', (0,0), (-1,-1), 10),
+    ]))
+    story.append(info_table)
+    story.append(Spacer(1, 5*mm))
+
+    # Patient & Test Info
+    patient_name = patient.user.get_full_name() or patient.user.username
+
+    test_sections = list(report.test_sections.all())
+    if len(test_sections) == 1:
+        test_name = test_sections[0].get_test_name()
+    elif test_sections:
+        test_name = f"{len(test_sections)} Tests"
+    else:
+        test_name = "Lab Report"
+
+    details_data = [
+        [Paragraph("<b>PATIENT INFORMATION</b>", label_style),
+         Paragraph("<b>TEST INFORMATION</b>", label_style)],
+        [Paragraph(f"<b>{patient_name}</b>", normal_style),
+         Paragraph(f"<b>{test_name}</b>", normal_style)],
+        [Paragraph(f"ID: {patient.patient_id}", normal_style),
+         Paragraph(f"Test Date: {report.test_date.strftime('%b %d, %Y')}", normal_style)],
+        [Paragraph(f"Age: {patient.age or 'N/A'} | Gender: {patient.get_gender_display_short() or 'N/A'}", normal_style),
+         Paragraph("", normal_style)],
+    ]
+
+    if report.uploaded_by:
+        details_data.append([
+            Paragraph("", normal_style),
+            Paragraph(f"Uploaded by: {report.uploaded_by.user.get_full_name()}", normal_style)
+        ])
+
+    details_table = Table(details_data, colWidths=[85*mm, 85*mm])
+    details_table.setStyle(TableStyle([
+        ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#E5E7EB')),
+        ('LINEAFTER', (0,0), (0,-1), 1, colors.HexColor('#E5E7EB')),
+        ('TOPPADDING', (0,0), (-1,-1), 6),
+        ('BOTTOMPADDING', (0,0), (-1,-1), 6),
+        ('LEFTPADDING', (0,0), (-1,-1), 10),
+    ]))
+    story.append(details_table)
+    story.append(Spacer(1, 5*mm))
+
+    # Test Sections with Parameters
+    for section in test_sections:
+        # Section header
+        story.append(Paragraph(
+            f"{section.get_test_name()} - {section.get_category_display_name()}",
+            section_style
+        ))
+
+        section_status_color = {
+            'Normal': '#10B981',
+            'Abnormal': '#F59E0B',
+            'Critical': '#EF4444'
+        }.get(section.status, '#6B7280')
+
+        story.append(Paragraph(
+            f"<b>Result:</b> <font color='{section_status_color}'>{section.status.upper()}</font>",
+            normal_style
+        ))
+        story.append(Spacer(1, 2*mm))
+
+        if section.findings:
+            findings_data = [[Paragraph(f"<b>Findings:</b> {section.findings}", normal_style)]]
+            findings_table = Table(findings_data, colWidths=[170*mm])
+            findings_table.setStyle(TableStyle([
+                ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#F0F9FF')),
+                ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#3B82F6')),
+                ('TOPPADDING', (0,0), (-1,-1), 8),
+                ('BOTTOMPADDING', (0,0), (-1,-1), 8),
+                ('LEFTPADDING', (0,0), (-1,-1), 10),
+            ]))
+            story.append(findings_table)
+            story.append(Spacer(1, 3*mm))
+
+        parameters = list(section.parameters.all())
+        if parameters:
+            param_header = [
+                Paragraph('<b>Parameter</b>', normal_style),
+                Paragraph('<b>Value</b>', normal_style),
+                Paragraph('<b>Normal Range</b>', normal_style),
+                Paragraph('<b>Status</b>', normal_style),
+            ]
+            param_rows = [param_header]
+
+            for param in parameters:
+                status_badge_color = {
+                    'Normal': '#10B981',
+                    'High': '#EF4444',
+                    'Low': '#3B82F6',
+                    'Critical': '#DC2626'
+                }.get(param.status, '#6B7280')
+
+                param_rows.append([
+                    Paragraph(param.name, normal_style),
+                    Paragraph(f"{param.value} {param.unit or ''}", normal_style),
+                    Paragraph(param.normal_range or '-', normal_style),
+                    Paragraph(f"<font color='{status_badge_color}'><b>{param.status}</b></font>", normal_style),
+                ])
+
+            param_table = Table(param_rows, colWidths=[50*mm, 35*mm, 50*mm, 35*mm])
+            param_table.setStyle(TableStyle([
+                ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#8B5CF6')),
+                ('TEXTCOLOR', (0,0), (-1,0), colors.white),
+                ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
+                ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.HexColor('#F9FAFB'), colors.white]),
+                ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#E5E7EB')),
+                ('INNERGRID', (0,0), (-1,-1), 0.5, colors.HexColor('#E5E7EB')),
+                ('TOPPADDING', (0,0), (-1,-1), 8),
+                ('BOTTOMPADDING', (0,0), (-1,-1), 8),
+                ('LEFTPADDING', (0,0), (-1,-1), 8),
+            ]))
+            story.append(param_table)
+            story.append(Spacer(1, 5*mm))
+
+    if report.notes:
+        story.append(Paragraph("NOTES & RECOMMENDATIONS", section_style))
+        note_color = '#FEF2F2' if report.overall_status == 'critical' else '#FFFBEB'
+        border_color = '#DC2626' if report.overall_status == 'critical' else '#F59E0B'
+
+        notes_data = [[Paragraph(report.notes, normal_style)]]
+        notes_table = Table(notes_data, colWidths=[170*mm])
+        notes_table.setStyle(TableStyle([
+            ('BACKGROUND', (0,0), (-1,-1), colors.HexColor(note_color)),
+            ('BOX', (0,0), (-1,-1), 2, colors.HexColor(border_color)),
+            ('TOPPADDING', (0,0), (-1,-1), 10),
+            ('BOTTOMPADDING', (0,0), (-1,-1), 10),
+            ('LEFTPADDING', (0,0), (-1,-1), 10),
+        ]))
+        story.append(notes_table)
+        story.append(Spacer(1, 5*mm))
+
+    for idx, (path, name) in enumerate(images, 1):
+        story.append(PageBreak())
+        story.append(Paragraph(f"ATTACHED IMAGE {idx}", section_style))
+        story.append(Spacer(1, 3*mm))
+
+        try:
+            img = Image(path, width=160*mm, height=200*mm, kind='proportional')
+            story.append(img)
+            story.append(Spacer(1, 3*mm))
+
+            caption = Paragraph(
+                f"<i>Image {idx}: {os.path.basename(name)}<br/>"
+                f"Uploaded: {report.created_at.strftime('%b %d, %Y')}</i>",
+                styles['caption']
+            )
+            story.append(caption)
+        except Exception as e:
+            story.append(Paragraph(f"<i>Error loading image {idx}: {str(e)}</i>", normal_style))
+
+    doc.build(story)
+
+
+class StreamingPdfWriter:
+    """
+    Concatenate PDFs into `out` one page at a time.
+
+    PyPDF2's PdfMerger keeps every appended document open and builds the
+    whole output in memory before writing it. This writer copies each page
+    and the objects it references straight to `out` and then drops them,
+    writing only the page tree, catalog and xref table at close().
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.offsets = []
+        self.page_refs = []
+        self.out.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        self.pages_ref = self._reserve()
+
+    def _reserve(self):
+        self.offsets.append(None)
+        return IndirectObject(len(self.offsets), 0, None)
+
+    def _write_object(self, ref, obj):
+        self.offsets[ref.idnum - 1] = self.out.tell()
+        self.out.write(f"{ref.idnum} 0 obj\n".encode())
+        if obj is None:
+            self.out.write(b"null")
+        else:
+            obj.write_to_stream(self.out, None)
+        self.out.write(b"\nendobj\n")
+
+    def append(self, fileobj):
+        reader = PdfReader(fileobj)
+        if reader.is_encrypted:
+            reader.decrypt('')
+
+        # Source object number -> object number in the output. Pages are
+        # reserved up front so links between pages stay inside the output.
+        mapping = {}
+        pages = list(reader.pages)
+        for page in pages:
+            if page.indirect_reference is not None:
+                mapping[page.indirect_reference.idnum] = self._reserve()
+        root_pages = reader.trailer['/Root'].raw_get('/Pages')
+        if isinstance(root_pages, IndirectObject):
+            mapping[root_pages.idnum] = self.pages_ref
+
+        pending = []
+
+        def copy(obj):
+            if isinstance(obj, IndirectObject):
+                if obj.idnum not in mapping:
+                    mapping[obj.idnum] = self._reserve()
+                    pending.append(obj)
+                return mapping[obj.idnum]
+            if isinstance(obj, StreamObject):
+                stream = EncodedStreamObject() if '/Filter' in obj else DecodedStreamObject()
+                stream._data = obj._data
+                for key, value in obj.items():
+                    stream[key] = copy(value)
+                return stream
+            if isinstance(obj, DictionaryObject):
+                return DictionaryObject({key: copy(value) for key, value in obj.items()})
+            if isinstance(obj, ArrayObject):
+                return ArrayObject(copy(value) for value in obj)
+            return obj
+
+        for page in pages:
+            if page.indirect_reference is not None:
+                page_ref = mapping[page.indirect_reference.idnum]
+            else:
+                page_ref = self._reserve()
+
+            page_dict = DictionaryObject({
+                key: copy(value) for key, value in page.items() if key != '/Parent'
+            })
+            page_dict[NameObject('/Parent')] = self.pages_ref
+            self._write_object(page_ref, page_dict)
+
+            while pending:
+                source = pending.pop()
+                self._write_object(mapping[source.idnum], copy(source.get_object()))
+
+            self.page_refs.append(page_ref)
+            # Everything this page needed is on disk now
+            reader.resolved_objects.clear()
+
+    def close(self):
+        self._write_object(self.pages_ref, DictionaryObject({
+            NameObject('/Type'): NameObject('/Pages'),
+            NameObject('/Kids'): ArrayObject(self.page_refs),
+            NameObject('/Count'): NumberObject(len(self.page_refs)),
+        }))
+        catalog_ref = self._reserve()
+        self._write_object(catalog_ref, DictionaryObject({
+            NameObject('/Type'): NameObject('/Catalog'),
+            NameObject('/Pages'): self.pages_ref,
+        }))
+
+        # Objects reserved for pages that failed to copy
+        for idnum, offset in enumerate(self.offsets, 1):
+            if offset is None:
+                self._write_object(IndirectObject(idnum, 0, None), None)
+
+        xref_offset = self.out.tell()
+        self.out.write(f"xref\n0 {len(self.offsets) + 1}\n".encode())
+        self.out.write(b"0000000000 65535 f \n")
+        for offset in self.offsets:
+            self.out.write(f"{offset:010d} 00000 n \n".encode())
+        self.out.write(
+            f"trailer\n<< /Size {len(self.offsets) + 1} /Root {catalog_ref.idnum} 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n".encode()
+        )
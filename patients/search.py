@@ -0,0 +1,146 @@
+"""
+Patient search for staff and doctors.
+
+Every patient has a PatientSearchIndex row holding one normalized string
+(lowercase, accents stripped) of their names, patient ID and phone digits.
+Queries match every query word as a prefix of a word in that string:
+"jo sm" finds "John Smith", "PAT-2026-7K" or "2026-7k" find PAT-2026-7KQ2MX
+and "98012" finds a phone number starting with those digits.
+
+The string is indexed by the database:
+- SQLite: an FTS5 table over the index rows, synced by triggers, ranked
+  with bm25.
+- PostgreSQL: a pg_trgm GIN index, ranked by trigram similarity.
+- Anything else: regex filters, no index.
+Both indexes are created by migration 0011.
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import PatientProfile, PatientSearchIndex
+
+FTS_TABLE = 'patients_search_fts'
+
+MIN_QUERY_LENGTH = 2
+MAX_QUERY_TERMS = 6
+
+
+def normalize(text):
+    """Lowercase ASCII words: "José O'Brien" -> 'jose obrien'."""
+    text = text or ''
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = text.lower()
+    text = re.sub(r"['’`]", '', text)
+    return ' '.join(re.findall(r'[a-z0-9]+', text))
+
+
+def search_key(profile):
+    """The indexed text of a patient. Needs profile.user."""
+    user = profile.user
+    parts = [user.first_name, user.last_name, user.username, profile.patient_id]
+    if profile.patient_id:
+        # Also as single words (pat20267kq2mx, 20267kq2mx) for ID-like
+        # queries, see query_terms()
+        compact = profile.patient_id.replace('-', '')
+        parts.extend([compact, compact[3:]])
+    if profile.phone_number:
+        parts.append(re.sub(r'\D', '', profile.phone_number))
+    return normalize(' '.join(part for part in parts if part))
+
+
+def index_patient(profile):
+    PatientSearchIndex.objects.update_or_create(patient=profile, defaults={'search_key': search_key(profile)})
+
+
+def rebuild_index(batch_size=2000):
+    """Rewrite every patient's index row. Returns the number indexed."""
+    PatientSearchIndex.objects.all().delete()
+    batch = []
+    count = 0
+    for profile in PatientProfile.objects.select_related('user').iterator(chunk_size=batch_size):
+        batch.append(PatientSearchIndex(patient=profile, search_key=search_key(profile)))
+        if len(batch) >= batch_size:
+            PatientSearchIndex.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        PatientSearchIndex.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def query_terms(query):
+    """
+    Query words to prefix-match. Words with digits (IDs, phone numbers) are
+    kept whole: "PAT-2026-7K" -> "pat20267k" rather than "pat", "2026", "7k",
+    which would match nearly every patient.
+    """
+    terms = []
+    for word in query.split():
+        if any(c.isdigit() for c in word):
+            terms.append(normalize(word).replace(' ', ''))
+        else:
+            terms.extend(normalize(word).split())
+    return [term for term in terms if term][:MAX_QUERY_TERMS]
+
+
+def _fts_match(terms):
+    # Quoted so FTS5 operators in user input are plain text; * = prefix
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def patient_search_q(query, prefix='patient__'):
+    """
+    Q matching rows whose patient matches `query`, checked against the
+    joined search key row by row. Meant for querysets that are already
+    small (a doctor's day); search_patients() uses the index to search
+    all patients.
+    """
+    condition = Q()
+    for term in query_terms(query):
+        condition &= Q(**{f"{prefix}search_index__search_key__regex": rf'(^| ){re.escape(term)}'})
+    return condition
+
+
+def search_patients(query, limit=10):
+    """Active patients matching `query`, best match first."""
+    terms = query_terms(query)
+    if not terms or len(''.join(terms)) < MIN_QUERY_LENGTH:
+        return []
+
+    # An exact patient ID always comes first
+    exact = list(PatientProfile.objects.filter(
+        patient_id=query.strip().upper(), is_active=True
+    ).select_related('user'))
+
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT f.rowid FROM {FTS_TABLE} f "
+                f"JOIN {PatientProfile._meta.db_table} p ON p.id = f.rowid "
+                f"WHERE {FTS_TABLE} MATCH %s AND p.is_active "
+                f"ORDER BY bm25({FTS_TABLE}) LIMIT %s",
+                [_fts_match(terms), limit],
+            )
+            ranked_ids = [row[0] for row in cursor.fetchall()]
+    else:
+        # On PostgreSQL the trigram index serves these regex filters
+        matches = PatientProfile.objects.filter(patient_search_q(query, prefix=''), is_active=True)
+        if connection.vendor == 'postgresql':
+            from django.contrib.postgres.search import TrigramSimilarity
+            matches = matches.annotate(
+                rank=TrigramSimilarity('search_index__search_key', ' '.join(terms))
+            ).order_by('-rank', 'id')
+        else:
+            matches = matches.order_by('user__first_name', 'user__last_name')
+        ranked_ids = list(matches.values_list('id', flat=True)[:limit])
+
+    exact_ids = {profile.id for profile in exact}
+    profiles = PatientProfile.objects.select_related('user').in_bulk(ranked_ids)
+    results = exact + [profiles[pk] for pk in ranked_ids if pk in profiles and pk not in exact_ids]
+    return results[:limit]
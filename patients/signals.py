@@ -0,0 +1,33 @@
+"""
+Keep PatientSearchIndex in step with the patient's profile and user names.
+"""
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import PatientProfile
+from .search import index_patient
+
+# User fields that end up in the search key
+USER_SEARCH_FIELDS = {'first_name', 'last_name', 'username'}
+
+
+@receiver(post_save, sender=PatientProfile)
+def patient_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is not None and not {'patient_id', 'phone_number', 'user'} & set(update_fields):
+        return
+    index_patient(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Logins save the user with update_fields=['last_login']
+    if raw or (update_fields is not None and not USER_SEARCH_FIELDS & set(update_fields)):
+        return
+    try:
+        profile = instance.patientprofile
+    except PatientProfile.DoesNotExist:
+        return
+    index_patient(profile)
@@ -0,0 +1,242 @@
+"""
+Symptom -> specialty matching for the patient's doctor search, and the
+static specialty catalog shown next to the results.
+
+Both are built once at import. The symptom keywords are compiled into a
+single trie-shaped regex over the normalized query (see
+patients.search.normalize). It matches whole words only and prefers the
+longest keyword, so "chest pain" counts as one two-word match rather than
+as "chest", and "head" no longer matches inside "forehead".
+"""
+import re
+
+from .search import normalize
+
+# keyword -> specialty
+SYMPTOM_KEYWORDS = {
+    # Heart-related
+    'heart': 'cardiology',
+    'chest pain': 'cardiology',
+    'chest': 'cardiology',
+    'palpitation': 'cardiology',
+    'blood pressure': 'cardiology',
+    'bp': 'cardiology',
+
+    # Brain/Head-related
+    'head': 'neurology',
+    'headache': 'neurology',
+    'migraine': 'neurology',
+    'dizzy': 'neurology',
+    'dizziness': 'neurology',
+    'seizure': 'neurology',
+    'stroke': 'neurology',
+    'brain': 'neurology',
+
+    # Bones/Joints
+    'walk': 'orthopedics',
+    'walking': 'orthopedics',
+    'leg': 'orthopedics',
+    'back pain': 'orthopedics',
+    'back': 'orthopedics',
+    'joint': 'orthopedics',
+    'bone': 'orthopedics',
+    'knee': 'orthopedics',
+    'hip': 'orthopedics',
+
+    # Stomach/Digestive
+    'stomach': 'gastroenterology',
+    'digestion': 'gastroenterology',
+    'diarrhea': 'gastroenterology',
+    'constipation': 'gastroenterology',
+
+    # Pregnancy/Women
+    'pregnant': 'gynecology',
+    'pregnancy': 'gynecology',
+    'period': 'gynecology',
+    'menstrual': 'gynecology',
+
+    # General
+    'fever': 'general',
+    'cold': 'general',
+    'cough': 'general',
+    'flu': 'general',
+    'neck': 'general',
+    'dont': 'general',
+    'unable': 'general',
+}
+
+SPECIALTY_DETAILS = {
+    'cardiology': {
+        'icon': '🫀',
+        'description': 'Heart and blood vessel specialists',
+        'commonConditions': [
+            'Chest pain or discomfort',
+            'High blood pressure',
+            'Irregular heartbeat',
+            'Heart disease prevention'
+        ]
+    },
+    'neurology': {
+        'icon': '🧠',
+        'description': 'Brain, nerve and nervous system experts',
+        'commonConditions': [
+            'Severe or recurring headaches',
+            'Seizures or epilepsy',
+            'Stroke or paralysis',
+            'Memory problems'
+        ]
+    },
+    'orthopedics': {
+        'icon': '🦴',
+        'description': 'Bone, joint and muscle specialists',
+        'commonConditions': [
+            'Back or joint pain',
+            'Sports injuries',
+            'Difficulty walking',
+            'Fractures or arthritis'
+        ]
+    },
+    'pediatrics': {
+        'icon': '👶',
+        'description': 'Child health specialists',
+        'commonConditions': [
+            'Child fever or infections',
+            'Growth concerns',
+            'Vaccinations',
+            'Developmental issues'
+        ]
+    },
+    'dermatology': {
+        'icon': '🩹',
+        'description': 'Skin, hair and nail specialists',
+        'commonConditions': [
+            'Skin rashes or acne',
+            'Hair loss',
+            'Allergies',
+            'Skin infections'
+        ]
+    },
+    'gynecology': {
+        'icon': '🤰',
+        'description': 'Women\'s health specialists',
+        'commonConditions': [
+            'Pregnancy care',
+            'Menstrual problems',
+            'Reproductive health',
+            'Prenatal checkups'
+        ]
+    },
+    'general': {
+        'icon': '🩺',
+        'description': 'First point of care for all health concerns',
+        'commonConditions': [
+            'Fever, cold or flu',
+            'General check-ups',
+            'Stomach problems',
+            'Not sure what\'s wrong'
+        ]
+    },
+    'ent': {
+        'icon': '👂',
+        'description': 'Ear, nose and throat specialists',
+        'commonConditions': [
+            'Ear infections',
+            'Sinus problems',
+            'Throat pain',
+            'Hearing issues'
+        ]
+    },
+    'ophthalmology': {
+        'icon': '👁️',
+        'description': 'Eye care specialists',
+        'commonConditions': [
+            'Vision problems',
+            'Eye infections',
+            'Cataracts or glaucoma',
+            'Eye exams'
+        ]
+    },
+    'gastroenterology': {
+        'icon': '🤢',
+        'description': 'Digestive system specialists',
+        'commonConditions': [
+            'Stomach pain',
+            'Digestive problems',
+            'Diarrhea or constipation',
+            'Liver issues'
+        ]
+    },
+}
+
+DEFAULT_SPECIALTY_DETAILS = {
+    'icon': '🩺',
+    'description': 'Medical specialist',
+    'commonConditions': ['Various medical conditions'],
+}
+
+
+def _trie_pattern(words):
+    """
+    Regex matching any of `words`, nested by shared prefixes
+    ("b(?:ack(?: pain)?|one|p)") so each position is tried against the few
+    keywords that can start there rather than the whole list.
+    Optional tails are greedy, so the longest keyword wins.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        return f"(?:{body})?" if '' in node else body
+
+    return build(trie)
+
+
+class SpecialtyMatcher:
+    """Scores specialties by the symptom keywords found in a piece of text."""
+
+    def __init__(self, keywords):
+        self.keywords = {normalize(keyword): specialty for keyword, specialty in keywords.items()}
+        # Whole words, any separator between the words of a keyword, optionally
+        # plural: "headaches", "chest-pain", "palpitations"
+        alternation = _trie_pattern(self.keywords).replace(r'\ ', r'[^a-z0-9]+')
+        self.pattern = re.compile(rf'\b({alternation})(?:e?s)?\b')
+
+    def match(self, text):
+        """
+        [(specialty, score), ...] best first. A specialty scores the word
+        count of each distinct keyword of it found, so "back pain" (2)
+        outranks "head" (1); ties keep the order they were mentioned in.
+        """
+        # Plain ASCII only needs lowercasing, which is most of the saving
+        # over a full normalize()
+        text = text.lower().replace("'", '') if text.isascii() else normalize(text)
+        found = {}
+        for match in self.pattern.finditer(text):
+            keyword = match.group(1)
+            if keyword not in self.keywords:
+                # Words of a phrase separated by something other than one space
+                keyword = normalize(keyword)
+            found[keyword] = self.keywords[keyword]
+
+        scores = {}
+        for keyword, specialty in found.items():
+            scores[specialty] = scores.get(specialty, 0) + len(keyword.split())
+        return sorted(scores.items(), key=lambda item: -item[1])
+
+matcher = SpecialtyMatcher(SYMPTOM_KEYWORDS)
+
+
+def match_specialties(text):
+    return matcher.match(text)
+
+
+def specialty_details(code):
+    return SPECIALTY_DETAILS.get(code, DEFAULT_SPECIALTY_DETAILS)
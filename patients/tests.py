@@ -1,3 +1,154 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from PIL import Image
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from doctors.models import DoctorProfile, Prescription
+from staff.models import LabReport, LabReportAttachment
+
+from . import exports
+from .models import ExportJob, PatientProfile
+
+
+def current_rss_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return 0
+
+
+def scanned_pdf(megapixels=1.5):
+    """A one-page PDF holding a noisy (incompressible) photo, about 1 MB."""
+    side = int((megapixels * 1e6) ** 0.5)
+    photo = io.BytesIO()
+    Image.effect_noise((side, side), 60).convert('RGB').save(photo, 'JPEG', quality=90)
+    photo.seek(0)
+
+    out = io.BytesIO()
+    page = canvas.Canvas(out, pagesize=A4)
+    page.drawImage(ImageReader(photo), 0, 0, *A4)
+    page.save()
+    return out.getvalue()
+
+
+@unittest.skipUnless(os.path.exists('/proc/self/status'), 'needs /proc to read the RSS')
+class RecordsArchiveMemoryTests(TransactionTestCase):
+    PRESCRIPTIONS = 400
+    LAB_REPORTS = 100
+    # Well below the size of the archive (about 140 MB)
+    RSS_LIMIT_MB = 48
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(self.tmp, 'media'), PDF_CACHE_DIR=os.path.join(self.tmp, 'pdf')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # Render in threads of this process: spawned workers would open the
+        # real database, and in-process renders count against the limit too
+        self.original_executor = exports._executor
+        exports._executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(self.restore_executor)
+
+        self.patient = PatientProfile.objects.create(
+            user=User.objects.create(username='patient', first_name='Asha', last_name='Gurung')
+        )
+        doctor = DoctorProfile.objects.create(user=User.objects.create(username='doctor'), specialization='cardiology')
+
+        for _ in range(self.PRESCRIPTIONS):
+            Prescription.objects.create(
+                patient=self.patient, doctor=doctor, diagnosis='Hypertension',
+                valid_until=date.today() + timedelta(days=30),
+            )
+        scan = scanned_pdf()
+        for index in range(self.LAB_REPORTS):
+            report = LabReport.objects.create(patient=self.patient, test_date=date.today(), is_completed=True)
+            attachment = LabReportAttachment(report=report, attachment_type='document')
+            attachment.file.save(f'scan{index}.pdf', ContentFile(scan))
+
+    def restore_executor(self):
+        exports._executor.shutdown(wait=True)
+        exports._executor = self.original_executor
+
+    def test_500_document_export_stays_under_rss_limit(self):
+        self.client.force_login(self.patient.user)
+        start = current_rss_mb()
+        response = self.client.get('/patient/records/export/')
+        self.assertEqual(response.status_code, 200)
+
+        archive_path = os.path.join(self.tmp, 'records.zip')
+        peak = max(start, current_rss_mb())
+        with open(archive_path, 'wb') as out:
+            for chunk in response.streaming_content:
+                out.write(chunk)
+                peak = max(peak, current_rss_mb())
+
+        size_mb = os.path.getsize(archive_path) / 1e6
+        self.assertGreater(size_mb, 2 * self.RSS_LIMIT_MB)
+        self.assertLess(peak - start, self.RSS_LIMIT_MB, f"RSS grew {peak - start:.0f} MB for a {size_mb:.0f} MB archive")
+
+        with zipfile.ZipFile(archive_path) as archive:
+            self.assertIsNone(archive.testzip())
+            names = archive.namelist()
+        self.assertNotIn('MISSING_FILES.txt', names)
+        self.assertEqual(sum(name.endswith('.pdf') for name in names), self.PRESCRIPTIONS + self.LAB_REPORTS)
+
+
+class ExportDownloadTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+
+        self.patient = PatientProfile.objects.create(user=User.objects.create(username='patient'))
+        doctor = DoctorProfile.objects.create(user=User.objects.create(username='doctor'), specialization='cardiology')
+        prescription = Prescription.objects.create(
+            patient=self.patient, doctor=doctor, diagnosis='Hypertension',
+            valid_until=date.today() + timedelta(days=30),
+        )
+        self.url = f'/patient/prescriptions/{prescription.id}/download/'
+
+        self.file_path = os.path.join(self.tmp, 'rx.pdf')
+        with open(self.file_path, 'wb') as out:
+            out.write(b'%PDF-1.4 rendered')
+        self.job = ExportJob.objects.create(
+            user=self.patient.user, kind='prescription', object_id=prescription.id,
+            source_key=exports.source_key('prescription', exports.load_source('prescription', prescription.id)),
+            status='done', file_path=self.file_path, filename='rx.pdf',
+        )
+        self.client.force_login(self.patient.user)
+
+    def test_finished_export_is_served(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 rendered')
+
+    def test_lost_export_file_is_rendered_again(self):
+        os.remove(self.file_path)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['job']['status'], 'queued')
+
+    def test_export_file_removed_after_the_check_is_rendered_again(self):
+        os.remove(self.file_path)
+        # The purge runs between finished_job() and opening the file
+        with mock.patch('patients.exports.os.path.exists', side_effect=[True, False]):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(ExportJob.objects.filter(status='queued').count(), 1)
@@ -4,6 +4,7 @@ from . import views
 
 urlpatterns = [
     path("overview/", patient_overview, name="patient-overview"),
+    path("events/", views.patient_events, name="patient-events"),
 
     path('sidebar-data/', views.get_patient_sidebar_data, name='patient-sidebar-data'),
     path('logout/', views.patient_logout, name='patient-logout'),
@@ -12,6 +13,8 @@ urlpatterns = [
     path('appointments/doctors/', views.get_available_doctors, name='get-available-doctors'),
     path('appointments/doctor-slots/<int:doctor_id>/', views.get_doctor_available_slots, name='doctor-slots'),
     path('appointments/book/', views.book_appointment, name='book-appointment'),
+    path('appointments/hold/', views.hold_appointment_slot, name='hold-appointment-slot'),
+    path('appointments/hold/<int:hold_id>/release/', views.release_appointment_slot, name='release-appointment-slot'),
     path('appointments/<int:appointment_id>/cancel/', views.cancel_appointment, name='cancel-appointment'),
     path('appointments/<int:appointment_id>/reschedule-options/', views.get_reschedule_options, name='get-reschedule-options'),
     path('appointments/<int:appointment_id>/reschedule/', views.reschedule_appointment, name='reschedule-appointment'),
@@ -24,6 +27,11 @@ urlpatterns = [
 
     path('lab-reports/', views.get_lab_reports, name='get-lab-reports'),
     path('lab-reports/<int:report_id>/download/', views.download_lab_report, name='download_lab_report'),
+
+    path('exports/', views.create_export, name='create-export'),
+    path('exports/<int:job_id>/', views.get_export_status, name='export-status'),
+    path('exports/<int:job_id>/download/', views.download_export, name='download-export'),
+    path('records/export/', views.export_all_records, name='export-all-records'),
     
     path('medicine-schedule/', views.get_medicine_schedule, name='get-medicine-schedule'),
     path('profile/', views.get_profile, name='get-profile'),
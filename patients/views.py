@@ -3,52 +3,30 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_protect
-from django.db.models import Q
+from django.db.models import Case, Q, Value, When
 from django.utils import timezone
 from .models import PatientProfile
-from doctors.models import DoctorProfile, Appointment, Prescription, DoctorSchedule, ConsultationHistory
+from mediconnect.stats import count_buckets
+from mediconnect.images import image_url
+from notifications.feed import latest_notifications, serialize_notification, notify_appointment_booked
+from notifications.events import event_stream_response
+from doctors.models import DoctorProfile, Appointment, Prescription, DoctorSchedule, ConsultationHistory, SlotHold
+from doctors.availability import DoctorAvailability, SLOT_LABELS, next_days
+from doctors.booking import SlotUnavailable, hold_slot, parse_slot_date, parse_slot_time, save_into_slot, slot_datetime
 import json
+import os
 from datetime import timedelta, datetime, time as dt_time, date
-from datetime import timedelta as dt_timedelta
 from staff.models import LabReport, LabReportParameter
-from django.http import HttpResponse
-
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import mm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, HRFlowable, Image, PageBreak
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-import io
-from PyPDF2 import PdfMerger
-import os
-from django.conf import settings
-
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from .archive import consultation_record, records_archive
+from .exports import load_source, request_export, serialize_job
+from .models import ExportJob
+from .pdf import prescription_etag, lab_report_etag
+from .specialties import match_specialties, specialty_details
 
 
-def auto_mark_missed_appointments():
-    from datetime import datetime
-    
-    now = timezone.now()
-    three_hours_ago = now - timedelta(hours=3)
-    
-    pending_appointments = Appointment.objects.filter(
-        status__in=['pending', 'confirmed']
-    )
-    
-    for apt in pending_appointments:
-        try:
-            apt_datetime_naive = datetime.combine(apt.appointment_date, apt.appointment_time)
-            apt_datetime = timezone.make_aware(apt_datetime_naive, timezone.get_current_timezone())
-            
-            if apt_datetime <= three_hours_ago:
-                apt.status = 'missed'
-                apt.save()
-                
-        except Exception as e:
-            print(f"Error processing appointment {apt.id}: {e}")
-            continue
-
 
 @login_required
 def patient_overview(request):
@@ -66,7 +44,6 @@ def patient_overview(request):
 
     now = timezone.now()
     today = now.date()
-    current_time = now.time()
 
     total_appointments = Appointment.objects.filter(patient=profile).count()
     active_prescriptions = Prescription.objects.filter(
@@ -90,19 +67,15 @@ def patient_overview(request):
     # Get ALL upcoming appointments (future appointments only)
     upcoming_appointments = Appointment.objects.filter(
         patient=profile,
-        status__in=['pending', 'confirmed']
-    ).exclude(
-        appointment_date__lt=today
-    ).exclude(
-        appointment_date=today,
-        appointment_time__lt=current_time
-    ).select_related('doctor__user').order_by('appointment_date', 'appointment_time')
+        status__in=['pending', 'confirmed'],
+        scheduled_at__gte=now
+    ).select_related('doctor__user').order_by('scheduled_at')
 
     upcoming_appointments_list = []
     for apt in upcoming_appointments:
         doctor_photo = None
         if hasattr(apt.doctor, 'profile_photo') and apt.doctor.profile_photo:
-            doctor_photo = request.build_absolute_uri(apt.doctor.profile_photo.url)
+            doctor_photo = image_url(request, apt.doctor, 'profile_photo', 'thumb')
 
         upcoming_appointments_list.append({
             'id': apt.id,
@@ -137,17 +110,16 @@ def patient_overview(request):
     # Get 3 most recent lab reports
     recent_lab_reports = LabReport.objects.filter(
         patient=profile
-    ).order_by('-test_date')[:3]
+    ).prefetch_related('test_sections').order_by('-test_date')[:3]
 
     recent_lab_reports_list = []
     for report in recent_lab_reports:
-        # Get test names from test_sections
-        test_sections = report.test_sections.all()
-        if test_sections.exists():
-            if test_sections.count() == 1:
-                test_name = test_sections.first().get_test_name()
-            else:
-                test_name = f"{test_sections.count()} Tests"
+        # Get test names from the prefetched test_sections
+        test_sections = list(report.test_sections.all())
+        if len(test_sections) == 1:
+            test_name = test_sections[0].get_test_name()
+        elif test_sections:
+            test_name = f"{len(test_sections)} Tests"
         else:
             test_name = "Lab Report"
         
@@ -158,23 +130,6 @@ def patient_overview(request):
             'status': report.overall_status,  # Changed from report.status
         })
 
-    def get_time_ago(past_datetime):
-        """Convert a past datetime to human readable 'X ago' string"""
-        diff = now - past_datetime
-        total_seconds = int(diff.total_seconds())
-
-        if total_seconds < 60:
-            return "Just now"
-        elif total_seconds < 3600:
-            minutes = total_seconds // 60
-            return f"{minutes} min ago"
-        elif total_seconds < 86400:
-            hours = total_seconds // 3600
-            return f"{hours} hr ago"
-        else:
-            days = total_seconds // 86400
-            return f"{days} day ago" if days == 1 else f"{days} days ago"
-
     def get_time_until(future_datetime):
         """Convert a future datetime to human readable 'in X' string"""
         diff = future_datetime - now
@@ -192,22 +147,18 @@ def patient_overview(request):
             days = total_seconds // 86400
             return f"in {days} day" if days == 1 else f"in {days} days"
 
-    # NOTIFICATIONS - Last 24 hours
+    # NOTIFICATIONS - Last 24 hours, read from the notification feed
     yesterday = now - timezone.timedelta(hours=24)
-    notifications_list = []
-    notif_id = 1
+    notifications_list = [
+        serialize_notification(notification, now)
+        for notification in latest_notifications(request.user, yesterday, 8)
+    ]
 
-    # ─────────────────────────────────────────────
-    # Notification 1: Upcoming appointment (next 48 hours)
-    # ─────────────────────────────────────────────
-    next_appointment = upcoming_appointments.first()
+    # Upcoming appointment (next 48 hours) depends on the current time rather
+    # than an event, so it is built from the list fetched above
+    next_appointment = upcoming_appointments[0] if upcoming_appointments else None
     if next_appointment:
-        from datetime import datetime as dt
-        apt_datetime_naive = dt.combine(
-            next_appointment.appointment_date,
-            next_appointment.appointment_time
-        )
-        apt_datetime = timezone.make_aware(apt_datetime_naive, timezone.get_current_timezone())
+        apt_datetime = next_appointment.scheduled_at
         time_until = apt_datetime - now
 
         # Only show if within next 48 hours
@@ -216,147 +167,16 @@ def patient_overview(request):
             priority = 'high' if hours_until < 3 else 'medium'
 
             notifications_list.append({
-                'id': notif_id,
+                'id': f'upcoming-{next_appointment.id}',
+                'type': 'appointment_upcoming',
                 'title': 'Upcoming Appointment',
                 'message': f"Appointment with {next_appointment.doctor.user.get_full_name()} on {next_appointment.appointment_date.strftime('%b %d')} at {next_appointment.appointment_time.strftime('%I:%M %p')}",
                 'priority': priority,
-                'time': get_time_until(apt_datetime)
+                'time': get_time_until(apt_datetime),
+                'is_read': False,
             })
-            notif_id += 1
-
-    # ─────────────────────────────────────────────
-    # Notification 2: New lab results (last 24 hours)
-    # ─────────────────────────────────────────────
-    recent_labs = LabReport.objects.filter(
-        patient=profile,
-        created_at__gte=yesterday
-    ).order_by('-created_at')[:3]
-
-    for lab in recent_labs:
-        # Get test name
-        test_sections = lab.test_sections.all()
-        if test_sections.exists():
-            if test_sections.count() == 1:
-                test_name = test_sections.first().get_test_name()
-            else:
-                test_name = f"{test_sections.count()} tests"
-        else:
-            test_name = "lab report"
-        
-        notifications_list.append({
-            'id': notif_id,
-            'title': '🧪 Lab Results Ready',
-            'message': f"Your {test_name} results are now available",
-            'priority': 'high' if lab.overall_status == 'critical' else 'medium',  
-            'time': get_time_ago(lab.created_at)
-        })
-        notif_id += 1
-
-    # ─────────────────────────────────────────────
-    # Notification 3: New prescription (last 24 hours)
-    # ─────────────────────────────────────────────
-    recent_prescriptions_notif = Prescription.objects.filter(
-        patient=profile,
-        created_at__gte=yesterday
-    ).order_by('-created_at')[:2]  # Show up to 2 recent prescriptions
-
-    for presc in recent_prescriptions_notif:
-        notifications_list.append({
-            'id': notif_id,
-            'title': '💊 New Prescription',
-            'message': f"Dr. {presc.doctor.user.get_full_name()} has issued a new prescription",
-            'priority': 'medium',
-            'time': get_time_ago(presc.created_at)
-        })
-        notif_id += 1
 
-    # ─────────────────────────────────────────────
-    # Notification 4: Missed appointment (last 24 hours only)
-    # ─────────────────────────────────────────────
-    cutoff_24h = now - timezone.timedelta(hours=24)
-    recent_missed = Appointment.objects.filter(
-        patient=profile,
-        status='missed',
-        appointment_date__gte=cutoff_24h.date(),
-        appointment_date__lte=today,
-    ).order_by('-appointment_date', '-appointment_time')[:2]
-
-    for apt in recent_missed:
-        from datetime import datetime as dt
-        apt_datetime_naive = dt.combine(apt.appointment_date, apt.appointment_time)
-        apt_datetime = timezone.make_aware(apt_datetime_naive, timezone.get_current_timezone())
-
-        # Skip if more than 24 hours have passed since the appointment
-        if (now - apt_datetime).total_seconds() > 86400:
-            continue
-
-        notifications_list.append({
-            'id': notif_id,
-            'title': '❌ Missed Appointment',
-            'message': f"You missed your appointment with Dr. {apt.doctor.user.get_full_name()} at {apt.appointment_time.strftime('%I:%M %p')}",
-            'priority': 'high',
-            'time': get_time_ago(apt_datetime)
-        })
-        notif_id += 1
-
-    # ─────────────────────────────────────────────
-    # Notification 5: Low medicine stock
-    # ─────────────────────────────────────────────
-    try:
-        from pharmacy.models import MedicineSchedule
-        low_stock_medicines = MedicineSchedule.objects.filter(
-            prescription__patient=profile,
-            status='active'
-        ).select_related('prescribed_medicine')
-
-        for med in low_stock_medicines:
-            stock_pct = med.stock_percentage
-            if stock_pct <= 15 and stock_pct > 0:
-                notifications_list.append({
-                    'id': notif_id,
-                    'title': '⚠️ Low Medicine Stock',
-                    'message': f"{med.prescribed_medicine.medicine_name} is running low ({med.remaining_quantity} left)",
-                    'priority': 'medium',
-                    'time': 'Now'
-                })
-                notif_id += 1
-            elif stock_pct == 0:
-                notifications_list.append({
-                    'id': notif_id,
-                    'title': '🚨 Medicine Out of Stock',
-                    'message': f"{med.prescribed_medicine.medicine_name} is out of stock. Please refill.",
-                    'priority': 'high',
-                    'time': 'Now'
-                })
-                notif_id += 1
-    except:
-        pass
-
-    # ─────────────────────────────────────────────
-    # Notification 6: New consultation history (last 24 hours)
-    # ─────────────────────────────────────────────
-    try:
-        from doctors.models import ConsultationHistory
-        recent_consultations = ConsultationHistory.objects.filter(
-            patient=profile,
-            created_at__gte=yesterday
-        ).order_by('-created_at')[:2]
-
-        for consult in recent_consultations:
-            notifications_list.append({
-                'id': notif_id,
-                'title': '🩺 Consultation Complete',
-                'message': f"Dr. {consult.doctor.user.get_full_name()} has recorded your consultation",
-                'priority': 'medium',
-                'time': get_time_ago(consult.created_at)
-            })
-            notif_id += 1
-    except:
-        pass
-
-    # ─────────────────────────────────────────────
     # Sort: high priority first, then by most recent
-    # ─────────────────────────────────────────────
     priority_order = {'high': 0, 'medium': 1, 'low': 2}
     notifications_list.sort(key=lambda x: priority_order.get(x['priority'], 2))
 
@@ -391,6 +211,15 @@ def patient_overview(request):
     return JsonResponse(data)
 
 
+@login_required
+async def patient_events(request):
+    """Server-Sent Events stream telling the dashboard what to refetch"""
+    user = await request.auser()
+    if not await PatientProfile.objects.filter(user=user).aexists():
+        return JsonResponse({"error": "Patient profile not found"}, status=404)
+    return event_stream_response(request, user)
+
+
 @login_required
 def get_patient_sidebar_data(request):
     try:
@@ -416,7 +245,7 @@ def get_patient_sidebar_data(request):
     
     profile_photo = None
     if profile.profile_photo:
-        profile_photo = request.build_absolute_uri(profile.profile_photo.url)
+        profile_photo = image_url(request, profile, 'profile_photo', 'thumb')
     
     return JsonResponse({
         "name": full_name,
@@ -433,8 +262,7 @@ def get_appointments(request):
     except PatientProfile.DoesNotExist:
         return JsonResponse({"error": "Patient profile not found"}, status=404)
     
-    auto_mark_missed_appointments()
-    
+    # Missed appointments are marked by the mark_missed_appointments command
     status_filter = request.GET.get('status', 'all')
     search_query = request.GET.get('search', '').strip()
     
@@ -454,7 +282,7 @@ def get_appointments(request):
     for apt in appointments:
         doctor_photo = None
         if hasattr(apt.doctor, 'profile_photo') and apt.doctor.profile_photo:
-            doctor_photo = request.build_absolute_uri(apt.doctor.profile_photo.url)
+            doctor_photo = image_url(request, apt.doctor, 'profile_photo', 'thumb')
 
         appointments_list.append({
             'id': apt.id,
@@ -471,16 +299,15 @@ def get_appointments(request):
         })
     
     today = timezone.now().date()
-    stats = {
-        'total': Appointment.objects.filter(patient=profile).count(),
-        'upcoming': Appointment.objects.filter(
-            patient=profile, appointment_date__gte=today, status__in=['pending', 'confirmed']
-        ).count(),
-        'completed': Appointment.objects.filter(patient=profile, status='completed').count(),
-        'cancelled': Appointment.objects.filter(patient=profile, status='cancelled').count(),
-        'missed': Appointment.objects.filter(patient=profile, status='missed').count(),
-        'needs_rescheduling': Appointment.objects.filter(patient=profile, status='needs_rescheduling').count(),
-    }
+    stats = count_buckets(
+        Appointment.objects.filter(patient=profile),
+        total=Q(),
+        upcoming=Q(appointment_date__gte=today, status__in=['pending', 'confirmed']),
+        completed=Q(status='completed'),
+        cancelled=Q(status='cancelled'),
+        missed=Q(status='missed'),
+        needs_rescheduling=Q(status='needs_rescheduling'),
+    )
     
     return JsonResponse({'appointments': appointments_list, 'stats': stats})
 
@@ -528,7 +355,13 @@ def book_appointment(request):
         except DoctorProfile.DoesNotExist:
             return JsonResponse({"error": "Doctor not found or not available"}, status=404)
         
-        appointment = Appointment.objects.create(
+        try:
+            appointment_date = parse_slot_date(appointment_date)
+            appointment_time = parse_slot_time(appointment_time)
+        except ValueError:
+            return JsonResponse({"error": "Invalid date or time format"}, status=400)
+        
+        appointment = Appointment(
             patient=profile,
             doctor=doctor,
             appointment_date=appointment_date,
@@ -538,6 +371,13 @@ def book_appointment(request):
             status='pending'
         )
         
+        try:
+            save_into_slot(appointment, profile)
+        except SlotUnavailable as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        
+        notify_appointment_booked(appointment)
+        
         doctor_location = doctor.room_location or 'Room 203, 2nd Floor'
         
         return JsonResponse({
@@ -553,6 +393,64 @@ def book_appointment(request):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@login_required
+@csrf_protect
+@require_http_methods(["POST"])
+def hold_appointment_slot(request):
+    try:
+        profile = request.user.patientprofile
+    except PatientProfile.DoesNotExist:
+        return JsonResponse({"error": "Patient profile not found"}, status=404)
+    
+    try:
+        data = json.loads(request.body)
+        
+        doctor_id = data.get('doctor_id')
+        appointment_date = data.get('appointment_date')
+        appointment_time = data.get('appointment_time')
+        
+        if not all([doctor_id, appointment_date, appointment_time]):
+            return JsonResponse({"error": "Doctor, date and time are required"}, status=400)
+        
+        try:
+            doctor = DoctorProfile.objects.get(id=doctor_id, is_available=True)
+        except DoctorProfile.DoesNotExist:
+            return JsonResponse({"error": "Doctor not found or not available"}, status=404)
+        
+        try:
+            scheduled_at = slot_datetime(parse_slot_date(appointment_date), parse_slot_time(appointment_time))
+        except ValueError:
+            return JsonResponse({"error": "Invalid date or time format"}, status=400)
+        
+        try:
+            hold = hold_slot(doctor, profile, scheduled_at)
+        except SlotUnavailable as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        
+        return JsonResponse({
+            "success": True,
+            "hold_id": hold.id,
+            "expires_at": hold.expires_at.isoformat(),
+        })
+        
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+@login_required
+@csrf_protect
+@require_http_methods(["POST"])
+def release_appointment_slot(request, hold_id):
+    try:
+        profile = request.user.patientprofile
+    except PatientProfile.DoesNotExist:
+        return JsonResponse({"error": "Patient profile not found"}, status=404)
+    
+    SlotHold.objects.filter(id=hold_id, patient=profile).delete()
+    
+    return JsonResponse({"success": True})
+
+
 @login_required
 def get_doctor_available_slots(request, doctor_id):
     try:
@@ -582,22 +480,10 @@ def get_doctor_available_slots(request, doctor_id):
         except:
             return JsonResponse({"error": "Invalid date format"}, status=400)
 
-        # Check if doctor has schedule for this day
-        day_map = {
-            0: 'monday', 1: 'tuesday', 2: 'wednesday', 3: 'thursday',
-            4: 'friday', 5: 'saturday', 6: 'sunday'
-        }
-        day_name = day_map[selected_date.weekday()]
-
-        has_schedule = DoctorSchedule.objects.filter(
-            doctor=doctor,
-            day_of_week=day_name,
-            is_active=True,
-            slot_type='consultation'
-        ).exists()
+        availability = DoctorAvailability([doctor.id], [selected_date], patient=profile)
 
         #  If no schedule → return off_day = True
-        if not has_schedule:
+        if not availability.works_on(doctor.id, selected_date):
             return JsonResponse({
                 'date': selected_date.isoformat(),
                 'off_day': True,
@@ -605,7 +491,7 @@ def get_doctor_available_slots(request, doctor_id):
             })
 
         #  Has schedule → return available time slots in 12hr format
-        available_times = get_available_time_slots(doctor, selected_date)
+        available_times = availability.free_slots(doctor.id, selected_date)
 
         return JsonResponse({
             'date': selected_date.isoformat(),
@@ -653,54 +539,8 @@ def get_doctor_available_slots(request, doctor_id):
     })
 
 
-def get_available_time_slots(doctor, check_date):
-    from doctors.models import DoctorSchedule
-    from datetime import datetime, timedelta as dt_timedelta
-
-    day_map = {
-        0: 'monday', 1: 'tuesday', 2: 'wednesday', 3: 'thursday',
-        4: 'friday', 5: 'saturday', 6: 'sunday'
-    }
-
-    day_name = day_map[check_date.weekday()]
-
-    schedules = DoctorSchedule.objects.filter(
-        doctor=doctor,
-        day_of_week=day_name,
-        is_active=True,
-        slot_type='consultation'
-    )
-
-    if not schedules.exists():
-        return []
-
-    # Get all booked times for this date
-    booked_times = Appointment.objects.filter(
-        doctor=doctor,
-        appointment_date=check_date,
-        status__in=['pending', 'confirmed']
-    ).values_list('appointment_time', flat=True)
-
-    booked_times_set = set(booked_times)
-    available_slots = []
-
-    for schedule in schedules:
-        current_slot = datetime.combine(check_date, schedule.start_time)
-        end_slot = datetime.combine(check_date, schedule.end_time)
-
-        while current_slot < end_slot:
-            slot_time = current_slot.time()
-
-            # Skip already booked slots
-            if slot_time not in booked_times_set:
-                hour = int(slot_time.strftime('%I'))
-                minute = slot_time.strftime('%M')
-                ampm = slot_time.strftime('%p')
-                available_slots.append(f"{hour}:{minute} {ampm}")
-
-            current_slot += dt_timedelta(minutes=15)
-
-    return available_slots
+def get_available_time_slots(doctor, check_date, patient=None):
+    return DoctorAvailability([doctor.id], [check_date], patient=patient).free_slots(doctor.id, check_date)
 
 
 @login_required
@@ -733,7 +573,7 @@ def auto_expire_prescriptions(patient_profile):
         patient=patient_profile,
         status='active',
         valid_until__lt=today
-    ).update(status='expired')
+    ).update(status='expired', updated_at=timezone.now())
 
 
 @login_required
@@ -825,11 +665,12 @@ def get_prescriptions(request):
         })
 
     all_prescriptions = Prescription.objects.filter(patient=profile)
-    stats = {
-        'total':   all_prescriptions.count(),
-        'active':  all_prescriptions.filter(status='active').count(),
-        'expired': all_prescriptions.filter(status='expired').count(),
-    }
+    stats = count_buckets(
+        all_prescriptions,
+        total=Q(),
+        active=Q(status='active'),
+        expired=Q(status='expired'),
+    )
 
     years = all_prescriptions.dates('prescribed_date', 'year', order='DESC')
     available_years = [year.year for year in years]
@@ -857,200 +698,11 @@ def download_prescription(request, prescription_id):
         return JsonResponse({"error": "Patient profile not found"}, status=404)
 
     try:
-        prescription = Prescription.objects.get(
-            id=prescription_id,
-            patient=profile
-        )
+        prescription = load_source('prescription', prescription_id, patient=profile)
     except Prescription.DoesNotExist:
         return JsonResponse({"error": "Prescription not found"}, status=404)
 
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=20*mm,
-        leftMargin=20*mm,
-        topMargin=20*mm,
-        bottomMargin=20*mm
-    )
-
-    styles = getSampleStyleSheet()
-    story = []
-
-    # Styles
-    title_style = ParagraphStyle(
-        'Title', parent=styles['Normal'],
-        fontSize=22, fontName='Helvetica-Bold',
-        textColor=colors.HexColor('#1D4ED8'),
-        alignment=TA_CENTER, spaceAfter=8,
-    )
-    section_style = ParagraphStyle(
-        'Section', parent=styles['Normal'],
-        fontSize=11, fontName='Helvetica-Bold',
-        textColor=colors.HexColor('#1F2937'),
-        spaceBefore=8, spaceAfter=4
-    )
-    normal_style = ParagraphStyle(
-        'Normal2', parent=styles['Normal'],
-        fontSize=10, textColor=colors.HexColor('#374151'),
-        spaceAfter=3
-    )
-    label_style = ParagraphStyle(
-        'Label', parent=styles['Normal'],
-        fontSize=9, textColor=colors.HexColor('#6B7280'),
-    )
-
-    # Header
-    story.append(Paragraph("MediConnect", title_style))
-    story.append(Spacer(1, 4*mm))
-    story.append(HRFlowable(width="100%", thickness=2, color=colors.HexColor('#3B82F6')))
-    story.append(Spacer(1, 5*mm))
-
-    rx_data = [
-        [
-            Paragraph(f"<b>Prescription No:</b> {prescription.prescription_number}", normal_style),
-            Paragraph(f"<b>Status:</b> {prescription.status.upper()}", normal_style),
-            Paragraph(f"<b>Date:</b> {prescription.prescribed_date.strftime('%b %d, %Y')}", normal_style),
-        ]
-    ]
-    rx_table = Table(rx_data, colWidths=[60*mm, 50*mm, 60*mm])
-    rx_table.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#EFF6FF')),
-        ('ROUNDEDCORNERS', [5]),
-        ('TOPPADDING', (0,0), (-1,-1), 8),
-        ('BOTTOMPADDING', (0,0), (-1,-1), 8),
-        ('LEFTPADDING', (0,0), (-1,-1), 8),
-    ]))
-    story.append(rx_table)
-    story.append(Spacer(1, 5*mm))
-
-    patient_name = profile.user.get_full_name() or profile.user.username
-    doctor_name = f"Dr. {prescription.doctor.user.get_full_name()}"
-    specialty = prescription.doctor.get_specialty_display()
-
-    info_data = [
-        [
-            Paragraph("<b>PATIENT INFORMATION</b>", label_style),
-            Paragraph("<b>PRESCRIBED BY</b>", label_style),
-        ],
-        [
-            Paragraph(f"<b>{patient_name}</b>", normal_style),
-            Paragraph(f"<b>{doctor_name}</b>", normal_style),
-        ],
-        [
-            Paragraph(f"ID: {profile.patient_id}", normal_style),
-            Paragraph(f"{specialty}", normal_style),
-        ],
-        [
-            Paragraph(f"Valid Until: {prescription.valid_until.strftime('%b %d, %Y')}", normal_style),
-            Paragraph(f"MediConnect Hospital", normal_style),
-        ],
-    ]
-    info_table = Table(info_data, colWidths=[85*mm, 85*mm])
-    info_table.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (-1,-1), colors.white),
-        ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#E5E7EB')),
-        ('LINEAFTER', (0,0), (0,-1), 1, colors.HexColor('#E5E7EB')),
-        ('TOPPADDING', (0,0), (-1,-1), 5),
-        ('BOTTOMPADDING', (0,0), (-1,-1), 5),
-        ('LEFTPADDING', (0,0), (-1,-1), 8),
-    ]))
-    story.append(info_table)
-    story.append(Spacer(1, 5*mm))
-
-    if prescription.diagnosis:
-        story.append(Paragraph("DIAGNOSIS", label_style))
-        diag_data = [[Paragraph(prescription.diagnosis, normal_style)]]
-        diag_table = Table(diag_data, colWidths=[170*mm])
-        diag_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#F9FAFB')),
-            ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#E5E7EB')),
-            ('TOPPADDING', (0,0), (-1,-1), 8),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 8),
-            ('LEFTPADDING', (0,0), (-1,-1), 8),
-        ]))
-        story.append(diag_table)
-        story.append(Spacer(1, 5*mm))
-
-    story.append(Paragraph("PRESCRIBED MEDICINES", label_style))
-    story.append(Spacer(1, 2*mm))
-
-    med_header = [
-        Paragraph('<b>Medicine</b>', normal_style),
-        Paragraph('<b>Dosage</b>', normal_style),
-        Paragraph('<b>Frequency</b>', normal_style),
-        Paragraph('<b>Duration</b>', normal_style),
-    ]
-    med_rows = [med_header]
-
-    for i, med in enumerate(prescription.medicines.all()):
-        row_bg = colors.HexColor('#F9FAFB') if i % 2 == 0 else colors.white
-        med_rows.append([
-            Paragraph(med.medicine_name, normal_style),
-            Paragraph(med.dosage, normal_style),
-            Paragraph(med.frequency, normal_style),
-            Paragraph(med.duration, normal_style),
-        ])
-
-    med_table = Table(med_rows, colWidths=[55*mm, 35*mm, 45*mm, 35*mm])
-    med_table.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#3B82F6')),
-        ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-        ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-        ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.HexColor('#F9FAFB'), colors.white]),
-        ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#E5E7EB')),
-        ('INNERGRID', (0,0), (-1,-1), 0.5, colors.HexColor('#E5E7EB')),
-        ('TOPPADDING', (0,0), (-1,-1), 7),
-        ('BOTTOMPADDING', (0,0), (-1,-1), 7),
-        ('LEFTPADDING', (0,0), (-1,-1), 8),
-    ]))
-    story.append(med_table)
-    story.append(Spacer(1, 5*mm))
-
-    has_instructions = any(
-        med.instructions for med in prescription.medicines.all()
-    )
-    if has_instructions:
-        story.append(Paragraph("INSTRUCTIONS", label_style))
-        for med in prescription.medicines.all():
-            if med.instructions:
-                story.append(Paragraph(
-                    f"<b>{med.medicine_name}:</b> {med.instructions}",
-                    normal_style
-                ))
-        story.append(Spacer(1, 4*mm))
-
-    if prescription.notes:
-        story.append(Paragraph("ADDITIONAL NOTES", label_style))
-        notes_data = [[Paragraph(prescription.notes, normal_style)]]
-        notes_table = Table(notes_data, colWidths=[170*mm])
-        notes_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#FFFBEB')),
-            ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#FCD34D')),
-            ('TOPPADDING', (0,0), (-1,-1), 8),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 8),
-            ('LEFTPADDING', (0,0), (-1,-1), 8),
-        ]))
-        story.append(notes_table)
-        story.append(Spacer(1, 5*mm))
-
-    # Footer
-    story.append(HRFlowable(width="100%", thickness=1, color=colors.HexColor('#E5E7EB')))
-    story.append(Spacer(1, 3*mm))
-    story.append(Paragraph(
-        "This prescription was generated by MediConnect. For queries, contact your doctor.",
-        ParagraphStyle('Footer', parent=styles['Normal'],
-            fontSize=8, textColor=colors.HexColor('#9CA3AF'), alignment=TA_CENTER)
-    ))
-
-    doc.build(story)
-    buffer.seek(0)
-
-    response = HttpResponse(buffer, content_type='application/pdf')
-    response['Content-Disposition'] = (
-        f'attachment; filename="prescription_{prescription.prescription_number}.pdf"'
-    )
-    return response
+    return export_download_response(request, 'prescription', prescription, prescription_etag(prescription))
 
 
 @login_required
@@ -1171,6 +823,7 @@ def get_lab_reports(request):
                 'id': attachment.id,
                 'type': attachment.attachment_type,  
                 'url': request.build_absolute_uri(attachment.file.url) if attachment.file else None,
+                'previewUrl': image_url(request, attachment, 'file', 'medium') if attachment.file else None,
                 'filename': attachment.file.name.split('/')[-1] if attachment.file else None,
             })
         
@@ -1213,13 +866,14 @@ def get_lab_reports(request):
         })
     
     all_reports = LabReport.objects.filter(patient=profile)
-    stats = {
-        'total': all_reports.count(),
-        'normal': all_reports.filter(overall_status='normal', is_completed=True).count(),
-        'abnormal': all_reports.filter(overall_status='abnormal', is_completed=True).count(),
-        'critical': all_reports.filter(overall_status='critical', is_completed=True).count(),
-        'pending': all_reports.filter(is_completed=False).count(),
-    }
+    stats = count_buckets(
+        all_reports,
+        total=Q(),
+        normal=Q(overall_status='normal', is_completed=True),
+        abnormal=Q(overall_status='abnormal', is_completed=True),
+        critical=Q(overall_status='critical', is_completed=True),
+        pending=Q(is_completed=False),
+    )
     
     years = all_reports.dates('test_date', 'year', order='DESC')
     available_years = [year.year for year in years]
@@ -1248,309 +902,117 @@ def download_lab_report(request, report_id):
         return JsonResponse({"error": "Patient profile not found"}, status=404)
     
     try:
-        report = LabReport.objects.get(id=report_id, patient=profile)
+        report = load_source('lab_report', report_id, patient=profile)
     except LabReport.DoesNotExist:
         return JsonResponse({"error": "Lab report not found"}, status=404)
-    
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=A4,
-        rightMargin=20*mm,
-        leftMargin=20*mm,
-        topMargin=20*mm,
-        bottomMargin=20*mm
-    )
-    
-    styles = getSampleStyleSheet()
-    story = []
-    
-    # Custom Styles
-    title_style = ParagraphStyle(
-        'Title', parent=styles['Normal'],
-        fontSize=24, fontName='Helvetica-Bold',
-        textColor=colors.HexColor('#8B5CF6'),
-        alignment=TA_CENTER, spaceAfter=8,
-    )
-    section_style = ParagraphStyle(
-        'Section', parent=styles['Normal'],
-        fontSize=12, fontName='Helvetica-Bold',
-        textColor=colors.HexColor('#1F2937'),
-        spaceBefore=10, spaceAfter=6
-    )
-    normal_style = ParagraphStyle(
-        'Normal2', parent=styles['Normal'],
-        fontSize=10, textColor=colors.HexColor('#374151'),
-        spaceAfter=3
+
+    return export_download_response(request, 'lab_report', report, lab_report_etag(report))
+
+
+def export_download_response(request, kind, source, key):
+    """
+    Serve the finished export of this version of `source`, or queue one and
+    answer 202 with the job so the client can poll it. `key` is the
+    version's PDF hash and doubles as the ETag.
+    """
+    etag = quote_etag(key)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        patch_cache_control(not_modified, private=True, no_cache=True)
+        return not_modified
+
+    job = request_export(request.user, kind, source, key=key)
+    export_file = None
+    if job.status == 'done':
+        try:
+            export_file = open(job.file_path, 'rb')
+        except FileNotFoundError:
+            # Purged or lost after the job finished: render it again
+            job = request_export(request.user, kind, source, key=key)
+    if export_file is None:
+        return JsonResponse({"success": True, "job": serialize_job(job)}, status=202)
+
+    response = FileResponse(
+        export_file,
+        as_attachment=True,
+        filename=job.filename,
+        content_type='application/pdf',
     )
-    label_style = ParagraphStyle(
-        'Label', parent=styles['Normal'],
-        fontSize=9, textColor=colors.HexColor('#6B7280'),
-        fontName='Helvetica-Bold'
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+@csrf_protect
+@require_http_methods(["POST"])
+def create_export(request):
+    try:
+        profile = request.user.patientprofile
+    except PatientProfile.DoesNotExist:
+        return JsonResponse({"error": "Patient profile not found"}, status=404)
+
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+
+    kind = data.get('type')
+    if kind not in dict(ExportJob.KIND_CHOICES):
+        return JsonResponse({"error": "type must be 'prescription' or 'lab_report'"}, status=400)
+
+    try:
+        source = load_source(kind, data.get('id'), patient=profile)
+    except (Prescription.DoesNotExist, LabReport.DoesNotExist, ValueError, TypeError):
+        return JsonResponse({"error": "Document not found"}, status=404)
+
+    job = request_export(request.user, kind, source)
+    return JsonResponse({"success": True, "job": serialize_job(job)}, status=200 if job.status == 'done' else 202)
+
+
+@login_required
+def get_export_status(request, job_id):
+    try:
+        job = ExportJob.objects.get(id=job_id, user=request.user)
+    except ExportJob.DoesNotExist:
+        return JsonResponse({"error": "Export not found"}, status=404)
+
+    return JsonResponse({"success": True, "job": serialize_job(job)})
+
+
+@login_required
+def download_export(request, job_id):
+    try:
+        job = ExportJob.objects.get(id=job_id, user=request.user)
+    except ExportJob.DoesNotExist:
+        return JsonResponse({"error": "Export not found"}, status=404)
+
+    if job.status != 'done':
+        return JsonResponse({"error": "Export is not ready", "job": serialize_job(job)}, status=409)
+    if not os.path.exists(job.file_path):
+        return JsonResponse({"error": "Export has expired, please request it again"}, status=410)
+
+    response = FileResponse(
+        open(job.file_path, 'rb'),
+        as_attachment=True,
+        filename=job.filename,
+        content_type='application/pdf',
     )
-    
-    # Header & Report Details
-    
-    story.append(Paragraph("LAB REPORT", title_style))
-    story.append(Paragraph("MediConnect Hospital", 
-        ParagraphStyle('Subtitle', parent=styles['Normal'],
-            fontSize=11, textColor=colors.HexColor('#6B7280'),
-            alignment=TA_CENTER, spaceAfter=10)
-    ))
-    story.append(HRFlowable(width="100%", thickness=2, color=colors.HexColor('#8B5CF6')))
-    story.append(Spacer(1, 5*mm))
-    
-    status_color = {
-        'normal': '#10B981',
-        'abnormal': '#F59E0B',
-        'critical': '#EF4444',
-        'pending': '#6366F1'
-    }.get(report.overall_status if report.is_completed else 'pending', '#6B7280')
-    
-    status_text = report.overall_status.upper() if report.is_completed else 'PENDING'
-    
-    info_data = [
-        [
-            Paragraph(f"<b>Report No:</b> {report.report_number}", normal_style),
-            Paragraph(f"<b>Status:</b> <font color='{status_color}'>{status_text}</font>", normal_style),
-        ]
-    ]
-    info_table = Table(info_data, colWidths=[85*mm, 85*mm])
-    info_table.setStyle(TableStyle([
-        ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#F9FAFB')),
-        ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#E5E7EB')),
-        ('TOPPADDING', (0,0), (-1,-1), 10),
-        ('BOTTOMPADDING', (0,0), (-1,-1), 10),
-        ('LEFTPADDING', (0,0), (-1,-1), 10),
-    ]))
-    story.append(info_table)
-    story.append(Spacer(1, 5*mm))
-    
-    # Patient & Test Info
-    patient_name = profile.user.get_full_name() or profile.user.username
-    
-    # Get test names from test_sections
-    test_sections = report.test_sections.all()
-    if test_sections.exists():
-        if test_sections.count() == 1:
-            test_name = test_sections.first().get_test_name()
-        else:
-            test_name = f"{test_sections.count()} Tests"
-    else:
-        test_name = "Lab Report"
-    
-    details_data = [
-        [Paragraph("<b>PATIENT INFORMATION</b>", label_style),
-         Paragraph("<b>TEST INFORMATION</b>", label_style)],
-        [Paragraph(f"<b>{patient_name}</b>", normal_style),
-         Paragraph(f"<b>{test_name}</b>", normal_style)],
-        [Paragraph(f"ID: {profile.patient_id}", normal_style),
-         Paragraph(f"Test Date: {report.test_date.strftime('%b %d, %Y')}", normal_style)],
-        [Paragraph(f"Age: {profile.age or 'N/A'} | Gender: {profile.get_gender_display_short() or 'N/A'}", normal_style),
-         Paragraph("", normal_style)],
-    ]
-    
-    if report.uploaded_by:
-        details_data.append([
-            Paragraph("", normal_style),
-            Paragraph(f"Uploaded by: {report.uploaded_by.user.get_full_name()}", normal_style)
-        ])
-    
-    details_table = Table(details_data, colWidths=[85*mm, 85*mm])
-    details_table.setStyle(TableStyle([
-        ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#E5E7EB')),
-        ('LINEAFTER', (0,0), (0,-1), 1, colors.HexColor('#E5E7EB')),
-        ('TOPPADDING', (0,0), (-1,-1), 6),
-        ('BOTTOMPADDING', (0,0), (-1,-1), 6),
-        ('LEFTPADDING', (0,0), (-1,-1), 10),
-    ]))
-    story.append(details_table)
-    story.append(Spacer(1, 5*mm))
-    
-    
-    # Test Sections with Parameters
-    if test_sections.exists():
-        for section in test_sections:
-            # Section header
-            story.append(Paragraph(
-                f"{section.get_test_name()} - {section.get_category_display_name()}", 
-                section_style
-            ))
-            
-            section_status_color = {
-                'Normal': '#10B981',
-                'Abnormal': '#F59E0B',
-                'Critical': '#EF4444'
-            }.get(section.status, '#6B7280')
-            
-            story.append(Paragraph(
-                f"<b>Result:</b> <font color='{section_status_color}'>{section.status.upper()}</font>",
-                normal_style
-            ))
-            story.append(Spacer(1, 2*mm))
-            
-            if section.findings:
-                findings_data = [[Paragraph(f"<b>Findings:</b> {section.findings}", normal_style)]]
-                findings_table = Table(findings_data, colWidths=[170*mm])
-                findings_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0,0), (-1,-1), colors.HexColor('#F0F9FF')),
-                    ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#3B82F6')),
-                    ('TOPPADDING', (0,0), (-1,-1), 8),
-                    ('BOTTOMPADDING', (0,0), (-1,-1), 8),
-                    ('LEFTPADDING', (0,0), (-1,-1), 10),
-                ]))
-                story.append(findings_table)
-                story.append(Spacer(1, 3*mm))
-            
-            parameters = section.parameters.all()
-            if parameters.exists():
-                param_header = [
-                    Paragraph('<b>Parameter</b>', normal_style),
-                    Paragraph('<b>Value</b>', normal_style),
-                    Paragraph('<b>Normal Range</b>', normal_style),
-                    Paragraph('<b>Status</b>', normal_style),
-                ]
-                param_rows = [param_header]
-                
-                for param in parameters:
-                    status_badge_color = {
-                        'Normal': '#10B981',
-                        'High': '#EF4444',
-                        'Low': '#3B82F6',
-                        'Critical': '#DC2626'
-                    }.get(param.status, '#6B7280')
-                    
-                    param_rows.append([
-                        Paragraph(param.name, normal_style),
-                        Paragraph(f"{param.value} {param.unit or ''}", normal_style),
-                        Paragraph(param.normal_range or '-', normal_style),
-                        Paragraph(f"<font color='{status_badge_color}'><b>{param.status}</b></font>", normal_style),
-                    ])
-                
-                param_table = Table(param_rows, colWidths=[50*mm, 35*mm, 50*mm, 35*mm])
-                param_table.setStyle(TableStyle([
-                    ('BACKGROUND', (0,0), (-1,0), colors.HexColor('#8B5CF6')),
-                    ('TEXTCOLOR', (0,0), (-1,0), colors.white),
-                    ('FONTNAME', (0,0), (-1,0), 'Helvetica-Bold'),
-                    ('ROWBACKGROUNDS', (0,1), (-1,-1), [colors.HexColor('#F9FAFB'), colors.white]),
-                    ('BOX', (0,0), (-1,-1), 1, colors.HexColor('#E5E7EB')),
-                    ('INNERGRID', (0,0), (-1,-1), 0.5, colors.HexColor('#E5E7EB')),
-                    ('TOPPADDING', (0,0), (-1,-1), 8),
-                    ('BOTTOMPADDING', (0,0), (-1,-1), 8),
-                    ('LEFTPADDING', (0,0), (-1,-1), 8),
-                ]))
-                story.append(param_table)
-                story.append(Spacer(1, 5*mm))
-    
-
-    if report.notes:
-        story.append(Paragraph("NOTES & RECOMMENDATIONS", section_style))
-        note_color = '#FEF2F2' if report.overall_status == 'critical' else '#FFFBEB'
-        border_color = '#DC2626' if report.overall_status == 'critical' else '#F59E0B'
-        
-        notes_data = [[Paragraph(report.notes, normal_style)]]
-        notes_table = Table(notes_data, colWidths=[170*mm])
-        notes_table.setStyle(TableStyle([
-            ('BACKGROUND', (0,0), (-1,-1), colors.HexColor(note_color)),
-            ('BOX', (0,0), (-1,-1), 2, colors.HexColor(border_color)),
-            ('TOPPADDING', (0,0), (-1,-1), 10),
-            ('BOTTOMPADDING', (0,0), (-1,-1), 10),
-            ('LEFTPADDING', (0,0), (-1,-1), 10),
-        ]))
-        story.append(notes_table)
-        story.append(Spacer(1, 5*mm))
-    
-    
-    image_attachments = report.attachments.filter(attachment_type='image')
-    
-    if report.report_image:
-        image_attachments_list = list(image_attachments)
-        old_image_exists = False
-        for att in image_attachments_list:
-            if att.file and att.file.path == report.report_image.path:
-                old_image_exists = True
-                break
-        
-        if not old_image_exists:
-            class OldImageAttachment:
-                def __init__(self, file):
-                    self.file = file
-                    self.attachment_type = 'image'
-            
-            image_attachments_list.append(OldImageAttachment(report.report_image))
-    else:
-        image_attachments_list = list(image_attachments)
-    
-    for idx, attachment in enumerate(image_attachments_list, 1):
-        if attachment.file:
-            story.append(PageBreak()) 
-            story.append(Paragraph(f"ATTACHED IMAGE {idx}", section_style))
-            story.append(Spacer(1, 3*mm))
-            
-            try:
-                img_path = attachment.file.path
-                img = Image(img_path, width=160*mm, height=200*mm, kind='proportional')
-                story.append(img)
-                story.append(Spacer(1, 3*mm))
-                
-                caption = Paragraph(
-                    f"<i>Image {idx}: {os.path.basename(attachment.file.name)}<br/>"
-                    f"Uploaded: {report.created_at.strftime('%b %d, %Y')}</i>",
-                    ParagraphStyle('Caption', parent=styles['Normal'],
-                        fontSize=9, textColor=colors.HexColor('#6B7280'),
-                        alignment=TA_CENTER)
-                )
-                story.append(caption)
-            except Exception as e:
-                story.append(Paragraph(f"<i>Error loading image {idx}: {str(e)}</i>", normal_style))
-    
-    doc.build(story)
-    
- 
-    document_attachments = report.attachments.filter(attachment_type='document')
-    
-    pdf_files_to_merge = []
-    
-    for attachment in document_attachments:
-        if attachment.file and attachment.file.name.lower().endswith('.pdf'):
-            pdf_files_to_merge.append(attachment.file.path)
-    
-    if report.report_file and report.report_file.name.lower().endswith('.pdf'):
-        if report.report_file.path not in pdf_files_to_merge:
-            pdf_files_to_merge.append(report.report_file.path)
-    
-    # Merge PDFs if any exist
-    if pdf_files_to_merge:
-        try:
-            merger = PdfMerger()
-            
-            buffer.seek(0)
-            merger.append(buffer)
-            
-            for pdf_path in pdf_files_to_merge:
-                try:
-                    merger.append(pdf_path)
-                except Exception as e:
-                    print(f"Error merging PDF {pdf_path}: {e}")
-            
-            final_buffer = io.BytesIO()
-            merger.write(final_buffer)
-            merger.close()
-            final_buffer.seek(0)
-            
-            buffer = final_buffer
-        except Exception as e:
-            print(f"Error merging PDFs: {e}")
-            buffer.seek(0)
-    else:
-        buffer.seek(0)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
-    # Return PDF
-    patient_name_safe = patient_name.replace(' ', '_')
-    filename = f"LabReport_{report.report_number}_{patient_name_safe}_{report.test_date.strftime('%Y%m%d')}.pdf"
-    
-    response = HttpResponse(buffer, content_type='application/pdf')
+
+@login_required
+def export_all_records(request):
+    try:
+        profile = request.user.patientprofile
+    except PatientProfile.DoesNotExist:
+        return JsonResponse({"error": "Patient profile not found"}, status=404)
+
+    filename = f"MediConnect_Records_{profile.patient_id}_{timezone.localdate().strftime('%Y%m%d')}.zip"
+    response = StreamingHttpResponse(records_archive(profile), content_type='application/zip')
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    patch_cache_control(response, private=True, no_store=True)
     return response
 
 
@@ -1643,7 +1105,7 @@ def get_profile(request):
     
     profile_photo_url = None
     if profile.profile_photo:
-        profile_photo_url = request.build_absolute_uri(profile.profile_photo.url)
+        profile_photo_url = image_url(request, profile, 'profile_photo', 'medium')
     
     gender_display = None
     if profile.gender:
@@ -1746,7 +1208,7 @@ def upload_profile_photo(request):
         return JsonResponse({
             "success": True,
             "message": "Profile photo uploaded successfully",
-            "photoUrl": request.build_absolute_uri(profile.profile_photo.url)
+            "photoUrl": image_url(request, profile, 'profile_photo', 'medium')
         })
         
     except Exception as e:
@@ -1825,38 +1287,8 @@ def get_consultation_history(request):
     end_idx = start_idx + per_page
     paginated_consultations = consultations[start_idx:end_idx]
     
-    consultations_list = []
-    for consultation in paginated_consultations:  
-        vital_signs = {}
-        if consultation.blood_pressure:
-            vital_signs['bloodPressure'] = consultation.blood_pressure
-        if consultation.heart_rate:
-            vital_signs['heartRate'] = consultation.heart_rate
-        if consultation.temperature:
-            vital_signs['temperature'] = consultation.temperature
-        if consultation.weight:
-            vital_signs['weight'] = consultation.weight
-        if consultation.height:
-            vital_signs['height'] = consultation.height
-        
-        consultations_list.append({
-            'id': consultation.id,
-            'consultationNumber': consultation.consultation_number,
-            'doctorName': f"Dr. {consultation.doctor.user.get_full_name()}",
-            'specialty': consultation.doctor.get_specialty_display(),
-            'date': consultation.consultation_date.isoformat(),
-            'time': consultation.consultation_time.strftime('%I:%M %p'),
-            'type': consultation.get_consultation_type_display(),
-            'chiefComplaint': consultation.chief_complaint,
-            'diagnosis': consultation.diagnosis,
-            'symptoms': consultation.get_symptoms_list(),
-            'vitalSigns': vital_signs,
-            'examination': consultation.examination_findings or '',
-            'treatmentPlan': consultation.treatment_plan,
-            'prescriptionIssued': 'Yes' if consultation.prescription_issued else 'No',
-            'followUpDate': consultation.follow_up_date.isoformat() if consultation.follow_up_date else None,
-            'notes': consultation.notes or ''
-        })
+    consultations_list = [consultation_record(consultation) for consultation in paginated_consultations]
+
     all_consultations = ConsultationHistory.objects.filter(patient=profile)
     
     current_year = timezone.now().year
@@ -1912,75 +1344,25 @@ def get_all_doctors(request):
             doctors = doctors.filter(specialization=specialty)
         
         if search:
-            search_lower = search.lower()
-            
-            symptom_to_specialty = {
-                # Heart-related
-                'heart': 'cardiology',
-                'chest pain': 'cardiology',
-                'chest': 'cardiology',
-                'palpitation': 'cardiology',
-                'blood pressure': 'cardiology',
-                'bp': 'cardiology',
-                
-                # Brain/Head-related
-                'head': 'neurology',
-                'headache': 'neurology',
-                'migraine': 'neurology',
-                'dizzy': 'neurology',
-                'dizziness': 'neurology',
-                'seizure': 'neurology',
-                'stroke': 'neurology',
-                'brain': 'neurology',
-                
-                # Bones/Joints
-                'walk': 'orthopedics',
-                'walking': 'orthopedics',
-                'leg': 'orthopedics',
-                'back pain': 'orthopedics',
-                'back': 'orthopedics',
-                'joint': 'orthopedics',
-                'bone': 'orthopedics',
-                'knee': 'orthopedics',
-                'hip': 'orthopedics',
-                
-                # Stomach/Digestive
-                'stomach': 'gastroenterology',
-                'digestion': 'gastroenterology',
-                'diarrhea': 'gastroenterology',
-                'constipation': 'gastroenterology',
-                
-                # Pregnancy/Women
-                'pregnant': 'gynecology',
-                'pregnancy': 'gynecology',
-                'period': 'gynecology',
-                'menstrual': 'gynecology',
-                
-                # General
-                'fever': 'general',
-                'cold': 'general',
-                'cough': 'general',
-                'flu': 'general',
-                'neck': 'general',
-                'dont': 'general',
-                'unable': 'general',
-            }
-            
-            # Check if search contains any symptom keywords
-            matched_specialty = None
-            for keyword, spec in symptom_to_specialty.items():
-                if keyword in search_lower:
-                    matched_specialty = spec
-                    break
-            
-            if matched_specialty:
-                doctors = doctors.filter(specialization=matched_specialty)
-            else:
+            name_match = (
+                Q(user__first_name__icontains=search) |
+                Q(user__last_name__icontains=search) |
+                Q(specialization__icontains=search)
+            )
+            # Symptom searches rank every matching specialty instead of
+            # keeping only the first one found
+            matches = match_specialties(search)
+            if matches:
                 doctors = doctors.filter(
-                    Q(user__first_name__icontains=search) |
-                    Q(user__last_name__icontains=search) |
-                    Q(specialization__icontains=search)
-                )
+                    Q(specialization__in=[code for code, _ in matches]) | name_match
+                ).annotate(
+                    match_score=Case(
+                        *[When(specialization=code, then=Value(score)) for code, score in matches],
+                        default=Value(0),
+                    )
+                ).order_by('-match_score', 'id')
+            else:
+                doctors = doctors.filter(name_match)
         
         doctors_list = []
         for doctor in doctors:
@@ -1988,7 +1370,7 @@ def get_all_doctors(request):
             
             profile_photo = None
             if hasattr(doctor, 'profile_photo') and doctor.profile_photo:
-                profile_photo = request.build_absolute_uri(doctor.profile_photo.url)
+                profile_photo = image_url(request, doctor, 'profile_photo', 'thumb')
             
             first_name = doctor.user.first_name or ""
             last_name = doctor.user.last_name or ""
@@ -2031,116 +1413,9 @@ def get_all_doctors(request):
         ).values_list('specialization', flat=True).distinct()
         
         specialties_with_info = []
-        specialty_details = {
-            'cardiology': {
-                'icon': '🫀',
-                'description': 'Heart and blood vessel specialists',
-                'commonConditions': [
-                    'Chest pain or discomfort',
-                    'High blood pressure',
-                    'Irregular heartbeat',
-                    'Heart disease prevention'
-                ]
-            },
-            'neurology': {
-                'icon': '🧠',
-                'description': 'Brain, nerve and nervous system experts',
-                'commonConditions': [
-                    'Severe or recurring headaches',
-                    'Seizures or epilepsy',
-                    'Stroke or paralysis',
-                    'Memory problems'
-                ]
-            },
-            'orthopedics': {
-                'icon': '🦴',
-                'description': 'Bone, joint and muscle specialists',
-                'commonConditions': [
-                    'Back or joint pain',
-                    'Sports injuries',
-                    'Difficulty walking',
-                    'Fractures or arthritis'
-                ]
-            },
-            'pediatrics': {
-                'icon': '👶',
-                'description': 'Child health specialists',
-                'commonConditions': [
-                    'Child fever or infections',
-                    'Growth concerns',
-                    'Vaccinations',
-                    'Developmental issues'
-                ]
-            },
-            'dermatology': {
-                'icon': '🩹',
-                'description': 'Skin, hair and nail specialists',
-                'commonConditions': [
-                    'Skin rashes or acne',
-                    'Hair loss',
-                    'Allergies',
-                    'Skin infections'
-                ]
-            },
-            'gynecology': {
-                'icon': '🤰',
-                'description': 'Women\'s health specialists',
-                'commonConditions': [
-                    'Pregnancy care',
-                    'Menstrual problems',
-                    'Reproductive health',
-                    'Prenatal checkups'
-                ]
-            },
-            'general': {
-                'icon': '🩺',
-                'description': 'First point of care for all health concerns',
-                'commonConditions': [
-                    'Fever, cold or flu',
-                    'General check-ups',
-                    'Stomach problems',
-                    'Not sure what\'s wrong'
-                ]
-            },
-            'ent': {
-                'icon': '👂',
-                'description': 'Ear, nose and throat specialists',
-                'commonConditions': [
-                    'Ear infections',
-                    'Sinus problems',
-                    'Throat pain',
-                    'Hearing issues'
-                ]
-            },
-            'ophthalmology': {
-                'icon': '👁️',
-                'description': 'Eye care specialists',
-                'commonConditions': [
-                    'Vision problems',
-                    'Eye infections',
-                    'Cataracts or glaucoma',
-                    'Eye exams'
-                ]
-            },
-            'gastroenterology': {
-                'icon': '🤢',
-                'description': 'Digestive system specialists',
-                'commonConditions': [
-                    'Stomach pain',
-                    'Digestive problems',
-                    'Diarrhea or constipation',
-                    'Liver issues'
-                ]
-            },
-        }
-        
         for spec_code in all_specialties:
             spec_name = dict(DoctorProfile.SPECIALTY_CHOICES).get(spec_code, spec_code)
-            spec_info = specialty_details.get(spec_code, {
-                'icon': '🩺',
-                'description': 'Medical specialist',
-                'commonConditions': ['Various medical conditions']
-            })
+            spec_info = specialty_details(spec_code)
             
             specialties_with_info.append({
                 'code': spec_code,
@@ -2177,45 +1452,23 @@ def get_reschedule_options(request, appointment_id):
         doctor = appointment.doctor
         doctor_name = f"Dr. {doctor.user.get_full_name()}"
         
-        now = timezone.now()
-        today = now.date()
-        
-        day_map = {
-            0: 'monday', 1: 'tuesday', 2: 'wednesday', 3: 'thursday',
-            4: 'friday', 5: 'saturday', 6: 'sunday'
-        }
-        
-        schedules = DoctorSchedule.objects.filter(
-            doctor=doctor,
-            is_active=True,  
-            slot_type='consultation'
-        )
+        today = timezone.now().date()
         
-        working_days = set()
-        for schedule in schedules:
-            working_days.add(schedule.day_of_week)
+        #  Next 7 calendar days, loaded in one pass
+        dates = next_days(today, 7)
+        availability = DoctorAvailability([doctor.id], dates, patient=profile)
         
-        #  Get next 7 calendar days  
         available_dates = []
-        check_date = today + dt_timedelta(days=1)  
-        end_date = today + dt_timedelta(days=7)    
-        
-        while check_date <= end_date:
-            day_name = day_map[check_date.weekday()]
-            
-            
-            if day_name in working_days:
-                available_times = get_available_time_slots(doctor, check_date)
-                
-                if available_times: 
-                    available_dates.append({
-                        'date': check_date.isoformat(),
-                        'day': check_date.strftime('%A'),
-                        'formatted': check_date.strftime('%b %d, %Y'),
-                        'times': available_times
-                    })
+        for check_date in dates:
+            available_times = availability.free_slots(doctor.id, check_date)
             
-            check_date += dt_timedelta(days=1)
+            if available_times: 
+                available_dates.append({
+                    'date': check_date.isoformat(),
+                    'day': check_date.strftime('%A'),
+                    'formatted': check_date.strftime('%b %d, %Y'),
+                    'times': available_times
+                })
         
         return JsonResponse({
             'success': True,
@@ -2257,40 +1510,23 @@ def reschedule_appointment(request, appointment_id):
         if appointment.status != 'needs_rescheduling':
             return JsonResponse({"error": "This appointment doesn't need rescheduling"}, status=400)
         
-        if isinstance(new_time, str):
-            try:
-                time_obj = datetime.strptime(new_time, '%H:%M').time()
-            except ValueError:
-                try:
-                    time_obj = datetime.strptime(new_time, '%H:%M:%S').time()
-                except ValueError:
-                    return JsonResponse({"error": "Invalid time format"}, status=400)
-        else:
-            time_obj = new_time
-        
-        if isinstance(new_date, str):
-            date_obj = datetime.strptime(new_date, '%Y-%m-%d').date()
-        else:
-            date_obj = new_date
-        
-        conflict = Appointment.objects.filter(
-            doctor=appointment.doctor,
-            appointment_date=date_obj,
-            appointment_time=time_obj,
-            status__in=['pending', 'confirmed']
-        ).exclude(id=appointment.id).exists()
+        try:
+            time_obj = parse_slot_time(new_time)
+        except ValueError:
+            return JsonResponse({"error": "Invalid time format"}, status=400)
         
-        if conflict:
-            return JsonResponse({
-                "error": "This time slot is already booked. Please choose another time."
-            }, status=400)
+        date_obj = parse_slot_date(new_date)
         
-        # Update appointment
+        # Update appointment - the slot is claimed atomically on save
         appointment.appointment_date = date_obj
         appointment.appointment_time = time_obj
         appointment.status = 'confirmed'
         appointment.reminder_sent = False
-        appointment.save()
+        
+        try:
+            save_into_slot(appointment, profile)
+        except SlotUnavailable as e:
+            return JsonResponse({"error": str(e)}, status=400)
         
         #  Format time properly
         formatted_time = appointment.appointment_time.strftime('%I:%M %p')
@@ -2338,67 +1574,35 @@ def get_transfer_options(request, appointment_id):
             is_active=True
         ).exclude(id=original_doctor.id).select_related('user')
         
-        doctors_list = []
+        # Schedules and bookings for every candidate over the next 7 days
+        # (plus the original day) are loaded in one pass
+        today = timezone.now().date()
+        window = next_days(today, 7)
+        availability = DoctorAvailability(
+            [doctor.id for doctor in alternative_doctors],
+            window + [original_date],
+            patient=profile
+        )
         
+        ranked = []
         for doctor in alternative_doctors:
-            day_map = {
-                0: 'monday', 1: 'tuesday', 2: 'wednesday', 3: 'thursday',
-                4: 'friday', 5: 'saturday', 6: 'sunday'
-            }
-            
-            today = timezone.now().date()
-            
-            # Check if doctor has any active schedules at all
-            has_any_schedule = DoctorSchedule.objects.filter(
-                doctor=doctor,
-                is_active=True,
-                slot_type='consultation'
-            ).exists()
-            
-            if not has_any_schedule:
+            first_free = availability.first_free_slot(doctor.id, window)
+            if not first_free:
                 continue  
             
-            found_available_day = False
-            for days_ahead in range(1, 8):  
-                check_date = today + dt_timedelta(days=days_ahead)
-                day_name = day_map[check_date.weekday()]
-                
-                has_schedule_this_day = DoctorSchedule.objects.filter(
-                    doctor=doctor,
-                    day_of_week=day_name,
-                    is_active=True,
-                    slot_type='consultation'
-                ).exists()
-                
-                if has_schedule_this_day:
-                    available_times = get_available_time_slots(doctor, check_date)
-                    if available_times:
-                        found_available_day = True
-                        break  
-            
-            if not found_available_day:
-                continue  
-            
-            original_day_name = day_map[original_date.weekday()]
-            has_schedule_original_day = DoctorSchedule.objects.filter(
-                doctor=doctor,
-                day_of_week=original_day_name,
-                is_active=True,
-                slot_type='consultation'
-            ).exists()
-            
-            same_time_available = False
-            
-            if has_schedule_original_day:
-                available_times_original = get_available_time_slots(doctor, original_date)
-                original_time_str = original_time.strftime('%I:%M %p').lstrip('0')
-                same_time_available = original_time_str in available_times_original
-            
+            same_time_available = availability.is_free(doctor.id, original_date, original_time)
+            ranked.append((first_free, not same_time_available, doctor, same_time_available))
+        
+        # Soonest availability first, same-time matches breaking ties
+        ranked.sort(key=lambda item: item[:2])
+        
+        doctors_list = []
+        for (first_date, first_minute), _, doctor, same_time_available in ranked:
             # when user clicks the doctor card (via get_transfer_doctor_slots endpoint)
             
             doctor_photo = None
             if hasattr(doctor, 'profile_photo') and doctor.profile_photo:
-                doctor_photo = request.build_absolute_uri(doctor.profile_photo.url)
+                doctor_photo = image_url(request, doctor, 'profile_photo', 'thumb')
             
             doctors_list.append({
                 'id': doctor.id,
@@ -2408,6 +1612,10 @@ def get_transfer_options(request, appointment_id):
                 'room_location': doctor.room_location or 'Not specified',
                 'photo': doctor_photo,
                 'same_time_available': same_time_available,
+                'first_available': {
+                    'date': first_date.isoformat(),
+                    'time': SLOT_LABELS[first_minute],
+                },
                 'available_times': []  
             })
         
@@ -2464,40 +1672,21 @@ def transfer_appointment(request, appointment_id):
         if new_doctor.specialization != appointment.doctor.specialization:
             return JsonResponse({"error": "Doctor must have the same specialty"}, status=400)
         
-        if isinstance(new_date, str):
-            new_date_obj = datetime.strptime(new_date, '%Y-%m-%d').date()
-        else:
-            new_date_obj = new_date
-        
-        if isinstance(new_time, str):
-            try:
-                new_time_obj = datetime.strptime(new_time, '%I:%M %p').time()
-            except:
-                try:
-                    new_time_obj = datetime.strptime(new_time, '%H:%M').time()
-                except:
-                    new_time_obj = datetime.strptime(new_time, '%H:%M:%S').time()
-        else:
-            new_time_obj = new_time
-        
-        conflict = Appointment.objects.filter(
-            doctor=new_doctor,
-            appointment_date=new_date_obj,  
-            appointment_time=new_time_obj,
-            status__in=['pending', 'confirmed']
-        ).exists()
+        new_date_obj = parse_slot_date(new_date)
+        new_time_obj = parse_slot_time(new_time)
         
-        if conflict:
-            return JsonResponse({"error": "This time slot is no longer available"}, status=400)
-        
-        # Update appointment
+        # Update appointment - the slot is claimed atomically on save
         old_doctor_name = f"Dr. {appointment.doctor.user.get_full_name()}"
         appointment.doctor = new_doctor
         appointment.appointment_date = new_date_obj  
         appointment.appointment_time = new_time_obj
         appointment.status = 'confirmed'
         appointment.reminder_sent = False
-        appointment.save()
+        
+        try:
+            save_into_slot(appointment, profile)
+        except SlotUnavailable:
+            return JsonResponse({"error": "This time slot is no longer available"}, status=400)
         
         new_doctor_name = f"Dr. {new_doctor.user.get_full_name()}"
         
@@ -2546,7 +1735,7 @@ def get_transfer_doctor_slots(request, doctor_id):
             return JsonResponse({"error": "Invalid date format"}, status=400)
         
         # Get available time slots
-        available_times = get_available_time_slots(doctor, selected_date)
+        available_times = get_available_time_slots(doctor, selected_date, patient=profile)
         
         return JsonResponse({
             'date': selected_date.isoformat(),
@@ -2554,44 +1743,21 @@ def get_transfer_doctor_slots(request, doctor_id):
         })
     
     
-    day_map = {
-        0: 'monday', 1: 'tuesday', 2: 'wednesday', 3: 'thursday',
-        4: 'friday', 5: 'saturday', 6: 'sunday'
-    }
-    
-    # Get doctor's ACTIVE working days 
-    schedules = DoctorSchedule.objects.filter(
-        doctor=doctor,
-        is_active=True,
-        slot_type='consultation'
-    )
-    
-    working_days = set()
-    for schedule in schedules:
-        working_days.add(schedule.day_of_week)
+    # Next 7 calendar days only, loaded in one pass
+    dates = next_days(today, 7)
+    availability = DoctorAvailability([doctor.id], dates, patient=profile)
     
-    # Get next 7 calendar days only
     available_dates = []
-    check_date = today + dt_timedelta(days=1)  
-    end_date = today + dt_timedelta(days=7)    
-    
-    while check_date <= end_date:
-        day_name = day_map[check_date.weekday()]
-        
-        
-        if day_name in working_days:
-            # Get available time slots for this date
-            available_times = get_available_time_slots(doctor, check_date)
-            
-            if available_times:  
-                available_dates.append({
-                    'date': check_date.isoformat(),
-                    'day': check_date.strftime('%A'),
-                    'formatted': check_date.strftime('%b %d, %Y'),
-                    'times': available_times
-                })
+    for check_date in dates:
+        available_times = availability.free_slots(doctor.id, check_date)
         
-        check_date += dt_timedelta(days=1)
+        if available_times:  
+            available_dates.append({
+                'date': check_date.isoformat(),
+                'day': check_date.strftime('%A'),
+                'formatted': check_date.strftime('%b %d, %Y'),
+                'times': available_times
+            })
     
     return JsonResponse({
         'success': True,
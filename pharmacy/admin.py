@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import PharmacyProfile, Medicine, MedicineSchedule, PharmacyFulfillment, FulfilledMedicine
+from .models import PharmacyProfile, Medicine, MedicineSchedule, PharmacyFulfillment, FulfilledMedicine, StockMovement, StockSnapshot
 
 
 @admin.register(PharmacyProfile)
@@ -15,7 +15,8 @@ class MedicineAdmin(admin.ModelAdmin):
     list_display = ['name', 'generic_name', 'category', 'unit_type', 'quantity_in_stock', 'stock_status', 'is_active']
     list_filter = ['category', 'unit_type', 'is_active']
     search_fields = ['name', 'generic_name', 'manufacturer']
-    readonly_fields = ['created_at', 'updated_at']
+    # Stock only changes through the pharmacy views, which record a StockMovement
+    readonly_fields = ['quantity_in_stock', 'created_at', 'updated_at']
 
 
 @admin.register(MedicineSchedule)
@@ -38,4 +39,27 @@ class PharmacyFulfillmentAdmin(admin.ModelAdmin):
 class FulfilledMedicineAdmin(admin.ModelAdmin):
     list_display = ['fulfillment', 'prescribed_medicine', 'stock_medicine', 'quantity_dispensed', 'quantity_requested', 'dispensed_at']
     list_filter = ['dispensed_at']
-    search_fields = ['prescribed_medicine__medicine_name', 'stock_medicine__name']
\ No newline at end of file
+    search_fields = ['prescribed_medicine__medicine_name', 'stock_medicine__name']
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ['medicine', 'kind', 'quantity', 'recorded_by', 'note', 'created_at']
+    list_filter = ['kind', 'created_at']
+    search_fields = ['medicine__name', 'note']
+
+    # The ledger is append-only and must keep adding up to the stock
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['medicine', 'date', 'balance', 'dispensed_total']
+    list_filter = ['date']
+    search_fields = ['medicine__name']
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class PharmacyConfig(AppConfig):
     name = 'pharmacy'
+
+    def ready(self):
+        from . import signals  # noqa: F401
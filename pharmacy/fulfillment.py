@@ -0,0 +1,143 @@
+"""
+All-or-nothing prescription fulfillment.
+
+fulfill() dispenses the selected lines of a prescription in one
+transaction. It locks the prescription's PharmacyFulfillment row, then the
+stock rows in id order, so concurrent fulfillments wait for each other
+instead of deadlocking. Stock is decremented with
+quantity_in_stock = quantity_in_stock - n, guarded by quantity_in_stock >= n,
+and the FulfilledMedicine rows and their 'dispense' StockMovements go in
+with one INSERT each. If any line cannot be dispensed, FulfillmentError is
+raised and nothing is changed.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .ledger import movement
+from .matching import best_match, match_prescribed_medicines
+from .models import FulfilledMedicine, Medicine, PharmacyFulfillment, StockMovement
+
+
+class FulfillmentError(Exception):
+    pass
+
+
+def _positive_int(value, error):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise FulfillmentError(error)
+    if number <= 0:
+        raise FulfillmentError(error)
+    return number
+
+
+def _resolve_lines(prescribed_by_id, selected_medicines):
+    """
+    [(prescribed medicine, stock id, quantity, quantity requested), ...] for
+    the selected lines. Lines sent without a stock item get their best match.
+    """
+    unmatched = [
+        prescribed_by_id[line.get('medicine_id')] for line in selected_medicines
+        if not line.get('stock_id') and line.get('medicine_id') in prescribed_by_id
+    ]
+    matches = match_prescribed_medicines(unmatched) if unmatched else {}
+
+    lines = []
+    for line in selected_medicines:
+        prescribed = prescribed_by_id.get(line.get('medicine_id'))
+        if prescribed is None:
+            raise FulfillmentError("Medicine is not on this prescription")
+
+        stock_id = line.get('stock_id')
+        if not stock_id:
+            candidate = best_match(matches.get(prescribed.id))
+            if candidate is None:
+                raise FulfillmentError(f"No stock item matches {prescribed.medicine_name}")
+            stock_id = candidate['id']
+
+        stock_id = _positive_int(stock_id, "Invalid stock item")
+        quantity = _positive_int(line.get('quantity'), "Invalid quantity")
+        requested = line.get('total_needed', quantity)
+        lines.append((prescribed, stock_id, quantity, requested))
+    return lines
+
+
+def _take_stock(needed):
+    """Lock the stock rows in `needed` ({stock id: quantity}) and decrement them."""
+    stock = {
+        medicine.id: medicine
+        for medicine in Medicine.objects.select_for_update().filter(id__in=needed).order_by('id')
+    }
+    for stock_id in sorted(needed):
+        medicine = stock.get(stock_id)
+        if medicine is None or not medicine.is_active:
+            raise FulfillmentError("Medicine not found in stock")
+        quantity = needed[stock_id]
+        # The guard also holds where select_for_update() is a no-op (SQLite)
+        taken = Medicine.objects.filter(id=stock_id, quantity_in_stock__gte=quantity).update(
+            quantity_in_stock=F('quantity_in_stock') - quantity
+        )
+        if not taken:
+            raise FulfillmentError(
+                f"Not enough {medicine.name} in stock ({medicine.quantity_in_stock} left, {quantity} needed)"
+            )
+    return stock
+
+
+def fulfill(prescription, profile, selected_medicines, notes=''):
+    """
+    Dispense `selected_medicines` ([{'medicine_id', 'stock_id', 'quantity',
+    'total_needed'}, ...]) for `prescription`. Returns the saved
+    PharmacyFulfillment, 'fulfilled' once every line of the prescription has
+    been dispensed (here or earlier) and 'partial' otherwise. Raises FulfillmentError.
+    """
+    if not selected_medicines:
+        raise FulfillmentError("No medicines could be fulfilled")
+
+    prescribed_by_id = {medicine.id: medicine for medicine in prescription.medicines.all()}
+    lines = _resolve_lines(prescribed_by_id, selected_medicines)
+
+    needed = defaultdict(int)
+    for _, stock_id, quantity, _ in lines:
+        needed[stock_id] += quantity
+
+    with transaction.atomic():
+        fulfillment, _ = PharmacyFulfillment.objects.select_for_update().get_or_create(
+            prescription=prescription,
+            defaults={'pharmacy_profile': profile, 'status': 'pending'}
+        )
+        if fulfillment.status == 'fulfilled':
+            raise FulfillmentError("Prescription is already fulfilled")
+
+        stock = _take_stock(needed)
+        FulfilledMedicine.objects.bulk_create([
+            FulfilledMedicine(
+                fulfillment=fulfillment,
+                prescribed_medicine=prescribed,
+                stock_medicine=stock[stock_id],
+                quantity_dispensed=quantity,
+                quantity_requested=requested,
+            )
+            for prescribed, stock_id, quantity, requested in lines
+        ])
+        StockMovement.objects.bulk_create([
+            movement(
+                stock_id, 'dispense', -quantity,
+                fulfillment=fulfillment, recorded_by=profile, note=prescription.prescription_number,
+            )
+            for _, stock_id, quantity, _ in lines
+        ])
+
+        # Earlier partial fulfillments count too
+        dispensed = set(fulfillment.fulfilled_medicines.values_list('prescribed_medicine_id', flat=True))
+        fulfillment.status = 'fulfilled' if len(dispensed) == len(prescribed_by_id) else 'partial'
+        fulfillment.pharmacy_profile = profile
+        fulfillment.fulfilled_at = timezone.now()
+        fulfillment.notes = notes
+        fulfillment.save()
+
+    return fulfillment
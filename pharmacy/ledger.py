@@ -0,0 +1,132 @@
+"""
+Stock movement ledger.
+
+Every change to Medicine.quantity_in_stock is also written as a
+StockMovement: receipts and increases (positive), dispenses and corrections
+(negative), expired stock written off. Rows are only ever added.
+
+The snapshot_stock job writes a StockSnapshot at the end of each day for
+every medicine that moved that day: its balance, and the units dispensed
+since the ledger began. Questions about the past then read the latest
+snapshot before the date plus the movements after it, which is at most
+the days not snapshotted yet, however long the ledger gets:
+- stock_at(medicine_id, when)
+- dispensed_between(medicine_id, start, end)
+Snapshots are written day after day from the last one, so a medicine's
+latest snapshot always accounts for all its earlier movements.
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery, Sum
+from django.utils import timezone
+
+from .models import Medicine, StockMovement, StockSnapshot
+
+
+def movement(medicine_id, kind, quantity, **fields):
+    """An unsaved StockMovement, for bulk_create()."""
+    return StockMovement(medicine_id=medicine_id, kind=kind, quantity=quantity, **fields)
+
+
+def record_movement(medicine_id, kind, quantity, **fields):
+    return StockMovement.objects.create(medicine_id=medicine_id, kind=kind, quantity=quantity, **fields)
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def _totals(movements):
+    totals = movements.aggregate(
+        change=Sum('quantity'),
+        dispensed=Sum('quantity', filter=Q(kind='dispense')),
+    )
+    # Dispenses are negative movements
+    return totals['change'] or 0, -(totals['dispensed'] or 0)
+
+
+def position(medicine_id, when):
+    """(stock, units dispensed since the ledger began) of a medicine at `when`."""
+    snapshot = StockSnapshot.objects.filter(
+        medicine_id=medicine_id, date__lt=timezone.localdate(when)
+    ).order_by('-date').first()
+
+    tail = StockMovement.objects.filter(medicine_id=medicine_id, created_at__lt=when)
+    balance, dispensed = 0, 0
+    if snapshot:
+        tail = tail.filter(created_at__gte=day_start(snapshot.date + timedelta(days=1)))
+        balance, dispensed = snapshot.balance, snapshot.dispensed_total
+
+    change, tail_dispensed = _totals(tail)
+    return balance + change, dispensed + tail_dispensed
+
+
+def stock_at(medicine_id, when):
+    return position(medicine_id, when)[0]
+
+
+def dispensed_between(medicine_id, start, end):
+    """Units of a medicine dispensed in [start, end)."""
+    return position(medicine_id, end)[1] - position(medicine_id, start)[1]
+
+
+def snapshot_day(day):
+    """
+    Write the StockSnapshots for `day` from each moved medicine's previous
+    snapshot and the day's movements. Returns the number written.
+    """
+    moved = {
+        row['medicine_id']: row
+        for row in StockMovement.objects.filter(
+            created_at__gte=day_start(day), created_at__lt=day_start(day + timedelta(days=1))
+        ).values('medicine_id').annotate(
+            change=Sum('quantity'),
+            dispensed=Sum('quantity', filter=Q(kind='dispense')),
+        )
+    }
+    if not moved:
+        return 0
+
+    latest = StockSnapshot.objects.filter(medicine=OuterRef('pk'), date__lt=day).order_by('-date').values('id')[:1]
+    previous_ids = Medicine.objects.filter(id__in=moved).annotate(
+        snapshot_id=Subquery(latest)
+    ).values_list('snapshot_id', flat=True)
+    previous = {
+        snapshot.medicine_id: snapshot
+        for snapshot in StockSnapshot.objects.filter(id__in=[pk for pk in previous_ids if pk])
+    }
+
+    snapshots = []
+    for medicine_id, row in moved.items():
+        last = previous.get(medicine_id)
+        snapshots.append(StockSnapshot(
+            medicine_id=medicine_id,
+            date=day,
+            balance=(last.balance if last else 0) + row['change'],
+            dispensed_total=(last.dispensed_total if last else 0) - (row['dispensed'] or 0),
+        ))
+    StockSnapshot.objects.bulk_create(snapshots)
+    return len(snapshots)
+
+
+def snapshot_through(last_day):
+    """
+    Snapshot every day after the latest snapshot up to `last_day` (from the
+    first movement on the first run). Returns {day: snapshots written}.
+    """
+    latest = StockSnapshot.objects.order_by('-date').values_list('date', flat=True).first()
+    if latest:
+        day = latest + timedelta(days=1)
+    else:
+        first = StockMovement.objects.order_by('created_at').values_list('created_at', flat=True).first()
+        if first is None:
+            return {}
+        day = timezone.localdate(first)
+
+    written = {}
+    while day <= last_day:
+        with transaction.atomic():
+            written[day] = snapshot_day(day)
+        day += timedelta(days=1)
+    return written
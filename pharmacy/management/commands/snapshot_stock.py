@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from pharmacy.ledger import snapshot_through
+
+
+class Command(BaseCommand):
+    help = 'Write end-of-day stock snapshots for every finished day not snapshotted yet'
+
+    def handle(self, *args, **kwargs):
+        written = snapshot_through(timezone.localdate() - timedelta(days=1))
+        self.stdout.write(self.style.SUCCESS(
+            f" Snapshotted {len(written)} day(s), {sum(written.values())} medicine balance(s)"
+        ))
@@ -0,0 +1,225 @@
+"""
+Match prescribed medicines against the pharmacy stock.
+
+Prescriptions name medicines as free text ("Amoxicillin 500mg",
+"Paracetamol tab"). MedicineIndex holds every active Medicine as
+normalized name words, generic-name words and strengths, with an inverted
+index from word to medicines. match_prescribed_medicines() resolves all
+lines of a prescription against it in one pass and returns ranked
+candidates with a confidence between 0 and 1. Every word of the stock
+name (or, prescribed by generic name, of the generic name) that the
+prescription does not mention halves the confidence, and such a candidate
+("Paracetamol + Caffeine" for "Paracetamol 650mg") is offered but never
+pre-selected.
+
+The index is built in memory once per process and rebuilt when the
+Medicine table changes: saves and deletes in this process drop it
+(pharmacy.signals), and a cheap stamp query (latest updated_at, row
+count) catches changes made by other processes. Stock quantities are not
+cached; they are read with one query per match.
+"""
+import difflib
+import re
+import threading
+from collections import defaultdict
+
+from django.db.models import Count, Max
+
+from patients.search import normalize
+
+from .models import Medicine
+
+# Below this a candidate is not offered at all
+MIN_CONFIDENCE = 0.3
+# A line is only pre-selected when its best candidate reaches this
+AUTO_SELECT_CONFIDENCE = 0.6
+MAX_CANDIDATES = 3
+
+# Spelling variants ("amoxycillin") still match, with less confidence
+FUZZY_CUTOFF = 0.8
+FUZZY_WEIGHT = 0.8
+GENERIC_WEIGHT = 0.9
+# Per word of the stock name the prescription does not mention
+EXTRA_WORD_PENALTY = 0.5
+
+# Dosage forms and units say nothing about which medicine it is
+FORM_WORDS = {
+    'tab', 'tabs', 'tablet', 'tablets', 'cap', 'caps', 'capsule', 'capsules', 'syp', 'syrup',
+    'susp', 'suspension', 'inj', 'injection', 'drop', 'drops', 'cream', 'ointment', 'gel',
+    'inhaler', 'spray', 'mg', 'mcg', 'g', 'ml', 'iu', 'unit', 'units',
+}
+
+# Not the digits of a name like "B12" or "D3"
+STRENGTH = re.compile(r'(?<![a-z0-9.])(\d+(?:\.\d+)?)\s*(mcg|µg|mg|g|ml|iu|%)?(?![a-z0-9])')
+# unit -> (canonical unit, factor)
+UNITS = {'mcg': ('mg', 0.001), 'µg': ('mg', 0.001), 'mg': ('mg', 1), 'g': ('mg', 1000)}
+
+
+def strengths(text, bare_numbers=True):
+    """
+    {(amount, unit)} found in `text`; "1g" and "1000 mg" are both
+    (1000.0, 'mg'). Without `bare_numbers`, numbers need a unit (a
+    prescribed dosage of "1 tablet" is a count, not a strength).
+    """
+    found = set()
+    for amount, unit in STRENGTH.findall((text or '').lower()):
+        if not unit and not bare_numbers:
+            continue
+        unit, factor = UNITS.get(unit, (unit, 1))
+        found.add((round(float(amount) * factor, 4), unit))
+    return found
+
+
+def words(text):
+    """Normalized words of a medicine name without numbers, forms and units."""
+    return [
+        word for word in normalize(STRENGTH.sub(' ', (text or '').lower())).split()
+        if word not in FORM_WORDS and not word.isdigit()
+    ]
+
+
+def strength_factor(wanted, stocked):
+    """1 when a strength matches, 0.6 when both are known and differ, 0.9 when unknown."""
+    if not wanted or not stocked:
+        return 0.9
+    for amount, unit in wanted:
+        for stock_amount, stock_unit in stocked:
+            # A bare number ("Augmentin 625") matches any unit
+            if amount == stock_amount and (unit == stock_unit or not unit or not stock_unit):
+                return 1.0
+    return 0.6
+
+
+class MedicineIndex:
+    def __init__(self, medicines):
+        """`medicines`: (id, name, generic_name, dosage) rows of active medicines."""
+        self.entries = {}
+        self.postings = defaultdict(set)
+        for medicine_id, name, generic_name, dosage in medicines:
+            name_words = set(words(name))
+            generic_words = set(words(generic_name))
+            self.entries[medicine_id] = (name_words, generic_words, strengths(name) | strengths(dosage))
+            for word in name_words | generic_words:
+                self.postings[word].add(medicine_id)
+        self.vocabulary = list(self.postings)
+
+    def _credits(self, word):
+        """{medicine_id: (credit, matched word)} for the medicines `word` points at."""
+        if word in self.postings:
+            matches = [(word, 1.0)]
+        else:
+            matches = [
+                (close, FUZZY_WEIGHT)
+                for close in difflib.get_close_matches(word, self.vocabulary, n=3, cutoff=FUZZY_CUTOFF)
+            ]
+        credits = {}
+        for matched_word, credit in matches:
+            for medicine_id in self.postings[matched_word]:
+                on_name = matched_word in self.entries[medicine_id][0]
+                weighted = credit if on_name else credit * GENERIC_WEIGHT
+                if weighted > credits.get(medicine_id, (0, None))[0]:
+                    credits[medicine_id] = (weighted, matched_word)
+        return credits
+
+    def match(self, medicine_name, dosage=''):
+        """
+        [(medicine_id, confidence, extra words), ...] best first, where
+        `extra words` counts the words of the stock name left unmatched.
+        """
+        query = list(dict.fromkeys(words(medicine_name)))
+        if not query:
+            return []
+        wanted = strengths(medicine_name) | strengths(dosage, bare_numbers=False)
+
+        # medicine_id -> {query word: (credit, matched word)}
+        hits = defaultdict(dict)
+        for word in query:
+            for medicine_id, credit in self._credits(word).items():
+                hits[medicine_id][word] = credit
+
+        ranked = []
+        for medicine_id, credits in hits.items():
+            name_words, generic_words, stocked = self.entries[medicine_id]
+            coverage = sum(credit for credit, _ in credits.values()) / len(query)
+            # "Paracetamol + Caffeine" is a different medicine from "Paracetamol"
+            matched = {word for _, word in credits.values()}
+            extra = min(len(named - matched) for named in (name_words, generic_words) if named)
+            confidence = coverage * EXTRA_WORD_PENALTY ** extra * strength_factor(wanted, stocked)
+            if confidence >= MIN_CONFIDENCE:
+                ranked.append((medicine_id, round(confidence, 2), extra))
+        ranked.sort(key=lambda item: -item[1])
+        return ranked
+
+
+_lock = threading.Lock()
+_index = None
+_index_stamp = None
+
+
+def _stamp():
+    stats = Medicine.objects.aggregate(changed=Max('updated_at'), count=Count('id'))
+    return stats['changed'], stats['count']
+
+
+def get_index():
+    global _index, _index_stamp
+    stamp = _stamp()
+    with _lock:
+        if _index is None or _index_stamp != stamp:
+            rows = Medicine.objects.filter(is_active=True).values_list('id', 'name', 'generic_name', 'dosage')
+            _index = MedicineIndex(rows)
+            _index_stamp = stamp
+        return _index
+
+
+def invalidate_index():
+    global _index
+    with _lock:
+        _index = None
+
+
+def match_prescribed_medicines(prescribed_medicines, limit=MAX_CANDIDATES):
+    """
+    {prescribed medicine id: [candidate, ...]} for every line, best first.
+    A candidate is {'id', 'name', 'dosage', 'confidence', 'extra_words',
+    'available'}; among equally confident candidates, ones in stock come first.
+    """
+    index = get_index()
+    ranked = {
+        prescribed.id: index.match(prescribed.medicine_name, prescribed.dosage)
+        for prescribed in prescribed_medicines
+    }
+
+    candidate_ids = {medicine_id for matches in ranked.values() for medicine_id, _, _ in matches}
+    stock = Medicine.objects.filter(id__in=candidate_ids, is_active=True).in_bulk()
+
+    results = {}
+    for prescribed_id, matches in ranked.items():
+        candidates = [
+            {
+                'id': medicine_id,
+                'name': stock[medicine_id].name,
+                'dosage': stock[medicine_id].dosage or '',
+                'confidence': confidence,
+                'extra_words': extra,
+                'available': stock[medicine_id].quantity_in_stock,
+            }
+            for medicine_id, confidence, extra in matches
+            if medicine_id in stock
+        ]
+        candidates.sort(key=lambda c: (-c['confidence'], c['available'] <= 0))
+        results[prescribed_id] = candidates[:limit]
+    return results
+
+
+def best_match(candidates):
+    """
+    The candidate to pre-select, or None when no candidate is confident
+    enough or the best one names more than the prescription does.
+    """
+    if not candidates:
+        return None
+    best = candidates[0]
+    if best['confidence'] >= AUTO_SELECT_CONFIDENCE and not best['extra_words']:
+        return best
+    return None
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0017_access_pattern_indexes'),
+        ('pharmacy', '0004_medicine_dosage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pharmacyfulfillment',
+            index=models.Index(fields=['status'], name='fulfillment_status_idx'),
+        ),
+    ]
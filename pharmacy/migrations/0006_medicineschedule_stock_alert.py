@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 04:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0005_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicineschedule',
+            name='stock_alert',
+            field=models.CharField(blank=True, default='', max_length=10),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 04:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pharmacy', '0006_medicineschedule_stock_alert'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pharmacyprofile',
+            name='profile_photo_medium',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='pharmacyprofile',
+            name='profile_photo_thumb',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to=''),
+        ),
+    ]
@@ -1,11 +1,15 @@
-from django.db import models, transaction, IntegrityError
-from django.contrib.auth.models import User
+from django.db import models
 from django.utils import timezone
-import random
-import string
+from django.contrib.auth.models import User
+from accounts.identifiers import claim_identifier
+from mediconnect.images import ImageDerivativesMixin
+
 
+class PharmacyProfile(ImageDerivativesMixin, models.Model):
+    IMAGE_DERIVATIVES = {
+        'profile_photo': {'thumb': 'profile_photo_thumb', 'medium': 'profile_photo_medium'},
+    }
 
-class PharmacyProfile(models.Model):
     """Pharmacy staff profile with random ID generation"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='pharmacyprofile')
     pharmacy_id = models.CharField(max_length=20, unique=True, editable=False, null=True, blank=True)
@@ -16,38 +20,17 @@ class PharmacyProfile(models.Model):
     shift = models.CharField(max_length=100, blank=True, null=True)
     years_of_experience = models.IntegerField(blank=True, null=True, default=0)
     profile_photo = models.ImageField(upload_to='pharmacy_photos/', blank=True, null=True)
+    # Resized copies written by mediconnect.images
+    profile_photo_thumb = models.ImageField(blank=True, null=True, editable=False)
+    profile_photo_medium = models.ImageField(blank=True, null=True, editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def generate_random_code(self, length=6):
-        """Generate random alphanumeric code (uppercase letters + digits)"""
-        chars = ''.join([c for c in (string.ascii_uppercase + string.digits) 
-                        if c not in 'O0I1'])  # Remove confusing characters
-        return ''.join(random.choice(chars) for _ in range(length))
-
     def save(self, *args, **kwargs):
-        if self.pharmacy_id:
-            return super().save(*args, **kwargs)
-
-        year = timezone.now().year
-        
-        for attempt in range(10):
-            try:
-                with transaction.atomic():
-                    random_code = self.generate_random_code(6)
-                    self.pharmacy_id = f"PHR-{year}-{random_code}"
-                    
-                    if PharmacyProfile.objects.filter(pharmacy_id=self.pharmacy_id).exists():
-                        continue
-                    
-                    super().save(*args, **kwargs)
-                    return
-
-            except IntegrityError:
-                continue
-
-        raise IntegrityError("Failed to generate unique pharmacy_id after 10 attempts")
+        if not self.pharmacy_id:
+            self.pharmacy_id = claim_identifier('PHR')
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.pharmacy_id} - {self.user.get_full_name()}"
@@ -148,6 +131,7 @@ class MedicineSchedule(models.Model):
     # Inventory tracking
     total_quantity = models.IntegerField(default=0)  # Total pills/doses needed
     remaining_quantity = models.IntegerField(default=0)  # Pills/doses remaining
+    stock_alert = models.CharField(max_length=10, blank=True, default='')  # last stock level the patient was notified of
     
     # Additional info
     purpose = models.TextField(blank=True, null=True)
@@ -167,6 +151,30 @@ class MedicineSchedule(models.Model):
             return 0
         return int((self.remaining_quantity / self.total_quantity) * 100)
 
+    @property
+    def stock_level(self):
+        stock_pct = self.stock_percentage
+        if stock_pct == 0:
+            return 'out'
+        if stock_pct <= 15:
+            return 'low'
+        return ''
+
+    def save(self, *args, **kwargs):
+        # Notify the patient once each time stock drops to low or out
+        level = self.stock_level if self.status == 'active' else ''
+        notify_level = level if level and level != self.stock_alert else None
+        if level != self.stock_alert:
+            self.stock_alert = level
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'stock_alert'}
+
+        super().save(*args, **kwargs)
+
+        if notify_level:
+            from notifications.feed import notify_low_stock
+            notify_low_stock(self, notify_level)
+
 
 class PharmacyFulfillment(models.Model):
     """Track pharmacy fulfillment of prescriptions"""
@@ -207,6 +215,10 @@ class PharmacyFulfillment(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Queue tabs split prescriptions by fulfillment status
+            models.Index(fields=['status'], name='fulfillment_status_idx'),
+        ]
     
     def __str__(self):
         return f"{self.prescription.prescription_number} - {self.status}"
@@ -239,4 +251,67 @@ class FulfilledMedicine(models.Model):
     dispensed_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
-        return f"{self.prescribed_medicine.medicine_name} - {self.quantity_dispensed}/{self.quantity_requested}"
\ No newline at end of file
+        return f"{self.prescribed_medicine.medicine_name} - {self.quantity_dispensed}/{self.quantity_requested}"
+
+class StockMovement(models.Model):
+    """Append-only ledger of every change to a medicine's stock"""
+
+    KIND_CHOICES = [
+        ('receipt', 'Receipt'),
+        ('dispense', 'Dispense'),
+        ('adjust', 'Adjustment'),
+        ('expire', 'Expired'),
+    ]
+
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='stock_movements')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    quantity = models.IntegerField()  # positive adds to stock, negative takes from it
+
+    fulfillment = models.ForeignKey(
+        PharmacyFulfillment,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stock_movements'
+    )
+    recorded_by = models.ForeignKey(
+        PharmacyProfile,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='stock_movements'
+    )
+    note = models.CharField(max_length=255, blank=True, default='')
+
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Stock/consumption at a date: the movements after a snapshot
+            models.Index(fields=['medicine', 'created_at'], name='stockmove_medicine_time_idx'),
+            # Daily snapshots read one day of movements across all medicines
+            models.Index(fields=['created_at'], name='stockmove_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.medicine.name} {self.kind} {self.quantity:+d}"
+
+
+class StockSnapshot(models.Model):
+    """A medicine's stock at the end of a day, written by snapshot_stock"""
+
+    medicine = models.ForeignKey(Medicine, on_delete=models.CASCADE, related_name='stock_snapshots')
+    date = models.DateField()
+    balance = models.IntegerField()
+    # Units dispensed since the ledger began, so consumption over a period is a difference
+    dispensed_total = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['medicine', 'date'], name='stock_snapshot_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.medicine.name} {self.date}: {self.balance}"
@@ -0,0 +1,14 @@
+"""
+Drop this process's medicine matching index when a Medicine changes.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .matching import invalidate_index
+from .models import Medicine
+
+
+@receiver(post_save, sender=Medicine)
+@receiver(post_delete, sender=Medicine)
+def medicine_changed(sender, **kwargs):
+    invalidate_index()
@@ -1,3 +1,200 @@
-from django.test import TestCase
+from datetime import date, timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from doctors.models import DoctorProfile, PrescribedMedicine, Prescription
+from mediconnect.testing import run_concurrently
+from patients.models import PatientProfile
+
+from .fulfillment import FulfillmentError, fulfill
+from .ledger import record_movement
+from .matching import MedicineIndex, best_match, strengths
+from .models import FulfilledMedicine, Medicine, PharmacyFulfillment, PharmacyProfile, StockMovement
+
+STOCK = [
+    # (id, name, generic_name, dosage)
+    (1, 'Paracetamol 500mg', 'Acetaminophen', '500mg'),
+    (2, 'Paracetamol + Caffeine', 'Acetaminophen, Caffeine', '500mg/65mg'),
+    (3, 'Amoxicillin 250mg', '', '250mg'),
+    (4, 'Amoxicillin 500mg', '', '500mg'),
+    (5, 'Augmentin 625', 'Amoxicillin Clavulanate', ''),
+    (6, 'Vitamin B12', 'Cyanocobalamin', '1000mcg'),
+]
+NAMES = {medicine_id: name for medicine_id, name, _, _ in STOCK}
+
+
+def candidates(matches):
+    """match() results in the shape best_match() takes."""
+    return [
+        {'id': medicine_id, 'name': NAMES[medicine_id], 'confidence': confidence, 'extra_words': extra}
+        for medicine_id, confidence, extra in matches
+    ]
+
+
+class MedicineIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = MedicineIndex(STOCK)
+
+    def ranked_ids(self, medicine_name, dosage=''):
+        return [medicine_id for medicine_id, _, _ in self.index.match(medicine_name, dosage)]
+
+    def test_plain_medicine_outranks_combination(self):
+        matches = self.index.match('Paracetamol 650mg')
+        self.assertEqual(matches[0][0], 1)
+        confidence = dict((medicine_id, confidence) for medicine_id, confidence, _ in matches)
+        self.assertLess(confidence.get(2, 0), confidence[1])
+
+    def test_combination_is_never_pre_selected(self):
+        matches = self.index.match('Paracetamol', '500mg')
+        combination = [match for match in matches if match[0] == 2]
+        self.assertEqual(combination[0][2], 1)
+        self.assertIsNone(best_match(candidates(combination)))
+        self.assertEqual(best_match(candidates(matches))['id'], 1)
+
+    def test_combination_is_pre_selected_when_prescribed(self):
+        self.assertEqual(best_match(candidates(self.index.match('Paracetamol Caffeine')))['id'], 2)
+
+    def test_strength_picks_between_stock_items(self):
+        self.assertEqual(self.ranked_ids('Amoxicillin 500mg')[0], 4)
+        self.assertEqual(self.ranked_ids('Amoxicillin', '250 mg')[0], 3)
+
+    def test_spelling_variant_matches_with_less_confidence(self):
+        exact = self.index.match('Amoxicillin 500mg')[0]
+        variant = self.index.match('Amoxycillin 500mg')[0]
+        self.assertEqual(variant[0], 4)
+        self.assertLess(variant[1], exact[1])
+        self.assertIsNotNone(best_match(candidates([variant])))
+
+    def test_generic_name_matches_brand(self):
+        self.assertEqual(best_match(candidates(self.index.match('Cyanocobalamin 1mg')))['id'], 6)
+        self.assertEqual(best_match(candidates(self.index.match('Acetaminophen 500mg')))['id'], 1)
+
+    def test_brand_of_a_combination_is_not_pre_selected_for_one_ingredient(self):
+        matches = self.index.match('Amoxicillin', '625mg')
+        self.assertEqual([match[2] for match in matches if match[0] == 5], [1])
+        self.assertNotEqual((best_match(candidates(matches)) or {}).get('id'), 5)
+
+    def test_unknown_medicine_has_no_candidates(self):
+        self.assertEqual(self.index.match('Metformin 500mg'), [])
+        self.assertIsNone(best_match([]))
+
+
+class StrengthTests(SimpleTestCase):
+    def test_units_are_normalized(self):
+        self.assertEqual(strengths('1g'), strengths('1000 mg'))
+        self.assertEqual(strengths('1000mcg'), {(1.0, 'mg')})
+
+    def test_dosage_counts_are_not_strengths(self):
+        self.assertEqual(strengths('1 tablet', bare_numbers=False), set())
+        self.assertEqual(strengths('Vitamin B12'), set())
+
+
+class ConcurrentFulfillmentTests(TransactionTestCase):
+    THREADS = 16
+    PER_THREAD = 10
+    OPENING_STOCK = 100
+    QUANTITY = 3
+
+    def setUp(self):
+        self.pharmacy = PharmacyProfile.objects.create(user=User.objects.create(username='pharmacist'))
+        patient = PatientProfile.objects.create(user=User.objects.create(username='patient'))
+        doctor = DoctorProfile.objects.create(user=User.objects.create(username='doctor'), specialization='cardiology')
+
+        self.stock = []
+        for name, dosage in [('Amoxicillin', '500mg'), ('Cetirizine', '10mg')]:
+            medicine = Medicine.objects.create(name=name, dosage=dosage, quantity_in_stock=self.OPENING_STOCK)
+            record_movement(medicine.id, 'receipt', self.OPENING_STOCK, recorded_by=self.pharmacy, note='Initial stock')
+            self.stock.append(medicine)
+
+        # [(prescription id, selected lines), ...], every other one listing
+        # its lines in the opposite order so lock ordering is exercised
+        self.jobs = []
+        for index in range(self.THREADS * self.PER_THREAD):
+            prescription = Prescription.objects.create(
+                patient=patient, doctor=doctor, diagnosis='Infection', valid_until=date.today() + timedelta(days=30),
+            )
+            lines = [
+                {
+                    'medicine_id': PrescribedMedicine.objects.create(
+                        prescription=prescription, medicine_name=medicine.name, dosage='1 tablet',
+                        frequency='1x daily', duration='3 days',
+                    ).id,
+                    'stock_id': medicine.id,
+                    'quantity': self.QUANTITY,
+                }
+                for medicine in self.stock
+            ]
+            self.jobs.append((prescription.id, lines if index % 2 else lines[::-1]))
+
+    def fulfill_share(self, index):
+        """Fulfill this thread's share of the prescriptions; returns how many went through."""
+        fulfilled = 0
+        for prescription_id, lines in self.jobs[index::self.THREADS]:
+            prescription = Prescription.objects.prefetch_related('medicines').get(id=prescription_id)
+            try:
+                fulfill(prescription, self.pharmacy, lines)
+            except FulfillmentError:
+                continue
+            fulfilled += 1
+        return fulfilled
+
+    def test_concurrent_fulfillments_never_oversell_and_match_the_ledger(self):
+        results = run_concurrently(self.fulfill_share, self.THREADS)
+        errors = [result for result in results if isinstance(result, Exception)]
+        self.assertEqual(errors, [])
+
+        fulfilled = sum(results)
+        # Stock runs out long before the prescriptions do
+        self.assertEqual(fulfilled, self.OPENING_STOCK // self.QUANTITY)
+        self.assertEqual(PharmacyFulfillment.objects.filter(status='fulfilled').count(), fulfilled)
+        self.assertEqual(FulfilledMedicine.objects.count(), len(self.stock) * fulfilled)
+
+        for medicine in self.stock:
+            medicine.refresh_from_db()
+            self.assertGreaterEqual(medicine.quantity_in_stock, 0)
+            self.assertEqual(medicine.quantity_in_stock, self.OPENING_STOCK - self.QUANTITY * fulfilled)
+
+            movements = StockMovement.objects.filter(medicine=medicine)
+            self.assertEqual(movements.aggregate(total=Sum('quantity'))['total'], medicine.quantity_in_stock)
+            self.assertEqual(
+                movements.filter(kind='dispense').aggregate(total=Sum('quantity'))['total'],
+                medicine.quantity_in_stock - self.OPENING_STOCK,
+            )
+
+
+class UpdateMedicineStockTests(TestCase):
+    def setUp(self):
+        self.pharmacy = PharmacyProfile.objects.create(user=User.objects.create(username='pharmacist'))
+        self.client.force_login(self.pharmacy.user)
+        self.medicine = Medicine.objects.create(name='Amoxicillin', dosage='500mg', quantity_in_stock=100)
+        record_movement(self.medicine.id, 'receipt', 100, recorded_by=self.pharmacy, note='Initial stock')
+
+    def update(self, **data):
+        return self.client.post(
+            f'/pharmacy/stock/{self.medicine.id}/update/', data, content_type='application/json'
+        )
+
+    def test_stock_count_from_the_loaded_quantity_is_saved_and_recorded(self):
+        response = self.update(quantity=120, expected_quantity=100)
+        self.assertEqual(response.status_code, 200)
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.quantity_in_stock, 120)
+        self.assertEqual(StockMovement.objects.filter(medicine=self.medicine).aggregate(total=Sum('quantity'))['total'], 120)
+
+    def test_stale_stock_count_is_refused(self):
+        # A dispense after the form was loaded
+        Medicine.objects.filter(id=self.medicine.id).update(quantity_in_stock=97)
+        record_movement(self.medicine.id, 'dispense', -3)
+
+        response = self.update(quantity=100, price=12, expected_quantity=100)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['quantity'], 97)
+        self.medicine.refresh_from_db()
+        self.assertEqual(self.medicine.quantity_in_stock, 97)
+        self.assertEqual(self.medicine.unit_price, 0)
+
+    def test_stock_change_needs_the_loaded_quantity(self):
+        self.assertEqual(self.update(quantity=120).status_code, 400)
+        self.assertEqual(self.update(quantity=100, price=12).status_code, 200)
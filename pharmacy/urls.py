@@ -6,6 +6,7 @@ urlpatterns = [
     path('logout/', views.pharmacy_logout, name='pharmacy_logout'),
 
     path('overview/', views.get_pharmacy_overview, name='get_pharmacy_overview'),
+    path('events/', views.pharmacy_events, name='pharmacy_events'),
 
     path('profile/data/', views.get_pharmacy_profile_data, name='get_pharmacy_profile_data'), 
     path('profile/update/', views.update_pharmacy_profile_data, name='update_pharmacy_profile_data'),
@@ -16,6 +17,7 @@ urlpatterns = [
 
     path('stock/', views.get_medicine_stock, name='get_medicine_stock'),
     path('stock/<int:medicine_id>/', views.get_medicine_details, name='get_medicine_details'),
+    path('stock/<int:medicine_id>/history/', views.get_medicine_stock_history, name='get_medicine_stock_history'),
     path('stock/create/', views.create_medicine, name='create_medicine'),
     path('stock/<int:medicine_id>/update/', views.update_medicine, name='update_medicine'),
     path('stock/<int:medicine_id>/delete/', views.delete_medicine, name='delete_medicine'),
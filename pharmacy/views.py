@@ -4,9 +4,16 @@ from django.contrib.auth import logout
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_protect
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Q, F
+from mediconnect.stats import count_buckets
+from mediconnect.images import image_url
+from notifications.events import event_stream_response
 from datetime import timedelta
-from .models import PharmacyProfile, Medicine, MedicineSchedule, PharmacyFulfillment, FulfilledMedicine
+from .fulfillment import FulfillmentError, fulfill
+from .ledger import day_start, dispensed_between, record_movement, stock_at
+from .matching import best_match, match_prescribed_medicines
+from .models import PharmacyProfile, Medicine, MedicineSchedule, PharmacyFulfillment
 from doctors.models import Prescription
 import json
 
@@ -48,7 +55,7 @@ def get_pharmacy_sidebar_data(request):
     # Get photo URL
     photo_url = None
     if profile.profile_photo:
-        photo_url = request.build_absolute_uri(profile.profile_photo.url)
+        photo_url = image_url(request, profile, 'profile_photo', 'thumb')
 
     # Get full name
     full_name = request.user.get_full_name() or request.user.username
@@ -338,6 +345,15 @@ def get_pharmacy_overview(request):
 # PROFILE - GET
 # ═══════════════════════════════════════════════════════════════
 
+
+@login_required
+async def pharmacy_events(request):
+    """Server-Sent Events stream telling the dashboard what to refetch"""
+    user = await request.auser()
+    if not await PharmacyProfile.objects.filter(user=user).aexists():
+        return JsonResponse({"error": "Pharmacy profile not found"}, status=404)
+    return event_stream_response(request, user, roles=['pharmacy'])
+
 @login_required
 def get_pharmacy_profile_data(request):
     """Get pharmacy profile information"""
@@ -640,8 +656,10 @@ def get_prescription_details(request, prescription_id):
     doctor_name = f"Dr. {prescription.doctor.user.get_full_name() or prescription.doctor.user.username}"
     
     # Medicines with stock availability
+    prescribed_medicines = list(prescription.medicines.all())
+    stock_matches = match_prescribed_medicines(prescribed_medicines)
     medicines_list = []
-    for med in prescription.medicines.all():
+    for med in prescribed_medicines:
         # ✅ Parse frequency from text (e.g., "2x daily", "3 times daily")
         frequency_text = med.frequency or '1x daily'
         
@@ -673,15 +691,13 @@ def get_prescription_details(request, prescription_id):
         # Calculate total needed
         total_needed = frequency_count * duration_days
         
-        # Search in pharmacy stock
-        stock_medicine = Medicine.objects.filter(
-            name__icontains=med.medicine_name,
-            is_active=True
-        ).first()
+        # Best stock match, if confident enough
+        candidates = stock_matches[med.id]
+        stock_medicine = best_match(candidates)
         
         if stock_medicine:
-            available = stock_medicine.quantity_in_stock
-            stock_id = stock_medicine.id
+            available = stock_medicine['available']
+            stock_id = stock_medicine['id']
             
             if available >= total_needed:
                 stock_status = 'available'
@@ -707,6 +723,7 @@ def get_prescription_details(request, prescription_id):
             'stock_available': available,
             'stock_id': stock_id,
             'stock_status': stock_status,
+            'stock_candidates': candidates,
         })
     
     return JsonResponse({
@@ -745,6 +762,18 @@ def fulfill_prescription(request, prescription_id):
         selected_medicines = data.get('selected_medicines', [])
         notes = data.get('notes', '')
         
+        if action == 'fulfill':
+            try:
+                fulfillment = fulfill(prescription, profile, selected_medicines, notes)
+            except FulfillmentError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            
+            return JsonResponse({
+                'success': True,
+                'message': f'Prescription {fulfillment.status} successfully',
+                'status': fulfillment.status
+            })
+        
         # ✅ Get or create PharmacyFulfillment
         fulfillment, created = PharmacyFulfillment.objects.get_or_create(
             prescription=prescription,
@@ -754,60 +783,7 @@ def fulfill_prescription(request, prescription_id):
             }
         )
         
-        if action == 'fulfill':
-            fulfilled_count = 0
-            
-            for med_data in selected_medicines:
-                med_id = med_data.get('medicine_id')
-                quantity_to_dispense = med_data.get('quantity')
-                stock_id = med_data.get('stock_id')
-                
-                try:
-                    prescribed_med = prescription.medicines.get(id=med_id)
-                except:
-                    continue
-                
-                if stock_id:
-                    try:
-                        stock_medicine = Medicine.objects.get(id=stock_id)
-                        if stock_medicine.quantity_in_stock >= quantity_to_dispense:
-                            stock_medicine.quantity_in_stock -= quantity_to_dispense
-                            stock_medicine.save()
-                            
-                            # ✅ Record fulfilled medicine
-                            FulfilledMedicine.objects.create(
-                                fulfillment=fulfillment,
-                                prescribed_medicine=prescribed_med,
-                                stock_medicine=stock_medicine,
-                                quantity_dispensed=quantity_to_dispense,
-                                quantity_requested=med_data.get('total_needed', quantity_to_dispense)
-                            )
-                            
-                            fulfilled_count += 1
-                    except Medicine.DoesNotExist:
-                        continue
-            
-            # Update fulfillment status
-            total_medicines = prescription.medicines.count()
-            if fulfilled_count == total_medicines:
-                fulfillment.status = 'fulfilled'
-            elif fulfilled_count > 0:
-                fulfillment.status = 'partial'
-            else:
-                return JsonResponse({'error': 'No medicines could be fulfilled'}, status=400)
-            
-            fulfillment.pharmacy_profile = profile
-            fulfillment.fulfilled_at = timezone.now()
-            fulfillment.notes = notes
-            fulfillment.save()
-            
-            return JsonResponse({
-                'success': True,
-                'message': f'Prescription {fulfillment.status} successfully',
-                'status': fulfillment.status
-            })
-        
-        elif action == 'hold':
+        if action == 'hold':
             fulfillment.status = 'on_hold'
             fulfillment.notes = notes
             fulfillment.save()
@@ -939,34 +915,19 @@ def get_medicine_stock(request):
         })
     
     # ✅ Calculate stats (including expired)
-    total_medicines = Medicine.objects.filter(is_active=True).count()
-    in_stock_count = Medicine.objects.filter(
-        is_active=True,
-        quantity_in_stock__gt=F('reorder_level')
-    ).exclude(expiry_date__lt=today).count()
-    low_stock_count = Medicine.objects.filter(
-        is_active=True,
-        quantity_in_stock__lte=F('reorder_level'),
-        quantity_in_stock__gt=0
-    ).exclude(expiry_date__lt=today).count()
-    out_of_stock_count = Medicine.objects.filter(
-        is_active=True,
-        quantity_in_stock=0
-    ).count()
-    expired_count = Medicine.objects.filter(
-        is_active=True,
-        expiry_date__lt=today
-    ).count()
+    not_expired = Q(expiry_date__isnull=True) | Q(expiry_date__gte=today)
+    stats = count_buckets(
+        Medicine.objects.filter(is_active=True),
+        total=Q(),
+        in_stock=Q(quantity_in_stock__gt=F('reorder_level')) & not_expired,
+        low_stock=Q(quantity_in_stock__lte=F('reorder_level'), quantity_in_stock__gt=0) & not_expired,
+        out_of_stock=Q(quantity_in_stock=0),
+        expired=Q(expiry_date__lt=today),  # ✅ NEW
+    )
     
     return JsonResponse({
         'medicines': medicines_list,
-        'stats': {
-            'total': total_medicines,
-            'in_stock': in_stock_count,
-            'low_stock': low_stock_count,
-            'out_of_stock': out_of_stock_count,
-            'expired': expired_count  # ✅ NEW
-        },
+        'stats': stats,
         'pagination': {
             'page': page,
             'total_pages': total_pages,
@@ -1026,6 +987,65 @@ def get_medicine_details(request, medicine_id):
     })
 
 
+# ═══════════════════════════════════════════════════════════════
+# MEDICINE STOCK - HISTORY
+# ═══════════════════════════════════════════════════════════════
+
+@login_required
+def get_medicine_stock_history(request, medicine_id):
+    """Stock at the start and end of a period, units dispensed and the movements in it"""
+    profile, error = get_pharmacy_profile(request)
+    if error:
+        return error
+    
+    try:
+        medicine = Medicine.objects.get(id=medicine_id, is_active=True)
+    except Medicine.DoesNotExist:
+        return JsonResponse({'error': 'Medicine not found'}, status=404)
+    
+    # Period of whole days, default the last 30
+    today = timezone.localdate()
+    try:
+        end_date = timezone.datetime.strptime(request.GET['to'], '%Y-%m-%d').date() if request.GET.get('to') else today
+        start_date = (
+            timezone.datetime.strptime(request.GET['from'], '%Y-%m-%d').date() if request.GET.get('from')
+            else end_date - timedelta(days=29)
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date format'}, status=400)
+    if start_date > end_date:
+        return JsonResponse({'error': 'Start date is after end date'}, status=400)
+    
+    start = day_start(start_date)
+    end = min(day_start(end_date + timedelta(days=1)), timezone.now())
+    
+    movements = medicine.stock_movements.filter(
+        created_at__gte=start, created_at__lt=end
+    ).select_related('recorded_by__user')[:100]
+    
+    return JsonResponse({
+        'id': medicine.id,
+        'name': medicine.name,
+        'from': start_date.isoformat(),
+        'to': end_date.isoformat(),
+        'opening_stock': stock_at(medicine.id, start),
+        'closing_stock': stock_at(medicine.id, end),
+        'dispensed': dispensed_between(medicine.id, start, end),
+        'movements': [
+            {
+                'id': m.id,
+                'type': m.kind,
+                'type_display': m.get_kind_display(),
+                'quantity': m.quantity,
+                'note': m.note,
+                'recorded_by': m.recorded_by.user.get_full_name() if m.recorded_by else '',
+                'date': timezone.localtime(m.created_at).strftime('%b %d, %Y %I:%M %p'),
+            }
+            for m in movements
+        ],
+    })
+
+
 # ═══════════════════════════════════════════════════════════════
 # MEDICINE STOCK - CREATE
 # ═══════════════════════════════════════════════════════════════
@@ -1055,22 +1075,25 @@ def create_medicine(request):
                 return JsonResponse({'error': 'Invalid expiry date format'}, status=400)
         
         # Create medicine
-        medicine = Medicine.objects.create(
-            name=data['name'],
-            dosage=data.get('dosage', ''),
-            generic_name=data.get('generic_name', ''),
-            manufacturer=data.get('manufacturer', ''),
-            category=data.get('category', 'other'),
-            unit_type=data.get('unit_type', 'tablet'),
-            quantity_in_stock=int(data['quantity']),
-            reorder_level=int(data.get('reorder_level', 50)),
-            unit_price=float(data['price']),
-            description=data.get('description', ''),
-            side_effects=data.get('side_effects', ''),
-            storage_instructions=data.get('storage_instructions', ''),
-            expiry_date=expiry_date,
-            is_active=True
-        )
+        with transaction.atomic():
+            medicine = Medicine.objects.create(
+                name=data['name'],
+                dosage=data.get('dosage', ''),
+                generic_name=data.get('generic_name', ''),
+                manufacturer=data.get('manufacturer', ''),
+                category=data.get('category', 'other'),
+                unit_type=data.get('unit_type', 'tablet'),
+                quantity_in_stock=int(data['quantity']),
+                reorder_level=int(data.get('reorder_level', 50)),
+                unit_price=float(data['price']),
+                description=data.get('description', ''),
+                side_effects=data.get('side_effects', ''),
+                storage_instructions=data.get('storage_instructions', ''),
+                expiry_date=expiry_date,
+                is_active=True
+            )
+            if medicine.quantity_in_stock:
+                record_movement(medicine.id, 'receipt', medicine.quantity_in_stock, recorded_by=profile, note='Initial stock')
         
         return JsonResponse({
             'success': True,
@@ -1095,48 +1118,68 @@ def update_medicine(request, medicine_id):
     if error:
         return error
     
-    try:
-        medicine = Medicine.objects.get(id=medicine_id, is_active=True)
-    except Medicine.DoesNotExist:
+    if not Medicine.objects.filter(id=medicine_id, is_active=True).exists():
         return JsonResponse({'error': 'Medicine not found'}, status=404)
     
     try:
         data = json.loads(request.body)
         
-        # Update fields
-        if data.get('name'):
-            medicine.name = data['name']
-        if data.get('dosage') is not None: 
-            medicine.dosage = data['dosage']
-        if data.get('generic_name') is not None:
-            medicine.generic_name = data['generic_name']
-        if data.get('manufacturer') is not None:
-            medicine.manufacturer = data['manufacturer']
-        if data.get('category'):
-            medicine.category = data['category']
-        if data.get('unit_type'):
-            medicine.unit_type = data['unit_type']
-        if data.get('quantity') is not None:
-            medicine.quantity_in_stock = int(data['quantity'])
-        if data.get('reorder_level') is not None:
-            medicine.reorder_level = int(data['reorder_level'])
-        if data.get('price') is not None:
-            medicine.unit_price = float(data['price'])
-        if data.get('description') is not None:
-            medicine.description = data['description']
-        if data.get('side_effects') is not None:
-            medicine.side_effects = data['side_effects']
-        if data.get('storage_instructions') is not None:
-            medicine.storage_instructions = data['storage_instructions']
+        with transaction.atomic():
+            # Locked so a fulfillment cannot decrement stock between the read and the save
+            medicine = Medicine.objects.select_for_update().get(id=medicine_id)
+            previous_quantity = medicine.quantity_in_stock
+            
+            # Update fields
+            if data.get('name'):
+                medicine.name = data['name']
+            if data.get('dosage') is not None: 
+                medicine.dosage = data['dosage']
+            if data.get('generic_name') is not None:
+                medicine.generic_name = data['generic_name']
+            if data.get('manufacturer') is not None:
+                medicine.manufacturer = data['manufacturer']
+            if data.get('category'):
+                medicine.category = data['category']
+            if data.get('unit_type'):
+                medicine.unit_type = data['unit_type']
+            if data.get('quantity') is not None:
+                quantity = int(data['quantity'])
+                if quantity != previous_quantity:
+                    # The quantity the form was filled from: dispenses since
+                    # then must not be overwritten by a stale count
+                    if data.get('expected_quantity') is None:
+                        return JsonResponse({'error': 'expected_quantity is required to change the stock'}, status=400)
+                    if int(data['expected_quantity']) != previous_quantity:
+                        return JsonResponse({
+                            'error': f'Stock of "{medicine.name}" has changed to {previous_quantity} since it was loaded. Reload and try again.',
+                            'quantity': previous_quantity,
+                        }, status=409)
+                medicine.quantity_in_stock = quantity
+            if data.get('reorder_level') is not None:
+                medicine.reorder_level = int(data['reorder_level'])
+            if data.get('price') is not None:
+                medicine.unit_price = float(data['price'])
+            if data.get('description') is not None:
+                medicine.description = data['description']
+            if data.get('side_effects') is not None:
+                medicine.side_effects = data['side_effects']
+            if data.get('storage_instructions') is not None:
+                medicine.storage_instructions = data['storage_instructions']
         
-        # Update expiry date
-        if data.get('expiryDate'):
-            try:
-                medicine.expiry_date = timezone.datetime.strptime(data['expiryDate'], '%Y-%m-%d').date()
-            except:
-                pass
+            # Update expiry date
+            if data.get('expiryDate'):
+                try:
+                    medicine.expiry_date = timezone.datetime.strptime(data['expiryDate'], '%Y-%m-%d').date()
+                except:
+                    pass
         
-        medicine.save()
+            medicine.save()
+            
+            change = medicine.quantity_in_stock - previous_quantity
+            if change:
+                # Restocking is done by raising the quantity here
+                kind = 'receipt' if change > 0 else 'adjust'
+                record_movement(medicine.id, kind, change, recorded_by=profile)
         
         return JsonResponse({
             'success': True,
@@ -1,3 +0,0 @@
-@echo off
-cd /d E:\MediConnect
-C:\Users\Dell\.virtualenvs\MediConnect-likiOFFF\Scripts\python.exe manage.py send_reschedule_reminders
\ No newline at end of file
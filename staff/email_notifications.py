@@ -1,4 +1,4 @@
-from django.core.mail import send_mail
+from notifications.outbox import queue_email
 from django.template.loader import render_to_string
 from django.conf import settings
 from django.utils.html import strip_tags
@@ -6,7 +6,8 @@ from django.utils.html import strip_tags
 
 def send_lab_report_email(report):
     """
-    Send email notification to patient when lab report is marked as complete.
+    Queue email notification to patient when lab report is marked as complete.
+    The outbox worker (send_queued_emails) delivers it.
     Email template and color scheme based on overall_status:
     - normal → Green card (reassuring)
     - abnormal → Orange card (review needed)
@@ -90,17 +91,16 @@ def send_lab_report_email(report):
     plain_message = strip_tags(html_message)
     
     try:
-        send_mail(
+        queue_email(
             subject=subject,
             message=plain_message,
             from_email=settings.DEFAULT_FROM_EMAIL,
             recipient_list=[patient_email],
             html_message=html_message,
-            fail_silently=False,
         )
-        print(f"✅ Lab report email sent to {patient_email} ({status})")
+        print(f"✅ Lab report email queued for {patient_email} ({status})")
         return True
         
     except Exception as e:
-        print(f"❌ Failed to send lab report email: {e}")
+        print(f"❌ Failed to queue lab report email: {e}")
         return False
\ No newline at end of file
@@ -0,0 +1,23 @@
+# Generated by Django 6.0 on 2026-10-18 04:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0017_access_pattern_indexes'),
+        ('patients', '0008_patientprofile_city_patientprofile_created_at_and_more'),
+        ('staff', '0009_staffprofile_certification_staffprofile_role_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='labreport',
+            index=models.Index(fields=['patient', 'test_date'], name='labreport_patient_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='labreport',
+            index=models.Index(fields=['uploaded_by', 'test_date'], name='labreport_uploader_date_idx'),
+        ),
+    ]
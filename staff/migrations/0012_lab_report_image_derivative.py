@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-18 06:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('staff', '0011_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labreport',
+            name='report_image_pdf',
+            field=models.ImageField(blank=True, editable=False, null=True, upload_to=''),
+        ),
+    ]
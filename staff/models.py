@@ -1,11 +1,15 @@
-from django.db import models, transaction, IntegrityError
+from django.db import models
 from django.contrib.auth.models import User
-from django.utils import timezone
-import random
-import string
+from accounts.identifiers import claim_identifier
+from mediconnect.images import ImageDerivativesMixin
+from doctors.sequences import next_number
 
 
-class StaffProfile(models.Model):
+class StaffProfile(ImageDerivativesMixin, models.Model):
+    IMAGE_DERIVATIVES = {
+        'profile_photo': {'thumb': 'profile_photo_thumb', 'medium': 'profile_photo_medium'},
+    }
+
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='staffprofile')
     staff_id = models.CharField(max_length=20, unique=True, editable=False, null=True, blank=True)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
@@ -16,53 +20,42 @@ class StaffProfile(models.Model):
     certification = models.CharField(max_length=200, blank=True, null=True)
     years_of_experience = models.IntegerField(blank=True, null=True, default=0)
     profile_photo = models.ImageField(upload_to='staff_photos/', blank=True, null=True)
+    # Resized copies written by mediconnect.images
+    profile_photo_thumb = models.ImageField(blank=True, null=True, editable=False)
+    profile_photo_medium = models.ImageField(blank=True, null=True, editable=False)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def generate_random_code(self, length=6):
-        """Generate random alphanumeric code (uppercase letters + digits)"""
-        chars = ''.join([c for c in (string.ascii_uppercase + string.digits) 
-                        if c not in 'O0I1'])
-        return ''.join(random.choice(chars) for _ in range(length))
-
     def save(self, *args, **kwargs):
-        if self.staff_id:
-            return super().save(*args, **kwargs)
-
-        year = timezone.now().year
-        
-        for attempt in range(10):
-            try:
-                with transaction.atomic():
-                    random_code = self.generate_random_code(6)
-                    self.staff_id = f"STF-{year}-{random_code}"
-                    
-                    if StaffProfile.objects.filter(staff_id=self.staff_id).exists():
-                        continue
-                    
-                    super().save(*args, **kwargs)
-                    return
-
-            except IntegrityError:
-                continue
-
-        raise IntegrityError("Failed to generate unique staff_id after 10 attempts")
+        if not self.staff_id:
+            self.staff_id = claim_identifier('STF')
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.staff_id} - {self.user.get_full_name()}"
 
 
-class LabReportAttachment(models.Model):
+class LabReportAttachment(ImageDerivativesMixin, models.Model):
     """Store multiple files and images for a lab report"""
     ATTACHMENT_TYPES = (
         ('document', 'Document'),
         ('image', 'Image'),
     )
+
+    IMAGE_DERIVATIVES = {
+        'file': {'thumb': 'thumbnail', 'medium': 'medium_image', 'pdf': 'pdf_image'},
+    }
     
     report = models.ForeignKey('LabReport', on_delete=models.CASCADE, related_name='attachments')
     file = models.FileField(upload_to='lab_report_files/', blank=True, null=True)
     attachment_type = models.CharField(max_length=10, choices=ATTACHMENT_TYPES)
+
+    # Resized copies of image attachments, written by mediconnect.images
+    thumbnail = models.ImageField(blank=True, null=True, editable=False)
+    medium_image = models.ImageField(blank=True, null=True, editable=False)
+    pdf_image = models.ImageField(blank=True, null=True, editable=False)
+
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -71,6 +64,12 @@ class LabReportAttachment(models.Model):
     
     def __str__(self):
         return f"{self.get_attachment_type_display()} for {self.report.report_number}"
+
+    def image_derivative_sources(self):
+        # Documents (PDFs) have no derivatives
+        if self.attachment_type != 'image':
+            return {}
+        return self.IMAGE_DERIVATIVES
     
     def delete(self, *args, **kwargs):
         # Delete file from disk when model is deleted
@@ -78,10 +77,17 @@ class LabReportAttachment(models.Model):
             import os
             if os.path.isfile(self.file.path):
                 os.remove(self.file.path)
+        for derived in (self.thumbnail, self.medium_image, self.pdf_image):
+            if derived:
+                derived.delete(save=False)
         super().delete(*args, **kwargs)
 
 
-class LabReport(models.Model):
+class LabReport(ImageDerivativesMixin, models.Model):
+    IMAGE_DERIVATIVES = {
+        'report_image': {'pdf': 'report_image_pdf'},
+    }
+
     STATUS_CHOICES = [
         ('normal', 'Normal'),
         ('abnormal', 'Abnormal'),
@@ -101,15 +107,23 @@ class LabReport(models.Model):
     notes = models.TextField(blank=True, null=True)
     report_file = models.FileField(upload_to='lab_reports/', blank=True, null=True)
     report_image = models.ImageField(upload_to='lab_report_images/', blank=True, null=True)
+    # Downsized copy embedded in the report PDF, written by mediconnect.images
+    report_image_pdf = models.ImageField(blank=True, null=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Patient's reports, newest test first
+            models.Index(fields=['patient', 'test_date'], name='labreport_patient_date_idx'),
+            # Staff member's uploads for a day
+            models.Index(fields=['uploaded_by', 'test_date'], name='labreport_uploader_date_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.report_number:
-            year = timezone.now().year
-            count = LabReport.objects.count() + 1
-            self.report_number = f"LAB-{year}-{count:04d}"
+            self.report_number = next_number('LAB', width=4)
         super().save(*args, **kwargs)
 
     def calculate_overall_status(self):
@@ -1,3 +1,61 @@
+import json
+from datetime import date, time, timedelta
+
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from doctors.models import Appointment, DoctorProfile
+from notifications.models import Notification
+from patients.models import PatientProfile
+
+from .models import LabReport, StaffProfile
+
+SECTIONS = [{
+    'test_name_choice': 'Other', 'custom_test_name': 'Lipid profile', 'category': 'biochemistry',
+    'status': 'normal', 'parameters': [{'name': 'LDL', 'value': '90', 'unit': 'mg/dL'}],
+}]
+
+
+class LabReportNotificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = StaffProfile.objects.create(user=User.objects.create(username='staff'))
+        cls.patient = PatientProfile.objects.create(user=User.objects.create(username='pat', email='pat@example.com'))
+        cls.doctor = DoctorProfile.objects.create(user=User.objects.create(username='doc'), specialization='cardiology')
+        # A doctor the patient has seen hears about their reports too
+        Appointment.objects.create(
+            patient=cls.patient, doctor=cls.doctor, appointment_date=date.today() - timedelta(days=3),
+            appointment_time=time(9, 0), appointment_type='consultation', reason='Checkup', status='completed',
+        )
+
+    def setUp(self):
+        self.client.force_login(self.staff.user)
+
+    def post(self, url, is_completed):
+        return self.client.post(url, json.dumps({
+            'patient_id': self.patient.id, 'test_date': date.today().isoformat(),
+            'is_completed': is_completed, 'test_sections': SECTIONS,
+        }), content_type='application/json')
+
+    def notified_users(self):
+        return set(Notification.objects.filter(kind='lab_report').values_list('user__username', flat=True))
+
+    def test_pending_upload_notifies_nobody(self):
+        self.assertEqual(self.post('/staff/lab-reports/upload/', False).status_code, 200)
+        self.assertEqual(self.notified_users(), set())
+
+    def test_completed_upload_notifies_patient_and_doctors(self):
+        self.assertEqual(self.post('/staff/lab-reports/upload/', True).status_code, 200)
+        self.assertEqual(self.notified_users(), {'pat', 'doc'})
+
+    def test_completing_a_pending_report_notifies_once(self):
+        report_id = self.post('/staff/lab-reports/upload/', False).json()['report_id']
+        edit_url = f'/staff/lab-reports/{report_id}/edit/'
+
+        self.assertEqual(self.post(edit_url, False).status_code, 200)
+        self.assertEqual(self.notified_users(), set())
+
+        self.assertEqual(self.post(edit_url, True).status_code, 200)
+        self.assertTrue(LabReport.objects.get(id=report_id).is_completed)
+        self.assertEqual(Notification.objects.filter(kind='lab_report').count(), 2)
+        self.assertEqual(self.notified_users(), {'pat', 'doc'})
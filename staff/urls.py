@@ -6,6 +6,7 @@ urlpatterns = [
     path('logout/', views.staff_logout,name='staff_logout'),
 
     path('overview/',views.get_staff_overview,name='staff_overview'),
+    path('events/',views.staff_events,name='staff_events'),
     path('patients/',views.get_patients_for_staff,name='staff_patients'),
 
     path('attachments/<int:attachment_id>/delete/', views.delete_attachment, name='delete_attachment'),
@@ -4,12 +4,17 @@ from django.contrib.auth import logout
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_protect
 from django.utils import timezone
+from django.db.models import Q
+from mediconnect.images import image_url
 from .models import StaffProfile, LabReport, TestSection, LabReportParameter, LabReportAttachment
 from patients.models import PatientProfile
 from doctors.models import DoctorProfile
 import json as _json
 from datetime import datetime
 from .email_notifications import send_lab_report_email
+from notifications.feed import notify_lab_report
+from notifications.events import event_stream_response
+from mediconnect.stats import count_buckets
 
 
 # ─────────────────────────────────────────────
@@ -43,7 +48,7 @@ def get_staff_sidebar_data(request):
 
     photo_url = None
     if profile.profile_photo:
-        photo_url = request.build_absolute_uri(profile.profile_photo.url)
+        photo_url = image_url(request, profile, 'profile_photo', 'thumb')
 
     return JsonResponse({
         "name":      request.user.get_full_name() or request.user.username,
@@ -81,10 +86,17 @@ def get_staff_overview(request):
     week_ago = today - timezone.timedelta(days=7)
 
     # Stats — scoped to this staff member's uploads
-    total_reports    = LabReport.objects.filter(uploaded_by=profile).count()
-    today_reports    = LabReport.objects.filter(uploaded_by=profile, created_at__date=today).count()
-    week_reports     = LabReport.objects.filter(uploaded_by=profile, created_at__date__gte=week_ago).count()
-    critical_reports = LabReport.objects.filter(uploaded_by=profile, overall_status='critical').count()
+    counts = count_buckets(
+        LabReport.objects.filter(uploaded_by=profile),
+        total=Q(),
+        today=Q(created_at__date=today),
+        week=Q(created_at__date__gte=week_ago),
+        critical=Q(overall_status='critical'),
+    )
+    total_reports    = counts['total']
+    today_reports    = counts['today']
+    week_reports     = counts['week']
+    critical_reports = counts['critical']
 
     # Last 10 reports — newest first (so when a new one is uploaded it pushes oldest out)
     recent_reports = LabReport.objects.filter(
@@ -98,7 +110,7 @@ def get_staff_overview(request):
         # Patient photo
         patient_photo = None
         if r.patient.profile_photo:
-            patient_photo = request.build_absolute_uri(r.patient.profile_photo.url)
+            patient_photo = image_url(request, r.patient, 'profile_photo', 'thumb')
 
         # Patient initials fallback
         patient_name = r.patient.user.get_full_name() or r.patient.user.username
@@ -214,7 +226,7 @@ def get_doctors_for_patient(request, patient_id):
 
         photo_url = None
         if doc.profile_photo:
-            photo_url = request.build_absolute_uri(doc.profile_photo.url)
+            photo_url = image_url(request, doc, 'profile_photo', 'thumb')
 
         doctors_list.append({
             "id":         doc.id,
@@ -361,8 +373,9 @@ def upload_lab_report(request):
         # Calculate and update overall status
         report.update_overall_status()
 
-        #Send email if report is completed
+        # Notify and email only once the report is completed
         if report.is_completed:
+            notify_lab_report(report)
             send_lab_report_email(report)
 
         return JsonResponse({
@@ -409,7 +422,6 @@ def get_staff_lab_reports(request):
 
     # Search
     if search:
-        from django.db.models import Q
         reports = reports.filter(
             Q(patient__user__first_name__icontains=search) |
             Q(patient__user__last_name__icontains=search)  |
@@ -432,14 +444,15 @@ def get_staff_lab_reports(request):
 
     # Stats
     all_mine = LabReport.objects.filter(uploaded_by=profile, test_date=filter_date)
-    stats = {
-        'total':     all_mine.count(),
-        'normal':    all_mine.filter(overall_status='normal').count(),
-        'abnormal':  all_mine.filter(overall_status='abnormal').count(),
-        'critical':  all_mine.filter(overall_status='critical').count(),
-        'completed': all_mine.filter(is_completed=True).count(),
-        'pending':   all_mine.filter(is_completed=False).count(),
-    }
+    stats = count_buckets(
+        all_mine,
+        total=Q(),
+        normal=Q(overall_status='normal'),
+        abnormal=Q(overall_status='abnormal'),
+        critical=Q(overall_status='critical'),
+        completed=Q(is_completed=True),
+        pending=Q(is_completed=False),
+    )
 
     total_count = reports.count()
     total_pages = max(1, (total_count + per_page - 1) // per_page)
@@ -454,7 +467,7 @@ def get_staff_lab_reports(request):
 
         patient_photo = None
         if r.patient.profile_photo:
-            patient_photo = request.build_absolute_uri(r.patient.profile_photo.url)
+            patient_photo = image_url(request, r.patient, 'profile_photo', 'thumb')
 
         doctor_name    = None
         doctor_specialty = None
@@ -691,8 +704,10 @@ def edit_lab_report(request, report_id):
         # Calculate and update overall status
         report.update_overall_status()
 
+        # Notify and email when the report becomes completed
         # (Don't send duplicate if already was completed)
         if report.is_completed and not was_completed:
+            notify_lab_report(report)
             send_lab_report_email(report)
 
         return JsonResponse({
@@ -738,28 +753,31 @@ def delete_attachment(request, attachment_id):
         return JsonResponse({"error": str(e)}, status=500)
 
 
+@login_required
+async def staff_events(request):
+    """Server-Sent Events stream telling the dashboard what to refetch"""
+    user = await request.auser()
+    if not await StaffProfile.objects.filter(user=user).aexists():
+        return JsonResponse({"error": "Staff profile not found"}, status=404)
+    return event_stream_response(request, user, roles=['staff'])
+
+
 @login_required
 def search_patients(request):
-    """Search patients by name (min 2 characters)"""
+    """Search patients by name, patient ID or phone (min 2 characters)"""
     _, error = get_staff_profile(request)
     if error:
         return error
 
-    from patients.models import PatientProfile
-    from django.db.models import Q
+    from patients.search import search_patients as search_patient_index
 
     query = request.GET.get('q', '').strip()
     
     if len(query) < 2:
         return JsonResponse({"patients": []})
 
-    # Search by first name, last name, or patient_id
-    patients = PatientProfile.objects.filter(
-        Q(user__first_name__icontains=query) |
-        Q(user__last_name__icontains=query) |
-        Q(patient_id__icontains=query),
-        is_active=True
-    ).select_related('user').order_by('user__first_name', 'user__last_name')[:10]
+    # Name words, patient ID or phone, best match first
+    patients = search_patient_index(query, limit=10)
 
     return JsonResponse({
         "patients": [{